@@ -0,0 +1,120 @@
+"""
+Presupuesto de tiempo de importación del arranque (pantalla de login).
+
+Ejecuta cada escenario en un proceso nuevo con `python -X importtime` y falla (código 1) si
+se importa algún módulo que el escenario no necesita o si el tiempo de importación supera su
+presupuesto. Solo cuenta lo que importa el escenario: los módulos del arranque del intérprete
+(site, encodings...), medidos con `python -c pass`, se descuentan, así que el resultado no
+depende del entorno de Python de la máquina. El escenario `login_page` ejecuta la app en modo
+"bare" (sin servidor de Streamlit), que renderiza la pantalla de login igual que el primer
+acceso de un usuario.
+
+Uso:
+    python benchmarks/import_time.py [--runs 5] [--top 15] [--budget-scale 1.0] [--json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+
+# Módulos pesados que solo necesitan las páginas de portfolio y mercados
+HEAVY_MODULES = ('yfinance', 'pandas', 'numpy', 'requests', 'bs4', 'lxml', 'pyarrow')
+
+SCENARIOS = {
+    'login_page': {
+        'args': [str(REPO / 'smartfinancial.py')],
+        'forbidden': HEAVY_MODULES,
+        'budget_ms': 800,
+    },
+    'core_import': {
+        'args': ['-c', 'import smartfinancial_core'],
+        'forbidden': HEAVY_MODULES + ('streamlit', 'bcrypt'),
+        'budget_ms': 20,
+    },
+}
+
+# Arranque del intérprete sin importar nada del escenario (se descuenta de cada medida)
+STARTUP_ARGS = ['-c', 'pass']
+
+# "import time: <self us> | <cumulative us> | <sangría><módulo>"
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)\s*$')
+
+def measure(args):
+    """Ejecuta un proceso con -X importtime y devuelve {módulo: (propio us, acumulado us, nivel)}."""
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [str(REPO), os.environ.get('PYTHONPATH')]))}
+    with tempfile.TemporaryDirectory() as cwd:
+        proc = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=cwd, env=env,
+                              capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} terminó con código {proc.returncode}:\n{proc.stderr[-2000:]}")
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return modules
+
+def scenario_imports(modules, startup):
+    """{módulo: acumulado us} de los imports de primer nivel del escenario (sin los del arranque del intérprete)."""
+    return {module: cumulative for module, (_, cumulative, level) in modules.items()
+            if level == 0 and module not in startup}
+
+def run_scenario(name, scenario, runs, top, budget_scale, startup):
+    """Mide un escenario `runs` veces y lo evalúa con la ejecución más rápida."""
+    best_total, best_modules = None, None
+    for _ in range(runs):
+        modules = measure(scenario['args'])
+        total = sum(scenario_imports(modules, startup).values())
+        if best_total is None or total < best_total:
+            best_total, best_modules = total, modules
+
+    budget_ms = scenario['budget_ms'] * budget_scale
+    forbidden = sorted(module for module in scenario['forbidden'] if module in best_modules)
+    slowest = sorted(scenario_imports(best_modules, startup).items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'scenario': name,
+        'total_ms': round(best_total / 1000, 1),
+        'budget_ms': budget_ms,
+        'modules': len(set(best_modules) - startup),
+        'forbidden_imported': forbidden,
+        'slowest_top_level': [{'module': module, 'cumulative_ms': round(us / 1000, 1)} for module, us in slowest],
+        'ok': not forbidden and best_total / 1000 <= budget_ms,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="Ejecuciones por escenario (se usa la más rápida)")
+    parser.add_argument('--top', type=int, default=15, help="Módulos más lentos a mostrar")
+    parser.add_argument('--budget-scale', type=float, default=1.0,
+                        help="Multiplica los presupuestos (p. ej. 2.0 en máquinas lentas de CI)")
+    parser.add_argument('--scenario', choices=list(SCENARIOS), action='append', help="Solo estos escenarios")
+    parser.add_argument('--json', action='store_true', help="Resultados en JSON por la salida estándar")
+    args = parser.parse_args(argv)
+
+    startup = set(measure(STARTUP_ARGS))
+    results = [run_scenario(name, SCENARIOS[name], args.runs, args.top, args.budget_scale, startup)
+               for name in (args.scenario or SCENARIOS)]
+
+    if args.json:
+        print(json.dumps({'python': sys.version.split()[0], 'results': results}, indent=2))
+    else:
+        for result in results:
+            status = "OK" if result['ok'] else "FALLO"
+            print(f"[{status}] {result['scenario']}: {result['total_ms']} ms "
+                  f"(presupuesto {result['budget_ms']:.0f} ms, {result['modules']} módulos)")
+            if result['forbidden_imported']:
+                print(f"    importa módulos no permitidos: {', '.join(result['forbidden_imported'])}")
+            for item in result['slowest_top_level']:
+                print(f"    {item['cumulative_ms']:>8.1f} ms  {item['module']}")
+    return 0 if all(result['ok'] for result in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
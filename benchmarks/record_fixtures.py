@@ -0,0 +1,74 @@
+"""
+Graba fixtures para ReplayProvider desde Yahoo Finance y Wikipedia (requiere conexión).
+
+Uso:
+    python benchmarks/record_fixtures.py --out benchmarks/fixtures [--market "DAX (Alemania)" ...] [--days 400]
+
+Sin --market se graban todos los mercados de MARKETS_DATA. Los tickers que no se puedan
+descargar se omiten y el benchmark los sintetizará.
+"""
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from smartfinancial_core.markets import MARKETS_DATA, get_market_tickers  # noqa: E402
+from smartfinancial_core.constituents import WIKIPEDIA_CONSTITUENT_URLS  # noqa: E402
+from smartfinancial_core.providers import YFinanceProvider  # noqa: E402
+from replay_provider import fixture_path, page_path  # noqa: E402
+
+def record_ticker(provider, out, ticker, start, end):
+    """Graba histórico e .info de un ticker; devuelve True si había datos."""
+    try:
+        history = provider.history(ticker, start, end)
+        info = provider.info(ticker)
+    except Exception as e:
+        print(f"  {ticker}: {e}", file=sys.stderr)
+        return False
+    if history.empty:
+        return False
+    keep = ('longName', 'shortName', 'quoteType', 'currentPrice', 'regularMarketPrice', 'currency')
+    fixture_path(out, ticker).write_text(json.dumps({
+        'ticker': ticker,
+        'info': {key: info[key] for key in keep if key in info},
+        'history': {date.strftime('%Y-%m-%d'): float(close) for date, close in history.dropna().items()},
+    }))
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=str(Path(__file__).resolve().parent / 'fixtures'))
+    parser.add_argument('--market', action='append', choices=list(MARKETS_DATA), metavar='MERCADO')
+    parser.add_argument('--days', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    out = Path(args.out)
+    (out / 'pages').mkdir(parents=True, exist_ok=True)
+    provider = YFinanceProvider()
+    end = datetime.now()
+    start = (end - timedelta(days=args.days)).strftime('%Y-%m-%d')
+    end = end.strftime('%Y-%m-%d')
+
+    for market in args.market or MARKETS_DATA:
+        tickers = get_market_tickers(market)
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            recorded = sum(executor.map(lambda ticker: record_ticker(provider, out, ticker, start, end), tickers))
+        print(f"{market}: {recorded}/{len(tickers)} tickers grabados", file=sys.stderr)
+
+        url = WIKIPEDIA_CONSTITUENT_URLS.get(market)
+        if url:
+            try:
+                response = provider.fetch_url(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
+                response.raise_for_status()
+                page_path(out, url).write_bytes(response.content)
+            except Exception as e:
+                print(f"  página {url}: {e}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
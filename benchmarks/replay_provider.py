@@ -0,0 +1,145 @@
+"""
+Proveedor de datos de mercado sin red para benchmarks (ver smartfinancial_core.providers).
+
+Sirve los datos grabados con benchmarks/record_fixtures.py y, para los tickers sin grabar,
+genera una serie sintética determinista (paseo aleatorio con semilla por ticker), así que
+funciona en una máquina sin conexión y sin fixtures. Permite simular la red:
+
+    latency       segundos de espera por llamada (una descarga en bloque cuenta como una)
+    jitter        variación aleatoria (+/-) de la latencia
+    failure_rate  probabilidad de que una llamada falle con un error de red
+    missing_rate  fracción de tickers sintéticos sin datos (como un ticker deslistado)
+
+Formato de fixtures (un fichero por ticker y uno por página):
+    <dir>/<TICKER>.json      {"ticker": ..., "info": {...}, "history": {"AAAA-MM-DD": cierre, ...}}
+    <dir>/pages/<url>.html   contenido de la página (url codificada con urllib.parse.quote)
+"""
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import requests
+
+SYNTHETIC_DAYS = 800                # días de histórico sintético (cubre la ventana de 1 año con margen)
+
+def fixture_path(directory, ticker):
+    """Fichero de fixture de un ticker."""
+    return Path(directory) / f"{ticker.replace('/', '_')}.json"
+
+def page_path(directory, url):
+    """Fichero de fixture de una página."""
+    return Path(directory) / 'pages' / f"{quote(url, safe='')}.html"
+
+class _Response:
+    """Respuesta HTTP mínima compatible con lo que usa el núcleo de requests.Response."""
+
+    def __init__(self, content, status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+class ReplayProvider:
+    """Proveedor de fixtures grabadas o sintéticas con latencia y fallos configurables."""
+
+    def __init__(self, fixtures_dir=None, latency=0.0, jitter=0.0, failure_rate=0.0, missing_rate=0.0, seed=0):
+        self.fixtures_dir = Path(fixtures_dir) if fixtures_dir else None
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.missing_rate = missing_rate
+        self.seed = seed
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._series = {}
+        self._infos = {}
+        self._today = pd.Timestamp.today().normalize()
+
+    # --- Simulación de red ---
+
+    def _network(self, kind):
+        """Cuenta la llamada, espera la latencia configurada y decide si falla."""
+        with self._lock:
+            self.calls[kind] += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise requests.ConnectionError(f"fallo de red simulado ({kind})")
+
+    def reset_calls(self):
+        """Pone a cero los contadores de llamadas y devuelve los anteriores."""
+        with self._lock:
+            calls, self.calls = dict(self.calls), Counter()
+        return calls
+
+    # --- Datos ---
+
+    def _load(self, ticker):
+        """Carga (una vez) la serie y el .info de un ticker: de su fixture o sintéticos."""
+        with self._lock:
+            if ticker in self._series:
+                return self._series[ticker], self._infos[ticker]
+
+        path = fixture_path(self.fixtures_dir, ticker) if self.fixtures_dir else None
+        if path is not None and path.exists():
+            data = json.loads(path.read_text())
+            series = pd.Series(data['history'], dtype='float64')
+            series.index = pd.to_datetime(series.index)
+            info = data.get('info') or {}
+        else:
+            series, info = self._synthesize(ticker)
+
+        with self._lock:
+            self._series[ticker], self._infos[ticker] = series, info
+        return series, info
+
+    def _synthesize(self, ticker):
+        """Paseo aleatorio geométrico determinista (misma serie para el mismo ticker y semilla)."""
+        ticker_seed = zlib.crc32(ticker.encode()) ^ self.seed
+        rng = np.random.default_rng(ticker_seed)
+        if rng.random() < self.missing_rate:
+            # Como yfinance con un ticker deslistado: serie vacía (con índice de fechas) y .info vacío
+            return pd.Series(dtype='float64', index=pd.DatetimeIndex([])), {}
+        dates = pd.bdate_range(end=self._today - pd.Timedelta(days=1), periods=SYNTHETIC_DAYS * 5 // 7)
+        returns = rng.normal(0.0003, 0.02, len(dates))
+        closes = rng.uniform(5, 500) * np.exp(np.cumsum(returns))
+        series = pd.Series(closes, index=dates)
+        return series, {'longName': f"{ticker} (sintético)", 'quoteType': 'EQUITY', 'currentPrice': float(closes[-1])}
+
+    # --- Interfaz de proveedor ---
+
+    def history(self, ticker, start, end):
+        self._network('history')
+        series, _ = self._load(ticker)
+        return series[(series.index >= pd.Timestamp(start)) & (series.index < pd.Timestamp(end))]
+
+    def info(self, ticker):
+        self._network('info')
+        return dict(self._load(ticker)[1])
+
+    def recent_closes(self, tickers):
+        self._network('recent_closes')
+        start = self._today - pd.Timedelta(days=7)
+        columns = {ticker: series[series.index >= start] for ticker in tickers
+                   for series in [self._load(ticker)[0]] if not series.empty}
+        return pd.DataFrame(columns)
+
+    def fetch_url(self, url, headers=None, timeout=10):
+        self._network('fetch_url')
+        path = page_path(self.fixtures_dir, url) if self.fixtures_dir else None
+        if path is None or not path.exists():
+            raise requests.ConnectionError(f"sin red y sin fixture para {url}")
+        return _Response(path.read_bytes())
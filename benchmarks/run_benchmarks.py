@@ -0,0 +1,407 @@
+"""
+Benchmarks sin red de SmartFinancial, con resultados en JSON para comparar ejecuciones.
+
+Los datos de mercado los sirve ReplayProvider (fixtures grabadas o sintéticas, con latencia
+y fallos simulados) y cada ejecución usa bases de datos temporales. Grupos:
+
+    portfolio  refresh_held_prices, load_portfolio (frente a PORTFOLIO_RENDER_BUDGET) y load_portfolio_history
+               con 10, 100 y 1000 valores
+    markets    get_stock_data_for_market para cada mercado de MARKETS_DATA, en frío y en caliente,
+               la tabla compacta de cada mercado (memoria por sesión frente a MARKET_TABLE_BYTES_PER_ROW),
+               50 sesiones cargando el mismo mercado a la vez (caché compartida con single-flight),
+               el universo completo del S&P 500 (500 componentes; objetivo en caliente: FULL_UNIVERSE_TARGET_S)
+               y el screener de todos los mercados (load_universe y screen)
+    symbols    índice de símbolos: construcción y autocompletado por ticker y por nombre
+    charts     prepare_chart_data
+    db         operaciones de portfolio sobre una base de datos sintética con millones de lotes
+
+Uso:
+    python benchmarks/run_benchmarks.py --out resultados.json
+    python benchmarks/run_benchmarks.py --quick --compare resultados.json
+    python benchmarks/run_benchmarks.py --groups markets --latency 0.2 --failure-rate 0.05
+"""
+import argparse
+import contextlib
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+import bcrypt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from smartfinancial_core import portfolio  # noqa: E402
+from smartfinancial_core.db import configure_db, get_connection  # noqa: E402
+from smartfinancial_core.markets import (  # noqa: E402
+    MARKET_TABLE_BYTES_PER_ROW, MARKETS_DATA, get_stock_data_for_market, invalidate_market_cache, load_market_table,
+    market_table_bytes, to_market_table,
+)
+from smartfinancial_core.providers import set_provider  # noqa: E402
+from smartfinancial_core.screener import load_universe, screen  # noqa: E402
+from smartfinancial_core.symbols import build_symbol_index, invalidate_symbol_index, search_symbols  # noqa: E402
+from smartfinancial_core.users import get_user_id, register_user  # noqa: E402
+from replay_provider import ReplayProvider  # noqa: E402
+
+GROUPS = ('portfolio', 'markets', 'symbols', 'charts', 'db')
+
+# Objetivo de la carga en caliente del universo completo del S&P 500 (segundos)
+FULL_UNIVERSE_MARKET = "S&P 500 (USA)"
+FULL_UNIVERSE_SIZE = 500
+FULL_UNIVERSE_TARGET_S = 30
+
+class Suite:
+    """Ejecuta y registra benchmarks, con las llamadas al proveedor de cada uno."""
+
+    def __init__(self, provider, repeat):
+        self.provider = provider
+        self.repeat = repeat
+        self.results = []
+
+    def bench(self, group, name, fn, repeat=None, setup=None, describe=None, **params):
+        """Mide `fn` `repeat` veces (tras `setup`, que no se mide) y guarda las estadísticas en ms."""
+        self.provider.reset_calls()
+        times = []
+        value = None
+        for _ in range(repeat or self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            value = fn()
+            times.append((time.perf_counter() - start) * 1000)
+        result = {
+            'group': group,
+            'name': name,
+            'params': params,
+            'repeat': len(times),
+            'min_ms': round(min(times), 3),
+            'median_ms': round(statistics.median(times), 3),
+            'mean_ms': round(statistics.fmean(times), 3),
+            'max_ms': round(max(times), 3),
+            'provider_calls': self.provider.reset_calls(),
+        }
+        if describe:
+            result.update(describe(value))
+        self.results.append(result)
+        print(f"  {name:<58} {result['median_ms']:>11.2f} ms  (min {result['min_ms']:.2f}, n={len(times)})", file=sys.stderr)
+        return result
+
+# --- Grupos ---
+
+def bench_portfolio(suite, holdings_sizes, lots_per_holding=3):
+    """Portfolios de distintos tamaños: actualización de precios y valoración desde el almacén local."""
+    rng = np.random.default_rng(1)
+    for size in holdings_sizes:
+        username = f"bench_{size}"
+        register_user(username, 'bench')
+        user_id = get_user_id(username)
+        tickers = [f"P{size}X{i:04d}" for i in range(size)]
+        # Lotes comprados a lo largo de los últimos dos años (la evolución los va sumando)
+        lots = [(user_id, ticker, int(rng.integers(1, 100)), float(rng.uniform(5, 500)),
+                 (pd.Timestamp.today() - pd.Timedelta(days=int(rng.integers(0, 730)))).strftime('%Y-%m-%d'))
+                for ticker in tickers for _ in range(lots_per_holding)]
+        with get_connection() as conn:
+            conn.executemany("INSERT INTO portfolio (user_id, ticker, shares, purchase_price, purchase_date) VALUES (?, ?, ?, ?, ?)", lots)
+            conn.execute(
+                """
+                INSERT INTO positions (user_id, ticker, total_shares, total_cost)
+                SELECT user_id, ticker, SUM(shares), SUM(shares * purchase_price) FROM portfolio WHERE user_id = ? GROUP BY ticker
+                """,
+                (user_id,)
+            )
+            conn.commit()
+        portfolio.invalidate_portfolio_snapshot(username)
+
+        def load():
+            return portfolio.load_portfolio(username, background_refresh=False, budget=None)
+
+        def describe(result):
+            return {'rows': len(result[0]), 'message': result[1]}
+
+        suite.bench('portfolio', f'refresh_held_prices.cold[{size}]', lambda: portfolio.refresh_held_prices(username),
+                    repeat=1, holdings=size)
+        suite.bench('portfolio', f'refresh_held_prices.warm[{size}]', lambda: portfolio.refresh_held_prices(username),
+                    holdings=size)
+        priced = suite.bench('portfolio', f'load_portfolio.priced[{size}]', load, describe=describe, holdings=size,
+                             setup=lambda: portfolio.invalidate_portfolio_snapshot(username))
+        # Por encima del presupuesto de render la app mostraría el último snapshot (desactualizado)
+        priced['within_budget'] = priced['max_ms'] <= portfolio.PORTFOLIO_RENDER_BUDGET * 1000
+        suite.bench('portfolio', f'load_portfolio.snapshot[{size}]', load, describe=describe, holdings=size)
+        suite.bench('portfolio', f'load_portfolio_history.1A[{size}]', lambda: portfolio.load_portfolio_history(username, '1A'),
+                    describe=lambda result: {'days': len(result)}, holdings=size,
+                    setup=lambda: portfolio.invalidate_portfolio_snapshot(username))
+
+def _deep_size(value):
+    """Memoria aproximada de una estructura de listas, dicts y escalares de Python."""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_deep_size(key) + _deep_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_deep_size(item) for item in value)
+    return sys.getsizeof(value)
+
+def describe_table(table, stock_list):
+    """Memoria de la tabla compacta frente a la lista de filas que guardaba antes cada sesión."""
+    table_bytes = market_table_bytes(table)
+    return {'rows': len(table), 'table_bytes': table_bytes, 'rows_list_bytes': _deep_size(stock_list),
+            'bytes_per_row': round(table_bytes / len(table), 1),
+            'within_budget': table_bytes <= MARKET_TABLE_BYTES_PER_ROW * len(table)}
+
+def bench_markets(suite):
+    """Carga de cada mercado: en frío (histórico vacío) y en caliente (almacén local y cachés llenos)."""
+    def describe(result):
+        stock_list, failed, _ = result
+        return {'loaded': len(stock_list or []), 'failed': len(failed)}
+
+    for market in MARKETS_DATA:
+        suite.bench('markets', f'get_stock_data_for_market.cold[{market}]', lambda: get_stock_data_for_market(market),
+                    repeat=1, describe=describe, market=market)
+        suite.bench('markets', f'get_stock_data_for_market.warm[{market}]', lambda: get_stock_data_for_market(market),
+                    describe=describe, market=market)
+        stock_list = get_stock_data_for_market(market)[0]
+        if stock_list:
+            suite.bench('markets', f'to_market_table[{market}]', lambda: to_market_table(stock_list),
+                        describe=lambda table: describe_table(table, stock_list), market=market)
+
+    # Caché compartida: 50 sesiones piden el mismo mercado a la vez y solo una lo carga
+    def concurrent_loads(market, sessions=50):
+        with ThreadPoolExecutor(max_workers=sessions) as executor:
+            return list(executor.map(lambda _: load_market_table(market), range(sessions)))
+
+    market = next(iter(MARKETS_DATA))
+    suite.bench('markets', f'load_market_table.concurrent[{market}][50]', lambda: concurrent_loads(market),
+                setup=invalidate_market_cache, market=market, sessions=50,
+                describe=lambda results: {'distinct_tables': len({id(table) for table, _, _ in results})})
+    suite.bench('markets', f'load_market_table.hit[{market}]', lambda: load_market_table(market), market=market)
+
+    bench_full_universe(suite)
+
+    # Screener: todos los mercados en una tanda (en caliente tras cargar cada mercado) y un filtro típico
+    suite.bench('markets', 'load_universe.warm', load_universe,
+                describe=lambda result: {'rows': 0 if result[0] is None else len(result[0]), 'failed': len(result[1])})
+    universe = load_universe()[0]
+    if universe is not None:
+        suite.bench('markets', 'screen[cl,drawdown>20]', lambda: screen(universe, cl=True, min_drawdown=20),
+                    describe=lambda result: {'rows': len(result)}, universe=len(universe))
+
+def bench_full_universe(suite, market=FULL_UNIVERSE_MARKET, size=FULL_UNIVERSE_SIZE):
+    """Universo completo de un índice con `size` componentes guardados (sin scraping), en frío y en caliente."""
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO market_constituents (market, tickers, fetched_at, checked_at) VALUES (?, ?, ?, ?)",
+                     (market, json.dumps([f"U{i:03d}" for i in range(size)]), now, now))
+        conn.commit()
+
+    def describe(result):
+        table, failed, _ = result
+        return {'loaded': 0 if table is None else len(table), 'failed': len(failed),
+                'table_bytes': 0 if table is None else market_table_bytes(table)}
+
+    def load():
+        return load_market_table(market, full_universe=True)
+
+    suite.bench('markets', f'load_market_table.full.cold[{market}]', load, repeat=1, setup=invalidate_market_cache,
+                describe=describe, market=market, tickers=size)
+    warm = suite.bench('markets', f'load_market_table.full.warm[{market}]', load, setup=invalidate_market_cache,
+                       describe=describe, market=market, tickers=size)
+    warm['within_target'] = warm['median_ms'] <= FULL_UNIVERSE_TARGET_S * 1000
+
+def bench_symbols(suite, sizes=(1000, 10000)):
+    """Índice de símbolos con universos sintéticos (nombres en la caché de metadatos) y búsquedas típicas."""
+    words = np.array(['Banco', 'Global', 'Energy', 'Tech', 'Holdings', 'Pharma', 'Motors', 'Capital', 'Santander', 'Foods'])
+    rng = np.random.default_rng(4)
+    for size in sizes:
+        now = time.time()
+        with get_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO ticker_metadata (ticker, long_name, name_updated, last_access) VALUES (?, ?, ?, ?)",
+                ((f"S{i:05d}", ' '.join(rng.choice(words, 3)) + f" {i}", now, now) for i in range(size))
+            )
+            conn.commit()
+        suite.bench('symbols', f'build_symbol_index[{size}]', build_symbol_index, describe=lambda result: {
+            'symbols': len(result['symbols']), 'name_keys': len(result['name_keys'])}, universe=size)
+        invalidate_symbol_index()
+        search_symbols('warm')
+        for query in ('S0', 'S00042', 'santa', 'tech hold'):
+            suite.bench('symbols', f'search_symbols[{query}][{size}]', lambda: search_symbols(query),
+                        repeat=suite.repeat * 20, describe=lambda result: {'results': len(result)}, universe=size)
+        invalidate_symbol_index()
+
+def bench_charts(suite, sizes=(10, 100, 1000, 10000)):
+    """prepare_chart_data sobre portfolios sintéticos."""
+    rng = np.random.default_rng(2)
+    for size in sizes:
+        cost = rng.uniform(100, 10000, size)
+        df = pd.DataFrame({
+            'Ticker': [f"C{i:05d}" for i in range(size)],
+            'Costo Total Pagado': cost,
+            'Valor Actual de Mercado': cost * rng.uniform(0.5, 1.5, size),
+        })
+        suite.bench('charts', f'prepare_chart_data[{size}]', lambda: portfolio.prepare_chart_data(df), holdings=size)
+
+def bench_db(suite, path, lots, users, tickers_count, chunk=100_000):
+    """Base de datos sintética con `lots` lotes repartidos entre `users` usuarios y `tickers_count` tickers."""
+    configure_db(str(path))
+    rng = np.random.default_rng(3)
+    tickers = np.array([f"D{i:05d}" for i in range(tickers_count)])
+    password_hash = bcrypt.hashpw(b'bench', bcrypt.gensalt(4)).decode('utf-8')
+
+    def build():
+        with get_connection() as conn:
+            conn.executemany("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                             ((f"user{u}", password_hash) for u in range(users)))
+            for offset in range(0, lots, chunk):
+                size = min(chunk, lots - offset)
+                conn.executemany(
+                    "INSERT INTO portfolio (user_id, ticker, shares, purchase_price) VALUES (?, ?, ?, ?)",
+                    zip(rng.integers(1, users + 1, size).tolist(), tickers[rng.integers(0, tickers_count, size)].tolist(),
+                        rng.integers(1, 500, size).tolist(), rng.uniform(1, 500, size).round(2).tolist())
+                )
+            # Nombres en caché: add_to_portfolio valida el ticker sin llamar al proveedor
+            now = time.time()
+            conn.executemany("INSERT OR REPLACE INTO ticker_metadata (ticker, long_name, name_updated, last_access) VALUES (?, ?, ?, ?)",
+                             ((ticker, f"{ticker} Corp", now, now) for ticker in tickers.tolist()))
+            conn.commit()
+
+    def rebuild_positions():
+        with get_connection() as conn:
+            conn.execute("DELETE FROM positions")
+            conn.execute(
+                """
+                INSERT INTO positions (user_id, ticker, total_shares, total_cost)
+                SELECT user_id, ticker, SUM(shares), SUM(shares * purchase_price) FROM portfolio GROUP BY user_id, ticker
+                """
+            )
+            conn.commit()
+
+    def random_user():
+        return f"user{int(rng.integers(0, users))}"
+
+    def query(sql, params=()):
+        with get_connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    params = {'lots': lots, 'users': users, 'tickers': tickers_count}
+    suite.bench('db', 'build_synthetic_lots', build, repeat=1, **params)
+    suite.bench('db', 'rebuild_positions', rebuild_positions, repeat=1, **params)
+    suite.bench('db', 'load_positions', lambda: portfolio._load_positions(random_user()), **params)
+    suite.bench('db', 'lots_for_user', lambda: query("SELECT ticker, shares, purchase_price FROM portfolio WHERE user_id = ?",
+                                                      (int(rng.integers(1, users + 1)),)), **params)
+    suite.bench('db', 'distinct_held_tickers', lambda: query("SELECT DISTINCT ticker FROM positions"), **params)
+    def describe(result):
+        return {'last_result': result[1]}
+
+    suite.bench('db', 'add_to_portfolio',
+                lambda: portfolio.add_to_portfolio(random_user(), str(tickers[rng.integers(0, tickers_count)]), '10', '12.5'),
+                repeat=suite.repeat * 20, describe=describe, **params)
+    suite.bench('db', 'delete_from_portfolio',
+                lambda: portfolio.delete_from_portfolio(random_user(), str(tickers[rng.integers(0, tickers_count)])),
+                repeat=suite.repeat * 20, describe=describe, **params)
+    suite.results[-1]['db_size_mb'] = round(path.stat().st_size / 2**20, 1)
+
+# --- Comparación y ejecución ---
+
+def compare(results, baseline_path):
+    """Imprime la mediana de cada benchmark frente a la de una ejecución anterior."""
+    baseline = {result['name']: result for result in json.loads(Path(baseline_path).read_text())['results']}
+    print(f"\n{'benchmark':<60} {'base ms':>11} {'nuevo ms':>11} {'ratio':>7}", file=sys.stderr)
+    for result in results:
+        base = baseline.get(result['name'])
+        if base is None:
+            continue
+        ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+        print(f"{result['name']:<60} {base['median_ms']:>11.2f} {result['median_ms']:>11.2f} {ratio:>6.2f}x", file=sys.stderr)
+
+def git_commit():
+    """Commit actual del repositorio (o None si no se puede saber)."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', default=','.join(GROUPS), help=f"Grupos separados por comas ({', '.join(GROUPS)})")
+    parser.add_argument('--fixtures', help="Directorio de fixtures grabadas (si no, datos sintéticos)")
+    parser.add_argument('--latency', type=float, default=0.05, help="Segundos de latencia por llamada al proveedor")
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Probabilidad de fallo de red por llamada")
+    parser.add_argument('--missing-rate', type=float, default=0.02, help="Fracción de tickers sintéticos sin datos")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--holdings', default='10,100,1000')
+    parser.add_argument('--lots', type=int, default=2_000_000)
+    parser.add_argument('--db-users', type=int, default=1000)
+    parser.add_argument('--db-tickers', type=int, default=2000)
+    parser.add_argument('--quick', action='store_true', help="Tamaños reducidos para una comprobación rápida")
+    parser.add_argument('--workdir', help="Directorio para las bases de datos (por defecto uno temporal)")
+    parser.add_argument('--out', help="Fichero JSON de resultados (por defecto, la salida estándar)")
+    parser.add_argument('--compare', help="JSON de una ejecución anterior con la que comparar")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.repeat = min(args.repeat, 2)
+        args.holdings = '10,100'
+        args.lots = min(args.lots, 100_000)
+    groups = [group.strip() for group in args.groups.split(',') if group.strip()]
+    holdings_sizes = [int(size) for size in args.holdings.split(',')]
+
+    provider = ReplayProvider(args.fixtures, latency=args.latency, jitter=args.jitter,
+                              failure_rate=args.failure_rate, missing_rate=args.missing_rate, seed=args.seed)
+    set_provider(provider)
+    # Sin actualizador en segundo plano: cada benchmark mide solo su propio trabajo
+    portfolio.request_price_refresh = lambda: None
+    suite = Suite(provider, args.repeat)
+
+    # La salida estándar queda libre para el JSON: lo que impriman las funciones medidas va a stderr
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(sys.stderr):
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        configure_db(str(workdir / 'bench.db'))
+        started = time.perf_counter()
+        for group in groups:
+            print(f"[{group}]", file=sys.stderr)
+            if group == 'portfolio':
+                bench_portfolio(suite, holdings_sizes)
+            elif group == 'markets':
+                bench_markets(suite)
+            elif group == 'symbols':
+                bench_symbols(suite)
+            elif group == 'charts':
+                bench_charts(suite)
+            elif group == 'db':
+                bench_db(suite, workdir / 'synthetic.db', args.lots, args.db_users, args.db_tickers)
+            else:
+                parser.error(f"grupo desconocido: {group}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'duration_s': round(time.perf_counter() - started, 1),
+            'config': {key: value for key, value in vars(args).items() if key not in ('out', 'compare')},
+        },
+        'results': suite.results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(output)
+    else:
+        print(output)
+    if args.compare:
+        compare(suite.results, args.compare)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
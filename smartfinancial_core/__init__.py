@@ -0,0 +1,95 @@
+"""
+Núcleo de SmartFinancial sin dependencias de Streamlit.
+
+Precios, estadísticas, mercados y portfolios (con el usuario siempre explícito) para
+usarlos desde la app, tareas programadas o la línea de comandos (python -m smartfinancial_core).
+Importar el paquete no abre la base de datos ni arranca hilos, y los submódulos se cargan
+al usar cada nombre por primera vez: registrarse o iniciar sesión no importa yfinance,
+pandas, requests ni bs4.
+"""
+import importlib
+
+# Nombre público -> submódulo que lo define (se importa en el primer acceso, PEP 562)
+_EXPORTS = {
+    'configure_db': 'db',
+    'get_connection': 'db',
+    'get_price_history': 'market_data',
+    'get_ticker_metadata': 'market_data',
+    'read_cached_quotes': 'market_data',
+    'get_latest_quotes': 'market_data',
+    'BASE_CURRENCIES': 'fx',
+    'CURRENCY_SYMBOLS': 'fx',
+    'guess_currency': 'fx',
+    'ticker_currencies': 'fx',
+    'get_fx_rates': 'fx',
+    'convert': 'fx',
+    'get_provider': 'providers',
+    'set_provider': 'providers',
+    'STATS_WINDOWS': 'stats',
+    'compute_window_stats': 'stats',
+    'stats_history_days': 'stats',
+    'get_user_id': 'users',
+    'register_user': 'users',
+    'authenticate': 'users',
+    'PORTFOLIO_COLUMNS': 'portfolio',
+    'PORTFOLIO_RENDER_BUDGET': 'portfolio',
+    'QUOTE_STALE_AFTER': 'portfolio',
+    'calculate_recommendation': 'portfolio',
+    'prepare_chart_data': 'portfolio',
+    'load_portfolio': 'portfolio',
+    'invalidate_portfolio_snapshot': 'portfolio',
+    'VALUATION_PERIODS': 'portfolio',
+    'load_portfolio_history': 'portfolio',
+    'portfolio_day_change': 'portfolio',
+    'portfolio_totals': 'portfolio',
+    'refresh_held_prices': 'portfolio',
+    'start_price_refresher': 'portfolio',
+    'request_price_refresh': 'portfolio',
+    'add_to_portfolio': 'portfolio',
+    'delete_from_portfolio': 'portfolio',
+    'MARKETS_DATA': 'markets',
+    'get_market_tickers': 'markets',
+    'iter_ticker_batches': 'markets',
+    'iter_stock_data_for_market': 'markets',
+    'get_stock_data_for_market': 'markets',
+    'market_load_message': 'markets',
+    'trading_day': 'markets',
+    'load_market_table': 'markets',
+    'invalidate_market_cache': 'markets',
+    'market_cache_info': 'markets',
+    'MARKET_TABLE_BYTES_PER_ROW': 'markets',
+    'to_market_table': 'markets',
+    'market_table_bytes': 'markets',
+    'DEFAULT_RULES': 'rules',
+    'RULE_REFERENCES': 'rules',
+    'validate_rules': 'rules',
+    'evaluate_rules': 'rules',
+    'get_user_rules': 'rules',
+    'save_user_rules': 'rules',
+    'reset_user_rules': 'rules',
+    'universe_tickers': 'screener',
+    'iter_universe': 'screener',
+    'add_buy_signals': 'screener',
+    'build_universe': 'screener',
+    'load_universe': 'screener',
+    'screen': 'screener',
+    'build_symbol_index': 'symbols',
+    'invalidate_symbol_index': 'symbols',
+    'search_symbols': 'symbols',
+    'lookup_symbol': 'symbols',
+    'validate_ticker': 'symbols',
+    'get_ticketnamesmarket': 'constituents',
+    'refresh_all_constituents': 'constituents',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value  # Los siguientes accesos ya no pasan por __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,213 @@
+"""
+Línea de comandos para tareas programadas (sin navegador ni sesión de Streamlit).
+
+Ejemplos:
+    python -m smartfinancial_core markets
+    python -m smartfinancial_core search santander
+    python -m smartfinancial_core scan --market "DAX (Alemania)" --out dax.parquet
+    python -m smartfinancial_core scan --market "S&P 500 (USA)" --full --out sp500.parquet
+    python -m smartfinancial_core value --user ana --currency EUR --out ana.csv
+    python -m smartfinancial_core history --user ana --period 1A --out ana_1a.csv
+    python -m smartfinancial_core screen --cl yes --min-drawdown 20 --out shortlist.csv
+    python -m smartfinancial_core rules --user ana --set reglas.json
+    python -m smartfinancial_core --trace scan.prom scan --market "IBEX 35 (Madrid)"
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from . import tracing
+from .db import configure_db
+from .fx import BASE_CURRENCIES
+from .markets import MARKETS_DATA, get_stock_data_for_market
+from .portfolio import VALUATION_PERIODS, load_portfolio, load_portfolio_history, portfolio_totals, refresh_held_prices
+from .rules import get_user_rules, reset_user_rules, save_user_rules
+from .screener import SCREENER_SORT_COLUMNS, load_universe, screen
+from .symbols import search_symbols
+from .users import get_user_id
+
+def _write_frame(df, out):
+    """Escribe el DataFrame en `out` (formato según la extensión) o lo imprime si no hay fichero."""
+    if out is None:
+        print(df.to_string(index=False))
+        return
+    suffix = Path(out).suffix.lower()
+    if suffix == '.parquet':
+        df.to_parquet(out, index=False)
+    elif suffix == '.csv':
+        df.to_csv(out, index=False)
+    elif suffix == '.json':
+        df.to_json(out, orient='records', indent=2, force_ascii=False)
+    else:
+        raise ValueError(f"Formato de salida no soportado: {suffix or out} (usa .parquet, .csv o .json)")
+
+def cmd_markets(args):
+    """Lista los mercados disponibles."""
+    for market in MARKETS_DATA:
+        print(market)
+    return 0
+
+def cmd_search(args):
+    """Busca valores de todos los mercados por prefijo de ticker o nombre."""
+    symbols = search_symbols(args.query, limit=args.limit)
+    if not symbols:
+        print(f"ℹ️ Ningún valor coincide con '{args.query}'.", file=sys.stderr)
+        return 1
+    for symbol in symbols:
+        print(f"{symbol['ticker']:<12} {symbol['name'] or '':<40} {', '.join(symbol['markets'])}")
+    return 0
+
+def cmd_scan(args):
+    """Carga precios y estadísticas de un mercado."""
+    stock_list, failed_tickers, message = get_stock_data_for_market(args.market, full_universe=args.full)
+    print(message, file=sys.stderr)
+    for ticker, reason in failed_tickers:
+        print(f"  {ticker}: {reason}", file=sys.stderr)
+    if not stock_list:
+        return 1
+    _write_frame(pd.DataFrame(stock_list), args.out)
+    return 0
+
+def cmd_screen(args):
+    """Carga todos los mercados (o los indicados) y filtra las señales de compra."""
+    if args.user and get_user_id(args.user) is None:
+        print("❌ Error: Usuario no encontrado.", file=sys.stderr)
+        return 1
+    universe, failed_tickers, message = load_universe(args.market, get_user_rules(args.user) if args.user else None)
+    print(message, file=sys.stderr)
+    if universe is None:
+        return 1
+    signal = {'yes': True, 'no': False, None: None}
+    result = screen(universe, markets=args.market, cc=signal[args.cc], cl=signal[args.cl],
+                    min_drawdown=args.min_drawdown, drawdown_window=args.window, sort_by=args.sort,
+                    ascending=args.ascending, limit=args.limit)
+    print(f"{len(result)} acciones cumplen los filtros.", file=sys.stderr)
+    _write_frame(result, args.out)
+    return 0
+
+def cmd_value(args):
+    """Valora el portfolio de un usuario."""
+    if get_user_id(args.user) is None:
+        print("❌ Error: Usuario no encontrado.", file=sys.stderr)
+        return 1
+    if not args.offline:
+        refresh_held_prices(args.user)
+    portfolio_df, message = load_portfolio(args.user, background_refresh=False, base_currency=args.currency, budget=None)
+    print(message, file=sys.stderr)
+
+    cost, value, gain, unpriced = portfolio_totals(portfolio_df)
+    print(f"Importe Total Pagado: {cost:,.2f} {args.currency} | Valor Actual: {value:,.2f} {args.currency} | "
+          f"Pérdida/Ganancia: {gain:,.2f} {args.currency}"
+          + (f" (sin precio: {', '.join(unpriced)})" if unpriced else ""), file=sys.stderr)
+    _write_frame(portfolio_df, args.out)
+    return 0
+
+def cmd_history(args):
+    """Evolución diaria del valor, el coste y la ganancia del portfolio de un usuario."""
+    if get_user_id(args.user) is None:
+        print("❌ Error: Usuario no encontrado.", file=sys.stderr)
+        return 1
+    if not args.offline:
+        refresh_held_prices(args.user)
+    history = load_portfolio_history(args.user, args.period, args.currency)
+    if history.empty:
+        print("ℹ️ El portfolio está vacío.", file=sys.stderr)
+        return 1
+    _write_frame(history.reset_index(), args.out)
+    return 0
+
+def cmd_rules(args):
+    """Muestra, guarda o restablece las reglas de recomendación de un usuario."""
+    if get_user_id(args.user) is None:
+        print("❌ Error: Usuario no encontrado.", file=sys.stderr)
+        return 1
+    if args.set or args.reset:
+        if args.reset:
+            success, message = reset_user_rules(args.user)
+        else:
+            success, message = save_user_rules(args.user, json.loads(Path(args.set).read_text(encoding='utf-8')))
+        print(message, file=sys.stderr)
+        if not success:
+            return 1
+    print(json.dumps(get_user_rules(args.user), indent=2, ensure_ascii=False))
+    return 0
+
+def build_parser():
+    """Parser de argumentos con un subcomando por tarea."""
+    parser = argparse.ArgumentParser(prog='smartfinancial', description="SmartFinancial sin interfaz gráfica.")
+    parser.add_argument('--db', help="Fichero de base de datos (por defecto smartfinancial.db)")
+    parser.add_argument('--trace', metavar='FICHERO',
+                        help="Activa el trazado y guarda tiempos y contadores (.prom/.txt: Prometheus; si no, JSON lines)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('markets', help="Lista los mercados disponibles").set_defaults(func=cmd_markets)
+
+    search = commands.add_parser('search', help="Busca valores por prefijo de ticker o nombre")
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=20, help="Número máximo de resultados")
+    search.set_defaults(func=cmd_search)
+
+    scan = commands.add_parser('scan', help="Carga precios y estadísticas de un mercado")
+    scan.add_argument('--market', required=True, choices=list(MARKETS_DATA), metavar='MERCADO')
+    scan.add_argument('--full', action='store_true',
+                      help="Todos los componentes actuales del índice, no solo la lista representativa")
+    scan.add_argument('--out', help="Fichero de salida (.parquet, .csv o .json); si no, se imprime")
+    scan.set_defaults(func=cmd_scan)
+
+    screener = commands.add_parser('screen', help="Screener de todos los mercados con filtros de señales")
+    screener.add_argument('--market', action='append', choices=list(MARKETS_DATA), metavar='MERCADO',
+                          help="Solo este mercado (se puede repetir)")
+    screener.add_argument('--user', help="Usar las reglas de recomendación de este usuario")
+    screener.add_argument('--cc', choices=['yes', 'no'], help="Exigir (o excluir) la señal de compra a corto")
+    screener.add_argument('--cl', choices=['yes', 'no'], help="Exigir (o excluir) la señal de compra a largo")
+    screener.add_argument('--min-drawdown', type=float, help="Caída mínima (%%) desde el máximo de la ventana")
+    screener.add_argument('--window', default='1y', help="Ventana de la caída desde máximos (por defecto 1y)")
+    screener.add_argument('--sort', help=f"Columna de orden (por defecto la caída; también {', '.join(SCREENER_SORT_COLUMNS)})")
+    screener.add_argument('--ascending', action='store_true', help="Orden ascendente")
+    screener.add_argument('--limit', type=int, help="Número máximo de filas")
+    screener.add_argument('--out', help="Fichero de salida (.parquet, .csv o .json); si no, se imprime")
+    screener.set_defaults(func=cmd_screen)
+
+    history = commands.add_parser('history', help="Evolución diaria del portfolio de un usuario")
+    history.add_argument('--user', required=True)
+    history.add_argument('--period', default='3M', choices=list(VALUATION_PERIODS))
+    history.add_argument('--currency', default='USD', choices=list(BASE_CURRENCIES), help="Moneda base (por defecto USD)")
+    history.add_argument('--out', help="Fichero de salida (.parquet, .csv o .json); si no, se imprime")
+    history.add_argument('--offline', action='store_true', help="No consultar yfinance: solo el almacén local")
+    history.set_defaults(func=cmd_history)
+
+    rules = commands.add_parser('rules', help="Muestra, guarda o restablece las reglas de recomendación de un usuario")
+    rules.add_argument('--user', required=True)
+    rules_action = rules.add_mutually_exclusive_group()
+    rules_action.add_argument('--set', metavar='FICHERO', help="JSON con las reglas a guardar (las que falten quedan por defecto)")
+    rules_action.add_argument('--reset', action='store_true', help="Volver a las reglas por defecto")
+    rules.set_defaults(func=cmd_rules)
+
+    value = commands.add_parser('value', help="Valora el portfolio de un usuario")
+    value.add_argument('--user', required=True)
+    value.add_argument('--currency', default='USD', choices=list(BASE_CURRENCIES), help="Moneda base (por defecto USD)")
+    value.add_argument('--out', help="Fichero de salida (.parquet, .csv o .json); si no, se imprime")
+    value.add_argument('--offline', action='store_true', help="No consultar yfinance: solo el almacén local")
+    value.set_defaults(func=cmd_value)
+    return parser
+
+def main(argv=None):
+    """Punto de entrada; devuelve el código de salida."""
+    args = build_parser().parse_args(argv)
+    if args.db:
+        configure_db(args.db)
+    if args.trace:
+        tracing.set_enabled(True)
+    try:
+        with tracing.span(f'cli.{args.command}'):
+            return args.func(args)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.trace:
+            prometheus = Path(args.trace).suffix.lower() in ('.prom', '.txt')
+            Path(args.trace).write_text(tracing.to_prometheus() if prometheus else tracing.to_jsonl(), encoding='utf-8')
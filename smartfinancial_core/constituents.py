@@ -0,0 +1,184 @@
+"""Componentes de índices obtenidos de Wikipedia, con caché y revalidación condicional."""
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+
+from . import tracing
+from .db import get_connection
+from .providers import get_provider
+from .markets import MARKETS_DATA
+from .symbols import invalidate_symbol_index
+
+# Parser HTML: lxml (mucho más rápido) si está instalado; si no, el de la librería estándar
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Componentes de índices (Wikipedia): segundos antes de revalidar la lista guardada
+CONSTITUENTS_TTL = 7 * 24 * 3600
+
+# Páginas de Wikipedia con los componentes de cada índice
+WIKIPEDIA_CONSTITUENT_URLS = {
+    "IBEX 35 (Madrid)": "https://en.wikipedia.org/wiki/IBEX_35",
+    "CAC 40 (París)": "https://en.wikipedia.org/wiki/CAC_40",
+    "DAX (Alemania)": "https://en.wikipedia.org/wiki/DAX",
+    "FTSE 100 (Londres)": "https://en.wikipedia.org/wiki/FTSE_100_Index",
+    "S&P 500 (USA)": "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies",
+    "NASDAQ (USA Tech)": "https://en.wikipedia.org/wiki/NASDAQ-100",
+    "Nikkei 225 (Tokio)": "https://en.wikipedia.org/wiki/Nikkei_225",
+    "SSE (Shanghái)": "https://en.wikipedia.org/wiki/Shanghai_Stock_Exchange"
+}
+
+# Tickers de EE. UU.: hasta 5 letras y, en las acciones con clases, un sufijo de una letra (BRK.B, BF.B)
+US_TICKER_PATTERN = re.compile(r'[A-Z]{1,5}(\.[A-Z])?')
+
+# Estrategias de extracción según el mercado: clase CSS de las tablas a analizar (SoupStrainer),
+# si solo cuenta la primera, columna del ticker y validación del texto de la celda
+CONSTITUENT_TABLE_RULES = {
+    "IBEX 35 (Madrid)": {'table_class': 'wikitable', 'first_only': False, 'column': 1,
+                         'valid': lambda t: len(t) <= 6},  # Los tickers tienen máximo 6 caracteres
+    "CAC 40 (París)": {'table_class': 'wikitable', 'first_only': False, 'column': 0,
+                       'valid': lambda t: len(t) <= 6 and t.isalpha()},
+    "DAX (Alemania)": {'table_class': 'wikitable', 'first_only': False, 'column': 1,
+                       'valid': lambda t: len(t) <= 6 and t.isalpha()},
+    "FTSE 100 (Londres)": {'table_class': 'wikitable', 'first_only': False, 'column': 0,
+                           'valid': lambda t: len(t) <= 6},
+    # Para S&P 500, solo la tabla de constituents
+    "S&P 500 (USA)": {'table_class': 'wikitable', 'first_only': True, 'column': 0,
+                      'valid': lambda t: US_TICKER_PATTERN.fullmatch(t) is not None},
+    "NASDAQ (USA Tech)": {'table_class': 'wikitable', 'first_only': False, 'column': 0,
+                          'valid': lambda t: US_TICKER_PATTERN.fullmatch(t) is not None},
+    # Los códigos del Nikkei son numéricos (4-5 dígitos)
+    "Nikkei 225 (Tokio)": {'table_class': 'wikitable', 'first_only': False, 'column': 0,
+                           'valid': lambda t: t.isdigit() and len(t) <= 5},
+    # Los códigos de SSE son numéricos (6 dígitos)
+    "SSE (Shanghái)": {'table_class': 'wikitable', 'first_only': False, 'column': 0,
+                       'valid': lambda t: t.isdigit() and len(t) == 6},
+}
+
+@tracing.traced()
+def _parse_constituents(html, nombre_mercado):
+    """Extrae los tickers del HTML analizando solo las tablas relevantes (SoupStrainer)."""
+    rules = CONSTITUENT_TABLE_RULES[nombre_mercado]
+    
+    def has_table_class(value):
+        # Durante el análisis el atributo class llega como texto ("wikitable sortable") o como lista
+        classes = value.split() if isinstance(value, str) else (value or [])
+        return rules['table_class'] in classes
+    
+    only_tables = SoupStrainer('table', attrs={'class': has_table_class})
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=only_tables)
+    tables = soup.find_all('table')
+    if rules['first_only']:
+        tables = tables[:1]
+    
+    tickers_list = []
+    for table in tables:
+        rows = table.find_all('tr')
+        for row in rows[1:]:  # Saltar encabezados
+            cells = row.find_all('td')
+            if len(cells) > rules['column']:
+                ticker = cells[rules['column']].text.strip()
+                if ticker and rules['valid'](ticker):
+                    tickers_list.append(ticker)
+    
+    # Eliminar duplicados y ordenar
+    return sorted(set(tickers_list))
+
+@tracing.traced()
+def get_ticketnamesmarket(nombre_mercado, force_refresh=False):
+    """
+    Obtiene los nombres de tickers de servicios públicos online para un mercado específico.
+    
+    Parámetros:
+    -----------
+    nombre_mercado : str
+        Nombre del mercado (ej: "IBEX 35 (Madrid)", "CAC 40 (París)", etc.)
+    force_refresh : bool
+        Si es True, se revalida con Wikipedia aunque la caché no haya caducado
+    
+    Retorna:
+    --------
+    list
+        Lista de tickers (denominaciones clásicas) del mercado
+    
+    Nota: Los componentes se guardan en la tabla market_constituents junto con las
+    cabeceras ETag/Last-Modified de Wikipedia. Durante CONSTITUENTS_TTL se sirven
+    sin petición alguna; después se revalidan con una petición condicional (304 si
+    no han cambiado). Si Wikipedia no responde se devuelve la última lista guardada.
+    """
+    if nombre_mercado not in WIKIPEDIA_CONSTITUENT_URLS:
+        return []
+    
+    with get_connection() as conn:
+        cached = conn.execute(
+            "SELECT tickers, checked_at, etag, last_modified FROM market_constituents WHERE market = ?",
+            (nombre_mercado,)
+        ).fetchone()
+    cached_tickers = json.loads(cached[0]) if cached else []
+    
+    if cached and not force_refresh and time.time() - cached[1] < CONSTITUENTS_TTL:
+        tracing.count('constituents_cache', outcome='hit')
+        return cached_tickers
+    
+    try:
+        # Realizar petición (condicional si ya hay una versión guardada) a Wikipedia
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        if cached and cached[2]:
+            headers['If-None-Match'] = cached[2]
+        if cached and cached[3]:
+            headers['If-Modified-Since'] = cached[3]
+        
+        response = tracing.timed_call('fetch_url', nombre_mercado, get_provider().fetch_url,
+                                      WIKIPEDIA_CONSTITUENT_URLS[nombre_mercado], headers=headers, timeout=10)
+        
+        if response.status_code == 304:
+            # Sin cambios: solo se renueva la fecha de comprobación
+            tracing.count('constituents_cache', outcome='not_modified')
+            with get_connection() as conn:
+                conn.execute("UPDATE market_constituents SET checked_at = ? WHERE market = ?", (time.time(), nombre_mercado))
+                conn.commit()
+            return cached_tickers
+        
+        response.raise_for_status()
+        tickers_list = _parse_constituents(response.content, nombre_mercado)
+        
+        # Si no se pudo scrapear, se mantiene la última lista guardada
+        if not tickers_list:
+            return cached_tickers
+        
+        tracing.count('constituents_cache', outcome='fetched')
+        now = time.time()
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO market_constituents (market, tickers, fetched_at, checked_at, etag, last_modified) VALUES (?, ?, ?, ?, ?, ?)",
+                (nombre_mercado, json.dumps(tickers_list), now, now,
+                 response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            )
+            conn.commit()
+        return tickers_list
+    
+    except requests.exceptions.RequestException:
+        # Timeout, error de conexión o HTTP: se devuelve la última lista guardada (o vacía)
+        tracing.count('constituents_cache', outcome='fallback')
+        return cached_tickers
+    except Exception:
+        # Para cualquier otro error, igual
+        return cached_tickers
+
+def refresh_all_constituents(force_refresh=False):
+    """Actualiza a la vez los componentes de todos los mercados de MARKETS_DATA con página en Wikipedia."""
+    markets = [market for market in MARKETS_DATA if market in WIKIPEDIA_CONSTITUENT_URLS]
+    with ThreadPoolExecutor(max_workers=len(markets)) as executor:
+        results = dict(zip(markets, executor.map(lambda market: get_ticketnamesmarket(market, force_refresh), markets)))
+    # El índice de símbolos se reconstruye con los componentes nuevos en la próxima búsqueda
+    invalidate_symbol_index()
+    return results
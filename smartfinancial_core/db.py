@@ -0,0 +1,206 @@
+"""Base de datos SQLite: conexiones con pragmas de rendimiento, pool compartido y migraciones del esquema."""
+import sqlite3
+import queue
+import threading
+from contextlib import contextmanager
+
+DB_NAME = 'smartfinancial.db'
+DB_POOL_SIZE = 8                    # conexiones abiertas reutilizables
+DB_BUSY_TIMEOUT = 5                 # segundos de espera si la base de datos está bloqueada
+DB_CACHED_STATEMENTS = 256          # sentencias preparadas reutilizadas por conexión
+
+# Pool del proceso: se crea en la primera conexión (importar el módulo no toca el disco)
+_DB_POOL = None
+_DB_POOL_LOCK = threading.Lock()
+
+def _new_connection():
+    """Abre una conexión a la base de datos con los pragmas de rendimiento."""
+    conn = sqlite3.connect(DB_NAME, timeout=DB_BUSY_TIMEOUT, check_same_thread=False,
+                           cached_statements=DB_CACHED_STATEMENTS)
+    # WAL: los lectores no bloquean al escritor (ni al revés) entre sesiones concurrentes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")  # ~16 MB de caché de páginas
+    return conn
+
+def _create_pool():
+    """Aplica las migraciones y crea un pool nuevo (con _DB_POOL_LOCK adquirido)."""
+    global _DB_POOL
+    conn = _new_connection()
+    init_db(conn)
+    pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+    pool.put(conn)
+    _DB_POOL = pool
+    return pool
+
+def configure_db(db_name=None):
+    """
+    Configura la capa de base de datos: aplica las migraciones y crea el pool de conexiones.
+
+    No hace falta llamarla (la primera conexión la configura con DB_NAME); sirve para usar
+    otro fichero, p. ej. desde la línea de comandos o los benchmarks.
+    """
+    global DB_NAME
+    with _DB_POOL_LOCK:
+        if db_name is not None:
+            DB_NAME = db_name
+        return _create_pool()
+
+def _get_pool():
+    """Devuelve el pool del proceso, creándolo la primera vez."""
+    pool = _DB_POOL
+    if pool is None:
+        with _DB_POOL_LOCK:
+            pool = _DB_POOL or _create_pool()
+    return pool
+
+@contextmanager
+def get_connection():
+    """Presta una conexión del pool (o abre una nueva si no hay libres) y la devuelve al terminar."""
+    pool = _get_pool()
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _new_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()  # Lo no confirmado se descarta antes de reutilizar la conexión
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+# Migraciones del esquema: la posición en la lista es la versión (PRAGMA user_version).
+# Nunca se modifican las ya publicadas; los cambios se añaden como una migración nueva.
+SCHEMA_MIGRATIONS = [
+    # 1: usuarios, portfolio, histórico de precios y caché de metadatos
+    [
+        "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL)",
+        """
+        CREATE TABLE IF NOT EXISTS portfolio (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            shares INTEGER NOT NULL,
+            purchase_price REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        # Histórico local de cierres diarios (uno por ticker y fecha)
+        """
+        CREATE TABLE IF NOT EXISTS price_history (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            close REAL NOT NULL,
+            PRIMARY KEY (ticker, date)
+        ) WITHOUT ROWID
+        """,
+        # Estado de sincronización: desde qué fecha hay histórico y cuándo se consultó yfinance por última vez
+        """
+        CREATE TABLE IF NOT EXISTS price_sync (
+            ticker TEXT PRIMARY KEY,
+            first_date TEXT NOT NULL,
+            last_sync TEXT NOT NULL
+        )
+        """,
+        # Caché persistente de metadatos (.info) con marcas de tiempo por campo y último acceso (LRU)
+        """
+        CREATE TABLE IF NOT EXISTS ticker_metadata (
+            ticker TEXT PRIMARY KEY,
+            long_name TEXT,
+            name_updated REAL,
+            price REAL,
+            price_updated REAL,
+            last_access REAL NOT NULL
+        )
+        """,
+    ],
+    # 2: índices y tabla resumen de posiciones mantenida al añadir/eliminar valores
+    [
+        "CREATE INDEX IF NOT EXISTS idx_portfolio_user_ticker ON portfolio (user_id, ticker)",
+        "CREATE INDEX IF NOT EXISTS idx_ticker_metadata_last_access ON ticker_metadata (last_access)",
+        """
+        CREATE TABLE IF NOT EXISTS positions (
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            total_shares INTEGER NOT NULL,
+            total_cost REAL NOT NULL,
+            PRIMARY KEY (user_id, ticker)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT OR REPLACE INTO positions (user_id, ticker, total_shares, total_cost)
+        SELECT user_id, ticker, SUM(shares), SUM(shares * purchase_price) FROM portfolio GROUP BY user_id, ticker
+        """,
+    ],
+    # 3: caché de componentes de índices con cabeceras para peticiones condicionales
+    [
+        """
+        CREATE TABLE IF NOT EXISTS market_constituents (
+            market TEXT PRIMARY KEY,
+            tickers TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            checked_at REAL NOT NULL,
+            etag TEXT,
+            last_modified TEXT
+        )
+        """,
+    ],
+    # 4: reglas de recomendación de cada usuario (JSON validado por rules.validate_rules)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS user_rules (
+            user_id INTEGER PRIMARY KEY,
+            rules TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+    ],
+    # 5: fecha de compra de cada lote (AAAA-MM-DD) para la evolución diaria del portfolio;
+    # los lotes anteriores quedan sin fecha y cuentan como comprados antes de cualquier periodo
+    [
+        "ALTER TABLE portfolio ADD COLUMN purchase_date TEXT",
+    ],
+    # 6: moneda de cotización de cada ticker (dato estático, caduca con el nombre)
+    [
+        "ALTER TABLE ticker_metadata ADD COLUMN currency TEXT",
+    ],
+    # 7: última consulta de .info sin datos (tickers deslistados o inexistentes), para no
+    # volver a pedirlos hasta que caduque (METADATA_FAILURE_TTL)
+    [
+        "ALTER TABLE ticker_metadata ADD COLUMN info_failed_at REAL",
+    ],
+    # 8: última descarga de cotizaciones sin precio para el ticker (igual que info_failed_at)
+    [
+        "ALTER TABLE ticker_metadata ADD COLUMN quote_failed_at REAL",
+    ],
+    # 9: tipo de cotización de yfinance (EQUITY, ETF...); un ticker sin nombre ni tipo no existe.
+    # Se descartan los nombres que eran el propio ticker (antes se guardaba así un .info sin nombre)
+    [
+        "ALTER TABLE ticker_metadata ADD COLUMN quote_type TEXT",
+        "UPDATE ticker_metadata SET long_name = NULL, name_updated = NULL WHERE long_name = ticker",
+    ],
+    # 10: las listas guardadas antes de aceptar tickers con clase (BRK.B) se descargan de nuevo;
+    # sin ETag ni Last-Modified la revalidación no puede responder 304 con la lista incompleta
+    [
+        "UPDATE market_constituents SET checked_at = 0, etag = NULL, last_modified = NULL",
+    ],
+]
+
+def init_db(conn):
+    """Inicializa la base de datos aplicando las migraciones pendientes, cada una en su propia transacción."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for new_version, statements in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {new_version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
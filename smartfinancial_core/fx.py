@@ -0,0 +1,66 @@
+"""Divisas: moneda de cotización de cada ticker y conversión vectorizada con tipos de cambio en caché."""
+import numpy as np
+import pandas as pd
+
+from . import tracing
+from .market_data import get_latest_quotes, get_ticker_metadata, read_cached_quotes
+
+# Monedas base que se pueden elegir para valorar el portfolio
+BASE_CURRENCIES = ('USD', 'EUR', 'GBP', 'JPY', 'CNY')
+CURRENCY_SYMBOLS = {'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥', 'CNY': 'CN¥'}
+
+# Tipos de cambio: se descargan como mucho una vez al día, todos en una sola descarga en bloque
+FX_RATE_TTL = 24 * 3600
+# Todos los cruces se calculan a partir de <MONEDA>USD=X (una sola serie por moneda)
+FX_PIVOT = 'USD'
+
+# Subunidades con las que cotizan algunos mercados (peniques en Londres): moneda -> (moneda, factor)
+MINOR_CURRENCIES = {'GBp': ('GBP', 0.01), 'GBX': ('GBP', 0.01), 'ZAc': ('ZAR', 0.01), 'ILA': ('ILS', 0.01)}
+
+# Moneda por sufijo de ticker cuando yfinance no la da (o aún no está en caché)
+SUFFIX_CURRENCIES = {'.MC': 'EUR', '.PA': 'EUR', '.DE': 'EUR', '.L': 'GBp', '.T': 'JPY', '.SS': 'CNY', '-USD': 'USD'}
+
+def guess_currency(ticker):
+    """Moneda de cotización deducida del sufijo del ticker (USD si no tiene)."""
+    for suffix, currency in SUFFIX_CURRENCIES.items():
+        if ticker.endswith(suffix):
+            return currency
+    return 'USD'
+
+def ticker_currencies(tickers, fetch=True):
+    """{ticker: moneda de cotización} desde la caché de metadatos (o deducida del sufijo)."""
+    metadata = get_ticker_metadata(tickers, fetch=fetch)
+    return {ticker: metadata[ticker].get('currency') or guess_currency(ticker) for ticker in metadata}
+
+def _major(currency):
+    """Moneda principal y factor de una moneda (GBp -> ('GBP', 0.01))."""
+    return MINOR_CURRENCIES.get(currency, (currency, 1.0))
+
+def fx_pair(currency):
+    """Ticker de yfinance del cambio de `currency` a la moneda pivote."""
+    return f"{currency}{FX_PIVOT}=X"
+
+@tracing.traced()
+def get_fx_rates(currencies, base, fetch=True):
+    """
+    {moneda: unidades de `base` por unidad de moneda} para una lista de monedas.
+
+    Las cotizaciones <MONEDA>USD=X que falten o tengan más de FX_RATE_TTL se piden juntas en
+    una sola descarga (get_latest_quotes); con `fetch=False` solo se lee la caché, sin importar
+    su antigüedad. Las monedas sin tipo de cambio disponible quedan como NaN.
+    """
+    majors = {currency: _major(currency) for currency in dict.fromkeys(currencies)}
+    needed = sorted(({major for major, _ in majors.values()} | {base}) - {FX_PIVOT})
+    pairs = [fx_pair(currency) for currency in needed]
+    if fetch:
+        quotes = get_latest_quotes(pairs, max_age=FX_RATE_TTL)
+    else:
+        quotes = {pair: price for pair, (price, _) in read_cached_quotes(pairs).items()}
+
+    to_pivot = {currency: quotes.get(fx_pair(currency), np.nan) for currency in needed}
+    to_pivot[FX_PIVOT] = 1.0
+    return {currency: factor * to_pivot[major] / to_pivot[base] for currency, (major, factor) in majors.items()}
+
+def convert(values, currencies, rates):
+    """Convierte una columna de importes con su columna de monedas (misma longitud) multiplicando por el tipo de cada fila."""
+    return values * pd.Series(list(currencies)).map(rates).to_numpy(dtype='float64')
@@ -0,0 +1,312 @@
+"""Datos de mercado: histórico local de cierres, caché de metadatos y cotizaciones de yfinance."""
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from . import tracing
+from .db import get_connection
+from .providers import get_provider
+
+# Caché de metadatos de tickers (.info): caducidad distinta para datos estáticos y volátiles
+METADATA_NAME_TTL = 7 * 24 * 3600   # nombres: días
+METADATA_PRICE_TTL = 60             # precios: segundos
+METADATA_FAILURE_TTL = 3600         # tickers sin datos: segundos antes de volver a pedirlos
+METADATA_MAX_ENTRIES = 5000         # tamaño máximo (se expulsan los menos usados)
+METADATA_ACCESS_RESOLUTION = 3600   # el último acceso (LRU) solo se reescribe si tiene más de esto
+METADATA_FETCH_WORKERS = 8          # consultas .info simultáneas al rellenar en bloque
+
+# Descargas de histórico simultáneas dentro de cada batch
+DOWNLOAD_WORKERS_PER_BATCH = 5
+
+# --- HISTÓRICO DE PRECIOS (ALMACÉN LOCAL) ---
+
+@tracing.traced()
+def sync_price_history(tickers, start, end):
+    """
+    Sincroniza el histórico local de cierres con yfinance.
+
+    Solo se piden a yfinance las barras posteriores a la última fecha almacenada
+    de cada ticker (o la ventana completa si aún no hay datos desde `start`).
+    Los tickers ya sincronizados hoy no generan ninguna petición y el resto se descarga
+    en paralelo (DOWNLOAD_WORKERS_PER_BATCH a la vez).
+    """
+    provider = get_provider()
+    placeholders = ','.join('?' * len(tickers))
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT ticker, first_date, last_sync FROM price_sync WHERE ticker IN ({placeholders})", tickers)
+        sync_info = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        cursor.execute(f"SELECT ticker, MAX(date) FROM price_history WHERE ticker IN ({placeholders}) GROUP BY ticker", tickers)
+        last_dates = dict(cursor.fetchall())
+
+    # Agrupar los tickers por fecha de inicio de descarga para pedirlos en bloque
+    pending = {}
+    for ticker in tickers:
+        first_date, last_sync = sync_info.get(ticker, (None, None))
+        if first_date is None or first_date > start:
+            fetch_from = start
+        elif last_sync >= end:
+            continue
+        else:
+            # Se vuelve a pedir la última barra almacenada por si estaba incompleta
+            fetch_from = last_dates.get(ticker, last_sync)
+        pending.setdefault(fetch_from, []).append(ticker)
+    fetched = sum(len(group) for group in pending.values())
+    tracing.count('price_sync', outcome='up_to_date', n=len(tickers) - fetched)
+    tracing.count('price_sync', outcome='fetched', n=fetched)
+
+    for fetch_from, group in pending.items():
+        with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS_PER_BATCH, len(group))) as executor:
+            futures = [executor.submit(tracing.timed_call, 'history', ticker, provider.history, ticker, fetch_from, end) for ticker in group]
+
+        rows = []
+        synced = []
+        for ticker, future in zip(group, futures):
+            try:
+                close = future.result()
+            except Exception:
+                continue  # Error de red: se reintentará en la próxima sincronización
+            synced.append(ticker)
+            rows.extend((ticker, date.strftime('%Y-%m-%d'), float(price)) for date, price in close.dropna().items())
+
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT OR REPLACE INTO price_history (ticker, date, close) VALUES (?, ?, ?)", rows)
+            for ticker in synced:
+                first_date = sync_info.get(ticker, (None, None))[0]
+                first_date = min(first_date, fetch_from) if first_date else fetch_from
+                cursor.execute(
+                    "INSERT OR REPLACE INTO price_sync (ticker, first_date, last_sync) VALUES (?, ?, ?)",
+                    (ticker, first_date, end)
+                )
+            conn.commit()
+
+@tracing.traced()
+def get_price_history(tickers, days, sync=True, dtype='float64'):
+    """
+    Devuelve los cierres diarios de los últimos `days` días (índice fecha, una columna por ticker) desde el almacén local.
+
+    Con `sync=False` no se consulta yfinance: se devuelve lo que ya esté almacenado. `dtype`
+    es el tipo de los cierres (float32 para las cargas de mercados completos).
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return pd.DataFrame()
+
+    end_date = datetime.now()
+    start = (end_date - timedelta(days=days)).strftime('%Y-%m-%d')
+    end = end_date.strftime('%Y-%m-%d')
+    if sync:
+        sync_price_history(tickers, start, end)
+
+    placeholders = ','.join('?' * len(tickers))
+    with get_connection() as conn:
+        rows = pd.read_sql_query(
+            f"SELECT ticker, date, close FROM price_history WHERE ticker IN ({placeholders}) AND date >= ? AND date < ?",
+            conn, params=(*tickers, start, end), dtype={'close': dtype}
+        )
+
+    if rows.empty:
+        return pd.DataFrame()
+    close = rows.pivot(index='date', columns='ticker', values='close')
+    close.index = pd.to_datetime(close.index)
+    return close[[ticker for ticker in tickers if ticker in close.columns]]
+
+# --- METADATOS DE TICKERS (CACHÉ LOCAL) ---
+
+def _fetch_info(ticker):
+    """Consulta .info de yfinance para un ticker: dict vacío si no hay datos y None si falla la red."""
+    try:
+        return tracing.timed_call('info', ticker, get_provider().info, ticker) or {}
+    except Exception:
+        return None
+
+def _recently_failed(failed_at, now):
+    """True si la última consulta sin datos tiene menos de METADATA_FAILURE_TTL segundos."""
+    return failed_at is not None and now - failed_at <= METADATA_FAILURE_TTL
+
+def _touch_metadata(conn, last_access, now):
+    """Marca el acceso (LRU) de las entradas leídas, solo las que lo tienen más antiguo que METADATA_ACCESS_RESOLUTION."""
+    touched = [ticker for ticker, accessed in last_access.items() if now - accessed > METADATA_ACCESS_RESOLUTION]
+    if touched:
+        conn.execute(f"UPDATE ticker_metadata SET last_access = ? WHERE ticker IN ({','.join('?' * len(touched))})",
+                     (now, *touched))
+    return bool(touched)
+
+def _evict_metadata(conn):
+    """Expulsa las entradas menos usadas por encima de METADATA_MAX_ENTRIES."""
+    conn.execute(
+        "DELETE FROM ticker_metadata WHERE ticker NOT IN (SELECT ticker FROM ticker_metadata ORDER BY last_access DESC LIMIT ?)",
+        (METADATA_MAX_ENTRIES,)
+    )
+
+@tracing.traced()
+def get_ticker_metadata(tickers, with_price=False, fetch=True):
+    """
+    Devuelve {ticker: {'long_name': ..., 'price': ..., 'currency': ..., 'quote_type': ..., 'no_data': ...}}
+    desde la caché de metadatos.
+
+    Solo se consulta .info (en paralelo) para los tickers no consultados o con el nombre
+    caducado y, si `with_price` es True, también para los que tengan el precio caducado.
+    Los tickers cuya última consulta no devolvió datos (ni nombre ni tipo de cotización,
+    como un símbolo inexistente) no se vuelven a pedir hasta pasados
+    METADATA_FAILURE_TTL segundos. Con `fetch=False` no se consulta nada y se devuelve solo lo
+    que haya en caché. Los precios caducados se devuelven como None. 'no_data' es True si yfinance
+    respondió sin datos (el ticker no existe); sin nombre y con 'no_data' False no se pudo consultar.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+
+    now = time.time()
+    placeholders = ','.join('?' * len(tickers))
+    with get_connection() as conn:
+        cursor = conn.execute(
+            f"SELECT ticker, long_name, name_updated, price, price_updated, currency, quote_type, info_failed_at, last_access "
+            f"FROM ticker_metadata WHERE ticker IN ({placeholders})",
+            tickers
+        )
+        rows = cursor.fetchall()
+    cached = {row[0]: list(row[1:7]) for row in rows}
+    failed_at = {row[0]: row[7] for row in rows}
+    last_access = {row[0]: row[8] for row in rows}
+
+    def is_stale(ticker):
+        if _recently_failed(failed_at.get(ticker), now):
+            return False
+        _, name_updated, price, price_updated, _, _ = cached.get(ticker, [None] * 6)
+        if name_updated is None or now - name_updated > METADATA_NAME_TTL:
+            return True
+        return with_price and (price is None or now - price_updated > METADATA_PRICE_TTL)
+
+    stale = [ticker for ticker in tickers if is_stale(ticker)] if fetch else []
+    tracing.count('metadata_cache', outcome='hit', n=len(tickers) - len(stale))
+    tracing.count('metadata_cache', outcome='miss', n=len(stale))
+    fetched, failed = [], []
+    if stale:
+        with ThreadPoolExecutor(max_workers=min(METADATA_FETCH_WORKERS, len(stale))) as executor:
+            infos = list(executor.map(_fetch_info, stale))
+
+        for ticker, info in zip(stale, infos):
+            if info is None:
+                continue  # Error de red: se reintentará en la próxima consulta
+            long_name = info.get('longName') or info.get('shortName')
+            quote_type = info.get('quoteType') if info.get('quoteType') not in (None, 'NONE') else None
+            if long_name is None and quote_type is None:
+                # Sin datos (yfinance devuelve algo como {'trailingPegRatio': None} para un símbolo que no
+                # existe): no se vuelve a pedir hasta pasados METADATA_FAILURE_TTL segundos
+                failed.append(ticker)
+                failed_at[ticker] = now
+                continue
+            entry = cached.setdefault(ticker, [None] * 6)
+            entry[0:2] = [long_name, now]
+            price = info.get('currentPrice') or info.get('regularMarketPrice')
+            if price:
+                entry[2:4] = [float(price), now]
+            entry[4] = info.get('currency') or entry[4]
+            entry[5] = quote_type
+            failed_at[ticker] = None
+            fetched.append(ticker)
+
+    # Guardar lo consultado y marcar el acceso; las lecturas de la caché no escriben salvo para
+    # renovar un último acceso antiguo
+    with get_connection() as conn:
+        written = _touch_metadata(conn, {ticker: accessed for ticker, accessed in last_access.items()
+                                         if ticker not in fetched and ticker not in failed}, now)
+        if fetched or failed:
+            conn.executemany(
+                """
+                INSERT INTO ticker_metadata (ticker, long_name, name_updated, price, price_updated, currency, quote_type,
+                    info_failed_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(ticker) DO UPDATE SET long_name = excluded.long_name, name_updated = excluded.name_updated,
+                    price = excluded.price, price_updated = excluded.price_updated, currency = excluded.currency,
+                    quote_type = excluded.quote_type, info_failed_at = excluded.info_failed_at, last_access = excluded.last_access
+                """,
+                [(ticker, *cached[ticker], None, now) for ticker in fetched]
+                + [(ticker, *cached.get(ticker, [None] * 6), now, now) for ticker in failed]
+            )
+            _evict_metadata(conn)
+        if written or fetched or failed:
+            conn.commit()
+
+    metadata = {}
+    for ticker in tickers:
+        long_name, _, price, price_updated, currency, quote_type = cached.get(ticker, [None] * 6)
+        fresh_price = price if price is not None and now - price_updated <= METADATA_PRICE_TTL else None
+        metadata[ticker] = {'long_name': long_name, 'price': fresh_price, 'currency': currency, 'quote_type': quote_type,
+                            'no_data': _recently_failed(failed_at.get(ticker), now)}
+    return metadata
+
+@tracing.traced()
+def read_cached_quotes(tickers):
+    """Devuelve {ticker: (último precio publicado, marca de tiempo)} de la caché de metadatos, sin consultar yfinance."""
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+    placeholders = ','.join('?' * len(tickers))
+    with get_connection() as conn:
+        cursor = conn.execute(
+            f"SELECT ticker, price, price_updated FROM ticker_metadata WHERE ticker IN ({placeholders}) AND price IS NOT NULL",
+            tickers
+        )
+        return {ticker: (price, updated) for ticker, price, updated in cursor.fetchall()}
+
+@tracing.traced()
+def get_latest_quotes(tickers, max_age=METADATA_PRICE_TTL):
+    """
+    Devuelve {ticker: último precio} para una lista de tickers con una única descarga en bloque.
+
+    Los precios de la caché de metadatos con menos de `max_age` segundos se reutilizan;
+    el resto se piden juntos a yfinance y se guardan en la caché. Los tickers para los que
+    la última descarga no trajo precio no se vuelven a pedir hasta pasados
+    METADATA_FAILURE_TTL segundos (no aparecen en el resultado). Si la descarga falla por la
+    red solo se devuelven los precios de la caché.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+
+    now = time.time()
+    placeholders = ','.join('?' * len(tickers))
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"SELECT ticker, price, price_updated, quote_failed_at FROM ticker_metadata WHERE ticker IN ({placeholders})",
+            tickers
+        ).fetchall()
+    quotes = {ticker: price for ticker, price, updated, _ in rows if price is not None and updated >= now - max_age}
+    failed = {ticker for ticker, _, _, failed_at in rows if ticker not in quotes and _recently_failed(failed_at, now)}
+
+    missing = [ticker for ticker in tickers if ticker not in quotes and ticker not in failed]
+    tracing.count('quote_cache', outcome='hit', n=len(quotes))
+    tracing.count('quote_cache', outcome='failed', n=len(failed))
+    tracing.count('quote_cache', outcome='miss', n=len(missing))
+    if missing:
+        # Descarga en bloque: su latencia se registra con el ticker '*'
+        try:
+            close = tracing.timed_call('recent_closes', '*', get_provider().recent_closes, missing)
+        except Exception:
+            # Error de red: no cuenta como descarga sin precio, se reintentará en la próxima consulta
+            tracing.count('quote_cache', outcome='error', n=len(missing))
+            return {ticker: quotes[ticker] for ticker in tickers if ticker in quotes}
+        fetched = {}
+        if not close.empty:
+            last_prices = close.ffill().iloc[-1].dropna()
+            fetched = {ticker: float(price) for ticker, price in last_prices.items()}
+            quotes.update(fetched)
+        with get_connection() as conn:
+            conn.executemany(
+                """
+                INSERT INTO ticker_metadata (ticker, price, price_updated, quote_failed_at, last_access) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(ticker) DO UPDATE SET price = coalesce(excluded.price, price),
+                    price_updated = coalesce(excluded.price_updated, price_updated),
+                    quote_failed_at = excluded.quote_failed_at, last_access = excluded.last_access
+                """,
+                [(ticker, fetched[ticker], now, None, now) if ticker in fetched else (ticker, None, None, now, now)
+                 for ticker in missing]
+            )
+            conn.commit()
+
+    return {ticker: quotes[ticker] for ticker in tickers if ticker in quotes}
@@ -0,0 +1,393 @@
+"""Mercados: componentes de cada índice y carga de precios y estadísticas por batches."""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from . import tracing
+from .fx import guess_currency
+from .market_data import get_price_history, get_ticker_metadata, get_latest_quotes
+from .stats import compute_window_stats, stats_history_days
+
+# Descarga de mercados: tickers por batch y batches procesados a la vez
+MARKET_BATCH_SIZE = 20
+MARKET_BATCH_WORKERS = 4
+
+# Memoria máxima por acción de una tabla de mercado (to_market_table) guardada en una sesión
+MARKET_TABLE_BYTES_PER_ROW = 256
+
+# Caché de mercados compartida por todas las sesiones: segundos que se sirve una tabla (el precio
+# actual puede tener esa antigüedad) y memoria máxima de todas las tablas (se expulsan las menos usadas)
+MARKET_CACHE_TTL = 300
+MARKET_CACHE_MAX_BYTES = 64 * 2**20
+
+# Base de datos de mercados con sus índices
+MARKETS_DATA = {
+    "IBEX 35 (Madrid)": {
+        "suffix": ".MC",
+        "index": "^IBEX"
+    },
+    "CAC 40 (París)": {
+        "suffix": ".PA",
+        "index": "^FCHI"
+    },
+    "DAX (Alemania)": {
+        "suffix": ".DE",
+        "index": "^GDAXI"
+    },
+    "FTSE 100 (Londres)": {
+        "suffix": ".L",
+        "index": "^FTSE"
+    },
+    "S&P 500 (USA)": {
+        "suffix": "",
+        "index": "^GSPC"
+    },
+    "NASDAQ (USA Tech)": {
+        "suffix": "",
+        "index": "^IXIC"
+    },
+    "Nikkei 225 (Tokio)": {
+        "suffix": ".T",
+        "index": "^N225"
+    },
+    "SSE (Shanghái)": {
+        "suffix": ".SS",
+        "index": "000001.SS"
+    },
+    "Cryptomonedas (USD)": {
+        "suffix": "-USD",
+        "index": ""
+    }
+}
+
+def _yahoo_symbol(ticker):
+    """Ticker de un componente tal como lo espera yfinance (BRK.B -> BRK-B)."""
+    return ticker.strip().upper().replace('.', '-')
+
+def get_market_tickers(market_name, full_universe=False):
+    """
+    Lista de tickers (con sufijo) de un mercado, o lista vacía si no hay componentes definidos.
+
+    Con `full_universe` se usan los componentes actuales del índice (get_ticketnamesmarket:
+    caché local, revalidada con Wikipedia cada CONSTITUENTS_TTL) en lugar de la lista
+    representativa; si no se pueden obtener, se vuelve a la lista representativa.
+    """
+    suffix = MARKETS_DATA.get(market_name, {}).get("suffix", "")
+    if full_universe:
+        # Import diferido: constituents importa este módulo (y requests/bs4, que la app no necesita al arrancar)
+        from .constituents import get_ticketnamesmarket
+        constituents = get_ticketnamesmarket(market_name)
+        if constituents:
+            return list(dict.fromkeys(f"{_yahoo_symbol(ticker)}{suffix}" for ticker in constituents))
+    
+    # Intentar obtener componentes del índice (varían según la fuente)
+    # Para cada mercado, obtener la lista de componentes disponible
+    tickers = []
+    
+    if market_name == "IBEX 35 (Madrid)":
+        # Componentes del IBEX 35 - Lista completa actualizada
+        tickers = ["ACS","ACX","AMS","ANA","ANE","BBVA","BKT","CABK",
+                    "CLNX","COL","AENA","ELE","ENG","FDR","FER","GRF","IAG","IBE","IDR","ITX","LOG","MAP","MRL","MTS",
+                    "NTGY","PUIG","RED","REP","ROVI","SAB",
+                    "SAN","SCYR","SLR","TEF","UNI"]
+    elif market_name == "CAC 40 (París)":
+        tickers = ["OR", "CS", "AIR", "CA", "DPT", "EI", "FP", "GLE", "HO",
+                  "KER", "LMT", "MC", "MIC", "ML", "MR", "MT", "NWL", "ORA",
+                  "RI", "SAF", "SGO", "STM", "SU", "SW", "URW", "VIE", "WFT", "BN", "CDI", "EN"]
+    elif market_name == "DAX (Alemania)":
+        tickers = ["SAP", "SIE", "ADS", "BMW", "BAS", "BAY", "BEI", "CON",
+                  "DAI", "DBK", "EXE", "FRE", "HEI", "HNR", "IFX", "LIN",
+                  "MRK", "MUV2", "RWE", "VOW3", "ZAL", "ZIM", "VNA", "LHA", "RXO", "QIA", "PUM"]
+    elif market_name == "FTSE 100 (Londres)":
+        tickers = ["LLOY", "HSBA", "BARB", "GLEN", "RB", "AZN", "GSK", "ULVR",
+                  "BP", "SHEL", "PPHM", "SMDS", "CRH", "RIO", "STAN",
+                  "EVR", "REL", "KGF", "ICP", "LGEN", "BARC", "NWG", "PSH", "PNN", "SVT", "EXPN"]
+    elif market_name == "S&P 500 (USA)":
+        # Los 500 componentes del S&P 500 - aquí incluimos una lista representativa
+        # En producción, se podría usar una API de SP Global o una fuente más completa
+        tickers = ["AAPL", "MSFT", "GOOGL", "GOOG", "AMZN", "NVDA", "META", "TSLA", "BRK.B",
+                  "JPM", "JNJ", "V", "WMT", "XOM", "CVX", "MCD", "KO", "DIS", "BA", "GE",
+                  "INTC", "AMD", "IBM", "CSCO", "ORCL", "CRM", "NFLX", "PYPL", "ADBE", "QCOM",
+                  "MU", "AVGO", "TXN", "TSM", "ASML", "NOW", "INTU", "AMAT", "LRCX", "CDNS",
+                  "SNPS", "ACN", "ADSK", "ADP", "ANSS", "APPF", "ASNA", "BAND", "BLDR", "BRKS",
+                  "BX", "CACI", "CAL", "CASS", "CBPO", "CBSH", "CDAY", "CDW", "CFRT", "CHGG"]
+    elif market_name == "NASDAQ (USA Tech)":
+        tickers = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "GOOG", "META", "TSLA", "ASML",
+                  "ADA", "AVGO", "CDNS", "CMCSA", "COST", "CTAS", "CSCO", "CRWD",
+                  "FANG", "JBLU", "NFLX", "PYPL", "QCOM", "ROKU", "SNPS", "VRSK", "AMD", "INTC",
+                  "AMAT", "LRCX", "MU", "MCHP", "MRVL", "NXPI", "ON", "PANW", "PD", "PLTR",
+                  "PSTG", "SSNC", "STX", "STWD", "SWKS", "TCOM", "TEAM", "TEVA", "TKLF", "TLRY"]
+    elif market_name == "Nikkei 225 (Tokio)":
+        tickers = ["6758", "8306", "9984", "7203", "6861", "8031", "9433", "4503",
+                  "4522", "5108", "8058", "9201", "9202", "6504", "8035", "9062",
+                  "5411", "7267", "2768", "6273", "9605", "7211", "3405", "5201", "8604"]
+    elif market_name == "SSE (Shanghái)":
+        tickers = ["600000", "600004", "600008", "600009", "600010", "600011",
+                  "600012", "600015", "600016", "600017", "600018", "600019",
+                  "600020", "600021", "600022", "600023", "600028", "600030", "600031", "600033",
+                  "600035", "600036", "600037", "600038", "600039", "600048", "600050"]
+    elif market_name == "Cryptomonedas (USD)":
+        # Principales criptomonedas (se les añadirá el sufijo '-USD' definido en MARKETS_DATA)
+        tickers = [
+            "BTC", "ETH", "BNB", "USDT", "USDC", "ADA", "XRP", "SOL",
+            "DOGE", "DOT", "LTC", "AVAX", "MATIC", "LINK", "TRX", "ATOM"
+        ]
+    
+    # Agregar suffix a los tickers (con el formato de yfinance)
+    return [f"{_yahoo_symbol(ticker)}{suffix}" for ticker in tickers if ticker]
+
+@tracing.traced()
+def _process_market_batch(batch_tickers, history_days):
+    """Histórico (solo cierres, en float32) y estadísticas de un batch. Devuelve (estadísticas, último cierre, fallos)."""
+    try:
+        close = get_price_history(batch_tickers, history_days, dtype='float32')
+        stats = compute_window_stats(close)
+        # Un batch sin ningún dato (todos deslistados) no tiene último cierre: todos sus tickers fallan
+        last_close = close[stats.index].ffill().iloc[-1] if not stats.empty else None
+    except Exception as e:
+        return None, None, [(ticker, f"Error en batch: {str(e)[:40]}") for ticker in batch_tickers]
+    
+    failed = []
+    for ticker in batch_tickers:
+        if ticker not in close.columns:
+            failed.append((ticker, "Sin datos históricos en yfinance"))
+        elif ticker not in stats.index:
+            failed.append((ticker, "Datos históricos vacíos"))
+    return stats, last_close, failed
+
+@tracing.traced()
+def _market_batch_rows(stats, last_close, quotes):
+    """Nombres y precios actuales (de `quotes`) de un batch ya calculado. Devuelve (filas, fallos)."""
+    if stats is None or stats.empty:
+        return [], []
+    available = stats.index.tolist()
+    metadata = get_ticker_metadata(available)
+    stats_rows = stats.astype(object).where(stats.notna(), None).to_dict('index')
+    
+    rows, failed = [], []
+    for ticker in available:
+        # Si no tenemos precio actual de yfinance, usamos el último cierre
+        current_price = quotes.get(ticker) or float(last_close[ticker])
+        if not current_price:
+            failed.append((ticker, "No hay precio actual disponible"))
+            continue
+        
+        rows.append({
+            'ticker': ticker,
+            'name': metadata[ticker]['long_name'] or ticker,
+            'currency': metadata[ticker]['currency'] or guess_currency(ticker),
+            'current_price': current_price,
+            **stats_rows[ticker]
+        })
+    return rows, failed
+
+def iter_ticker_batches(tickers):
+    """
+    Carga una lista de tickers batch a batch y entrega cada uno en cuanto está listo.
+
+    Genera dicts {'rows', 'failed', 'done', 'total'} en el orden de los batches. Como mucho
+    hay MARKET_BATCH_WORKERS batches en vuelo, así que la memoria no crece con el número de
+    tickers. Los precios actuales de todos los tickers se piden en una sola descarga en bloque,
+    en paralelo con el histórico de los primeros batches.
+    """
+    # Histórico para la ventana más larga, servido desde el almacén local
+    history_days = stats_history_days()
+    batches = iter([tickers[i:i + MARKET_BATCH_SIZE] for i in range(0, len(tickers), MARKET_BATCH_SIZE)])
+    done = 0
+    
+    with ThreadPoolExecutor(max_workers=MARKET_BATCH_WORKERS + 1) as executor:
+        quotes = executor.submit(get_latest_quotes, tickers)
+        # Ventana deslizante: se encola un batch nuevo por cada uno que se entrega
+        pending = deque(executor.submit(_process_market_batch, batch, history_days)
+                        for batch in islice(batches, MARKET_BATCH_WORKERS))
+        while pending:
+            stats, last_close, failed = pending.popleft().result()
+            next_batch = next(batches, None)
+            if next_batch is not None:
+                pending.append(executor.submit(_process_market_batch, next_batch, history_days))
+            
+            # Nombres y precios en el hilo que consume, con los batches siguientes ya en marcha
+            rows, unpriced = _market_batch_rows(stats, last_close, quotes.result())
+            done += len(rows) + len(failed) + len(unpriced)
+            yield {'rows': rows, 'failed': failed + unpriced, 'done': done, 'total': len(tickers)}
+
+def iter_stock_data_for_market(market_name, full_universe=False):
+    """
+    Carga un mercado batch a batch (ver iter_ticker_batches); con `full_universe`, todos sus componentes.
+
+    Lanza ValueError si el mercado no existe o no tiene acciones definidas.
+    """
+    if market_name not in MARKETS_DATA:
+        raise ValueError("❌ Mercado no encontrado.")
+    
+    full_tickers = get_market_tickers(market_name, full_universe)
+    if not full_tickers:
+        raise ValueError("❌ No se encontraron acciones para este mercado.")
+    
+    yield from iter_ticker_batches(full_tickers)
+
+def get_stock_data_for_market(market_name, full_universe=False):
+    """
+    Obtiene datos de precios y estadísticas para todas las acciones de un mercado.
+
+    Devuelve (lista de acciones o None, tickers fallidos como [(ticker, motivo)], mensaje).
+    """
+    try:
+        stock_list, failed_tickers = [], []
+        for batch in iter_stock_data_for_market(market_name, full_universe):
+            stock_list.extend(batch['rows'])
+            failed_tickers.extend(batch['failed'])
+    except ValueError as e:
+        return None, [], str(e)
+    except Exception as e:
+        return None, [], f"❌ Error al cargar datos del mercado: {e}"
+    
+    return stock_list or None, failed_tickers, market_load_message(stock_list, failed_tickers)
+
+def to_market_table(rows):
+    """
+    Tabla columnar compacta de un mercado, indexada por ticker, a partir de sus filas.
+
+    Precios y estadísticas en float32, tickers y nombres como cadenas Arrow (un búfer por
+    columna en lugar de un objeto Python por celda) y la moneda categórica. Es lo que guarda
+    cada sesión; ocupa menos de MARKET_TABLE_BYTES_PER_ROW por acción.
+    """
+    table = pd.DataFrame.from_records(rows, columns=None if rows else ['ticker', 'name', 'currency', 'current_price'])
+    price_columns = [column for column in table if column == 'current_price' or column.startswith('price_')]
+    table = table.astype({'ticker': 'string[pyarrow]', 'name': 'string[pyarrow]', 'currency': 'category',
+                          **dict.fromkeys(price_columns, 'float32')})
+    return table.set_index('ticker')
+
+def concat_market_tables(tables):
+    """Une tablas compactas de varios batches manteniendo sus tipos (la moneda, categórica)."""
+    table = pd.concat(tables) if len(tables) > 1 else tables[0]
+    return table.astype({'currency': 'category'})
+
+def market_table_bytes(table):
+    """Memoria que ocupa una tabla de mercado (con el índice)."""
+    return int(table.memory_usage(index=True, deep=True).sum())
+
+# --- Caché de mercados compartida (una carga por mercado aunque lo pidan muchas sesiones) ---
+
+# Tablas por (mercado, días de histórico, día de cotización), de la menos a la más usada, y
+# cargas en curso por clave (single-flight: las demás peticiones esperan a la que ya está en marcha)
+_MARKET_CACHE = {'lock': threading.Lock(), 'entries': OrderedDict(), 'inflight': {}, 'bytes': 0}
+
+def trading_day(today=None):
+    """Último día hábil (de lunes a viernes) hasta `today`, como texto ISO."""
+    return str(np.busday_offset(np.datetime64(today or date.today(), 'D'), 0, roll='backward'))
+
+def _market_cache_key(market_name, full_universe=False):
+    """Clave de la caché: (mercado, ventana de histórico en días, día de cotización, universo completo)."""
+    return (market_name, stats_history_days(), trading_day(), full_universe)
+
+def _store_market_entry(key, entry):
+    """Guarda una tabla en la caché y expulsa las menos usadas hasta volver a MARKET_CACHE_MAX_BYTES."""
+    with _MARKET_CACHE['lock']:
+        previous = _MARKET_CACHE['entries'].pop(key, None)
+        if previous is not None:
+            _MARKET_CACHE['bytes'] -= previous['bytes']
+        _MARKET_CACHE['entries'][key] = entry
+        _MARKET_CACHE['bytes'] += entry['bytes']
+        # Las de días de cotización anteriores ya no se van a pedir
+        for old_key in [old_key for old_key in _MARKET_CACHE['entries'] if old_key[2] != key[2]]:
+            _MARKET_CACHE['bytes'] -= _MARKET_CACHE['entries'].pop(old_key)['bytes']
+        while _MARKET_CACHE['bytes'] > MARKET_CACHE_MAX_BYTES and len(_MARKET_CACHE['entries']) > 1:
+            _, evicted = _MARKET_CACHE['entries'].popitem(last=False)
+            _MARKET_CACHE['bytes'] -= evicted['bytes']
+            tracing.count('market_cache', outcome='evicted')
+
+def _cached_market_entry(key):
+    """Entrada vigente de la caché (marcándola como la más usada) o None."""
+    with _MARKET_CACHE['lock']:
+        entry = _MARKET_CACHE['entries'].get(key)
+        if entry is None or time.time() - entry['loaded_at'] > MARKET_CACHE_TTL:
+            return None
+        _MARKET_CACHE['entries'].move_to_end(key)
+        return entry
+
+def invalidate_market_cache(market_name=None):
+    """Descarta de la caché las tablas de un mercado (o todas) para que se vuelvan a cargar."""
+    with _MARKET_CACHE['lock']:
+        for key in [key for key in _MARKET_CACHE['entries'] if market_name is None or key[0] == market_name]:
+            _MARKET_CACHE['bytes'] -= _MARKET_CACHE['entries'].pop(key)['bytes']
+
+def market_cache_info():
+    """Estado de la caché de mercados: tablas guardadas, memoria y cargas en curso."""
+    with _MARKET_CACHE['lock']:
+        return {'entries': [key for key in _MARKET_CACHE['entries']], 'bytes': _MARKET_CACHE['bytes'],
+                'max_bytes': MARKET_CACHE_MAX_BYTES, 'inflight': list(_MARKET_CACHE['inflight'])}
+
+def load_market_table(market_name, on_batch=None, full_universe=False):
+    """
+    Tabla compacta de un mercado (to_market_table) a través de la caché compartida por el proceso.
+
+    Si la tabla de hoy tiene menos de MARKET_CACHE_TTL segundos se devuelve sin cargar nada. Si
+    otra sesión ya la está cargando, se espera a esa carga en lugar de empezar otra; si no, se
+    carga batch a batch llamando a `on_batch(batch, tabla hasta ahora)` (solo quien carga).
+    Cada batch se pasa a tabla compacta en cuanto llega, así que nunca se tienen en memoria las
+    filas de todo el mercado. Con `full_universe` se cargan todos los componentes del índice.
+    Devuelve (tabla o None, tickers fallidos como [(ticker, motivo)], mensaje).
+    """
+    key = _market_cache_key(market_name, full_universe)
+    while True:
+        entry = _cached_market_entry(key)
+        if entry is not None:
+            tracing.count('market_cache', outcome='hit')
+            return entry['table'], entry['failed'], entry['message']
+
+        with _MARKET_CACHE['lock']:
+            flight = _MARKET_CACHE['inflight'].get(key)
+            leader = flight is None
+            if leader:
+                flight = _MARKET_CACHE['inflight'][key] = {'done': threading.Event(), 'result': None}
+        if not leader:
+            tracing.count('market_cache', outcome='wait')
+            flight['done'].wait()
+            if flight['result'] is not None:
+                return flight['result']
+            continue  # Abandonada por quien cargaba: se vuelve a intentar
+
+        tracing.count('market_cache', outcome='miss')
+        try:
+            chunks, failed_tickers = [], []
+            for batch in iter_stock_data_for_market(market_name, full_universe):
+                if batch['rows']:
+                    chunks.append(to_market_table(batch['rows']))
+                failed_tickers.extend(batch['failed'])
+                if on_batch is not None and chunks:
+                    chunks = [concat_market_tables(chunks)]
+                    on_batch(batch, chunks[0])
+            table = concat_market_tables(chunks) if chunks else None
+            flight['result'] = (table, failed_tickers, market_load_message([] if table is None else table, failed_tickers))
+            if table is not None:
+                _store_market_entry(key, {'table': table, 'failed': failed_tickers, 'message': flight['result'][2],
+                                          'loaded_at': time.time(), 'bytes': market_table_bytes(table)})
+        except ValueError as e:
+            flight['result'] = (None, [], str(e))
+        except Exception as e:
+            flight['result'] = (None, [], f"❌ Error al cargar datos del mercado: {e}")
+        finally:
+            # También si la sesión que cargaba se interrumpe (p. ej. un rerun de Streamlit)
+            with _MARKET_CACHE['lock']:
+                _MARKET_CACHE['inflight'].pop(key, None)
+            flight['done'].set()
+        return flight['result']
+
+def market_load_message(stock_list, failed_tickers):
+    """Mensaje final de la carga de un mercado (filas o tabla de acciones cargadas)."""
+    if len(stock_list) == 0:
+        return "❌ No se pudieron obtener datos para este mercado."
+    
+    # Crear mensaje con información de acciones no encontradas
+    message = f"✅ {len(stock_list)} acciones cargadas"
+    if failed_tickers:
+        message += f" ({len(failed_tickers)} no disponibles)"
+    message += "."
+    return message
@@ -0,0 +1,556 @@
+"""Portfolio de un usuario: posiciones, valoración, snapshots y actualización de precios en segundo plano."""
+import time
+import threading
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from . import tracing
+from .db import get_connection
+from .fx import BASE_CURRENCIES, FX_PIVOT, convert, get_fx_rates, guess_currency, ticker_currencies
+from .users import get_user_id
+from .market_data import get_price_history, get_ticker_metadata, read_cached_quotes, get_latest_quotes
+from .rules import DEFAULT_RULES, evaluate_rules, get_user_rules
+from .stats import STATS_WINDOWS, compute_window_stats, stats_history_days
+from .symbols import validate_ticker
+
+# Snapshot de portfolio por usuario: segundos que se reutilizan los precios calculados
+PORTFOLIO_PRICE_TTL = 30
+# Actualizador de precios en segundo plano: segundos entre actualizaciones
+PRICE_REFRESH_INTERVAL = 300
+# Cotización desactualizada: más antigua que dos pasadas del actualizador (se muestra marcada, con su antigüedad)
+QUOTE_STALE_AFTER = 2 * PRICE_REFRESH_INTERVAL
+# Segundos que un render espera a que se calcule el portfolio antes de mostrar el último snapshot
+PORTFOLIO_RENDER_BUDGET = 1.5
+
+# Evolución del portfolio: periodo -> días hacia atrás (se calcula una vez el más largo y se recorta)
+VALUATION_PERIODS = {'1M': 30, '3M': 90, '1A': 365}
+
+# Columnas del portfolio: valores numéricos (float/int); el formato se aplica solo al mostrarlas.
+# Los importes están en la moneda base elegida; 'Moneda' es la de cotización del valor. Sin
+# precio los importes quedan vacíos (NaN), nunca a 0; 'Antigüedad Precio (s)' es la edad de la
+# cotización y 'Desactualizado' marca las de más de QUOTE_STALE_AFTER.
+PORTFOLIO_COLUMNS = ['Valor', 'Ticker', 'Moneda', 'Acciones', 'Precio Compra (Unidad)', 'Costo Total Pagado', 'Valor Actual de Mercado', 'Precio Promedio (3M)', 'Precio Actual', 'Recomendación', 'Antigüedad Precio (s)', 'Desactualizado']
+
+def _empty_portfolio():
+    """DataFrame de portfolio vacío con las columnas y tipos de load_portfolio."""
+    return pd.DataFrame({
+        'Valor': pd.Series(dtype='object'),
+        'Ticker': pd.Series(dtype='object'),
+        'Moneda': pd.Series(dtype='object'),
+        'Acciones': pd.Series(dtype='int64'),
+        'Precio Compra (Unidad)': pd.Series(dtype='float64'),
+        'Costo Total Pagado': pd.Series(dtype='float64'),
+        'Valor Actual de Mercado': pd.Series(dtype='float64'),
+        'Precio Promedio (3M)': pd.Series(dtype='float64'),
+        'Precio Actual': pd.Series(dtype='float64'),
+        'Recomendación': pd.Series(dtype='object'),
+        'Antigüedad Precio (s)': pd.Series(dtype='float64'),
+        'Desactualizado': pd.Series(dtype='bool'),
+    })
+
+def calculate_recommendation(avg_price_market, current_price, rules=None):
+    """
+    Recomendación de un solo valor frente a su promedio, con los umbrales de la regla 'recommendation'.
+
+    Para tablas completas usar rules.evaluate_rules, que evalúa todas las filas a la vez.
+    """
+    rule = (rules or DEFAULT_RULES)['recommendation']
+    if current_price is None or avg_price_market is None or pd.isna(current_price) or pd.isna(avg_price_market):
+        return "N/D"
+    if current_price < avg_price_market * rule['buy_below']:
+        return "🟢 COMPRAR"
+    elif current_price > avg_price_market * rule['sell_above']:
+        return "🔴 VENDER"
+    else:
+        return "🟡 MANTENER"
+
+def portfolio_totals(df_portfolio):
+    """
+    Totales de un portfolio de load_portfolio: (importe pagado, valor actual, ganancia, tickers sin precio).
+
+    El valor y la ganancia solo cuentan los valores con precio (la ganancia frente a lo pagado
+    por ellos); si ninguno tiene precio son NaN, así que un portfolio sin precios no vale 0.
+    """
+    priced = df_portfolio['Valor Actual de Mercado'].notna()
+    cost = float(df_portfolio['Costo Total Pagado'].sum())
+    value = float(df_portfolio['Valor Actual de Mercado'].sum(min_count=1))
+    gain = value - float(df_portfolio.loc[priced, 'Costo Total Pagado'].sum())
+    return cost, value, gain, df_portfolio.loc[~priced, 'Ticker'].tolist()
+
+def prepare_chart_data(df_portfolio):
+    """Prepara datos para gráficas (valor de mercado y ganancia por ticker) a partir del dataframe del portfolio."""
+    if df_portfolio.empty:
+        return None
+    
+    return pd.DataFrame({
+        'Valor Mercado': df_portfolio['Valor Actual de Mercado'].to_numpy(),
+        'Ganancia': (df_portfolio['Valor Actual de Mercado'] - df_portfolio['Costo Total Pagado']).to_numpy(),
+    }, index=pd.Index(df_portfolio['Ticker'], name='Ticker'))
+
+# Snapshots de portfolio y de su evolución por usuario, compartidos entre hilos y sesiones, con su versión por
+# usuario y los cálculos en curso por (usuario, moneda) (single-flight: los renders esperan al que ya está en marcha)
+_PORTFOLIO_SNAPSHOTS = {'lock': threading.Lock(), 'users': {}, 'history': {}, 'versions': {}, 'inflight': {}}
+
+def invalidate_portfolio_snapshot(username):
+    """Descarta el snapshot del usuario (posiciones, precios y evolución) para que se recalcule en la próxima carga."""
+    with _PORTFOLIO_SNAPSHOTS['lock']:
+        _PORTFOLIO_SNAPSHOTS['users'].pop(username, None)
+        _PORTFOLIO_SNAPSHOTS['history'].pop(username, None)
+        _PORTFOLIO_SNAPSHOTS['versions'][username] = _PORTFOLIO_SNAPSHOTS['versions'].get(username, 0) + 1
+
+@tracing.traced()
+def _load_positions(username):
+    """Lee las posiciones del usuario (acciones totales y precio promedio de compra)."""
+    # Resumen de posiciones, mantenido al añadir/eliminar
+    query = """
+        SELECT 
+            ticker, 
+            total_shares, 
+            total_cost / total_shares as avg_purchase_price
+        FROM 
+            positions
+        WHERE 
+            user_id = ?
+        ORDER BY 
+            ticker
+    """
+    with get_connection() as conn:
+        user_id = get_user_id(username, conn)
+        return pd.read_sql_query(query, conn, params=(user_id,))
+
+def _format_age(seconds):
+    """Antigüedad legible: '45 s', '12 min' o '3 h'."""
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.0f} h"
+
+@tracing.traced()
+def _price_positions(portfolio_df, rules=None, background_refresh=True, base_currency=FX_PIVOT, with_history=True):
+    """
+    Valora las posiciones con precios actuales y promedio de 3 meses, y aplica las reglas del usuario.
+
+    Solo lee el almacén local (cotizaciones, histórico y tipos de cambio publicados por el
+    actualizador en segundo plano), así que nunca espera a la red. Los importes se convierten
+    a `base_currency` con el tipo de cambio actual (también el precio de compra, que se anota
+    en la moneda de cotización). Las cotizaciones de más de QUOTE_STALE_AFTER se usan igualmente,
+    marcadas como desactualizadas. Si faltan precios o están desactualizados y `background_refresh`
+    es True, se pide una actualización al actualizador. Con `with_history=False` no se lee el
+    histórico (sin promedio de 3M ni recomendación): es la primera vista rápida de load_portfolio.
+    Devuelve (DataFrame, mensaje).
+    """
+    tickers = portfolio_df['ticker'].tolist()
+    rule = (rules or DEFAULT_RULES)['recommendation']
+    # Solo las ventanas que usa la regla (y la de 3M para el promedio mostrado)
+    windows = {key: STATS_WINDOWS[key] for key in dict.fromkeys(['3m', *rule['windows']])}
+    
+    # Histórico de cierres de esas ventanas y cotizaciones publicadas (almacén local)
+    yf_data = get_price_history(tickers, stats_history_days(windows), sync=False) if with_history else pd.DataFrame()
+    quotes = read_cached_quotes(tickers)
+    metadata = get_ticker_metadata(tickers, fetch=False)
+    nombrelargo = {ticker: metadata[ticker]['long_name'] or ticker for ticker in tickers}
+    currencies = [metadata[ticker]['currency'] or guess_currency(ticker) for ticker in tickers]
+    rates = get_fx_rates(currencies, base_currency, fetch=False)
+    
+    # Precio de los valores con cotización publicada (sea cual sea su antigüedad) y estadísticas
+    # de ventana de los que además tienen histórico; los que falten quedan pendientes
+    pending = [ticker for ticker, currency in zip(tickers, currencies)
+               if ticker not in quotes or (with_history and ticker not in yf_data) or pd.isna(rates[currency])]
+    priced = [ticker for ticker in tickers if ticker in quotes]
+    tickers_col = portfolio_df['ticker']
+    signals_df = compute_window_stats(yf_data[[ticker for ticker in priced if ticker in yf_data]], windows).reindex(tickers_col)
+    signals_df['current_price'] = tickers_col.map({ticker: quotes[ticker][0] for ticker in priced}).to_numpy(dtype='float64')
+    recommendation = evaluate_rules(signals_df, {'recommendation': rule})['recommendation']
+    now = time.time()
+    age = tickers_col.map({ticker: now - quotes[ticker][1] for ticker in priced}).to_numpy(dtype='float64')
+    stale = [ticker for ticker, ticker_age in zip(tickers, age) if ticker_age > QUOTE_STALE_AFTER]
+
+    # Construir los resultados por columnas (sin recorrer filas); sin precio publicado o sin
+    # tipo de cambio los importes quedan vacíos (NaN)
+    total_shares = portfolio_df['total_shares'].astype('int64')
+    avg_purchase_price = convert(portfolio_df['avg_purchase_price'].astype('float64'), currencies, rates)
+    current_price = convert(signals_df['current_price'].to_numpy(), currencies, rates)
+    avg_price_market = convert(signals_df['price_3m_avg'].to_numpy(), currencies, rates)
+
+    final_df = pd.DataFrame({
+        'Valor': tickers_col.map(nombrelargo),
+        'Ticker': tickers_col,
+        'Moneda': currencies,
+        'Acciones': total_shares,
+        'Precio Compra (Unidad)': avg_purchase_price,
+        'Costo Total Pagado': total_shares * avg_purchase_price,
+        'Valor Actual de Mercado': total_shares * current_price,
+        'Precio Promedio (3M)': avg_price_market,
+        'Precio Actual': current_price,
+        'Recomendación': recommendation.to_numpy(),
+        'Antigüedad Precio (s)': age,
+        'Desactualizado': age > QUOTE_STALE_AFTER,
+    })
+
+    tracing.count('portfolio_prices', outcome='priced', n=len(priced) - len(stale))
+    tracing.count('portfolio_prices', outcome='stale', n=len(stale))
+    tracing.count('portfolio_prices', outcome='pending', n=len(pending))
+    if pending or stale:
+        # Valores aún no publicados o desactualizados: se piden al actualizador con prioridad (sin repetir si acaba de pasar)
+        last_run = _PRICE_REFRESHER['last_run'] if _PRICE_REFRESHER else None
+        if background_refresh and (last_run is None or time.time() - last_run > PORTFOLIO_PRICE_TTL):
+            request_price_refresh()
+    if pending:
+        return final_df, f"⏳ Portfolio cargado. Precios o tipos de cambio pendientes para {', '.join(pending)}: se están actualizando en segundo plano."
+    if stale:
+        oldest = max(now - quotes[ticker][1] for ticker in stale)
+        return final_df, (f"⚠️ Portfolio cargado con los últimos precios conocidos para {', '.join(stale)} "
+                          f"(de hace {_format_age(oldest)}): se están actualizando en segundo plano.")
+    updated_at = min(quotes[ticker][1] for ticker in tickers)
+    return final_df, f"✅ Portfolio cargado. Precios y promedio de 3M actualizados al {time.strftime('%H:%M:%S', time.localtime(updated_at))}."
+
+def _compute_portfolio(username, rules, base_currency, background_refresh, snapshot, version):
+    """Calcula el portfolio y lo guarda como snapshot (si nadie lo ha modificado mientras tanto)."""
+    positions = snapshot['positions'] if snapshot is not None else _load_positions(username)
+    if positions.empty:
+        result = _empty_portfolio(), "ℹ️ Tu portfolio está vacío. Añade valores para empezar."
+    else:
+        result = _price_positions(positions, rules, background_refresh, base_currency)
+    with _PORTFOLIO_SNAPSHOTS['lock']:
+        if _PORTFOLIO_SNAPSHOTS['versions'].get(username, 0) == version:
+            now = time.time()
+            _PORTFOLIO_SNAPSHOTS['users'][username] = {'positions': positions, 'rules': rules, 'base': base_currency,
+                                                         'priced_at': now, 'computed_at': now, 'result': result}
+    return result
+
+def _stale_portfolio(snapshot, reason):
+    """Último snapshot calculado, con todos sus precios marcados como desactualizados y su antigüedad al día."""
+    portfolio_df = snapshot['result'][0].copy()
+    elapsed = time.time() - snapshot['computed_at']
+    portfolio_df['Antigüedad Precio (s)'] += elapsed
+    portfolio_df['Desactualizado'] = portfolio_df['Antigüedad Precio (s)'].notna()
+    return portfolio_df, f"⚠️ {reason} Se muestran los últimos precios conocidos (de hace {_format_age(elapsed)}) mientras se actualizan."
+
+def _provisional_portfolio(username, rules, base_currency):
+    """Primera vista sin snapshot: posiciones con las últimas cotizaciones guardadas, sin promedio de 3M ni recomendación."""
+    try:
+        positions = _load_positions(username)
+        if positions.empty:
+            return _empty_portfolio(), "ℹ️ Tu portfolio está vacío. Añade valores para empezar."
+        portfolio_df, _ = _price_positions(positions, rules, False, base_currency, with_history=False)
+    except Exception:
+        return _empty_portfolio(), "⏳ El portfolio se está calculando en segundo plano; pulsa 🔄 Recargar en unos segundos."
+    return portfolio_df, ("⏳ Se muestran los últimos precios guardados; el promedio de 3M y las recomendaciones "
+                          "se están calculando en segundo plano.")
+
+def _portfolio_after_error(fallback, error):
+    """Último snapshot (marcado como desactualizado) si lo hay; si no, el portfolio vacío con el error."""
+    tracing.count('portfolio_snapshot', outcome='error')
+    if fallback is not None:
+        return _stale_portfolio(fallback, f"No se pudo actualizar el portfolio ({error}).")
+    return _empty_portfolio(), f"❌ Error al cargar portfolio: {error}"
+
+@tracing.traced()
+def load_portfolio(username, background_refresh=True, base_currency=FX_PIVOT, budget=PORTFOLIO_RENDER_BUDGET):
+    """
+    Carga el portfolio de `username`, obtiene precios actuales y promedio de 3 meses (importes en `base_currency`).
+
+    El resultado se guarda en un snapshot por usuario: las posiciones se reutilizan hasta
+    que add_to_portfolio/delete_from_portfolio lo invalidan y los precios durante
+    PORTFOLIO_PRICE_TTL segundos (o hasta que cambian sus reglas o la moneda), así que un mismo render
+    solo lo calcula una vez.
+
+    Stale-while-revalidate: el cálculo se hace en un hilo aparte (uno por usuario y moneda
+    aunque lo pidan varias sesiones) y se espera como mucho `budget` segundos (sin límite si es
+    None). Si no termina a tiempo, o falla, se devuelve el último snapshot con los precios
+    marcados como desactualizados (o, si aún no hay ninguno, las posiciones con las últimas
+    cotizaciones guardadas) y el cálculo sigue en segundo plano para el próximo render. Cada
+    llamada espera su propio `budget`: un render debe cargarlo una sola vez y reutilizarlo.
+    """
+    if not username:
+        return _empty_portfolio(), "⚠️ Error: No hay usuario logeado."
+
+    with _PORTFOLIO_SNAPSHOTS['lock']:
+        snapshot = _PORTFOLIO_SNAPSHOTS['users'].get(username)
+        version = _PORTFOLIO_SNAPSHOTS['versions'].get(username, 0)
+    # El último resultado en la misma moneda sirve de respaldo aunque haya caducado
+    fallback = snapshot if snapshot is not None and snapshot['base'] == base_currency else None
+    try:
+        rules = get_user_rules(username)
+    except Exception as e:
+        return _portfolio_after_error(fallback, e)
+
+    if (fallback is not None and fallback['rules'] == rules and fallback['priced_at'] is not None
+            and time.time() - fallback['priced_at'] <= PORTFOLIO_PRICE_TTL):
+        tracing.count('portfolio_snapshot', outcome='hit')
+        return fallback['result']
+    tracing.count('portfolio_snapshot', outcome='miss')
+
+    key = (username, base_currency)
+    with _PORTFOLIO_SNAPSHOTS['lock']:
+        flight = _PORTFOLIO_SNAPSHOTS['inflight'].get(key)
+        if flight is None:
+            flight = _PORTFOLIO_SNAPSHOTS['inflight'][key] = {'done': threading.Event(), 'result': None, 'error': None}
+
+            def run():
+                try:
+                    flight['result'] = _compute_portfolio(username, rules, base_currency, background_refresh, snapshot, version)
+                except Exception as e:
+                    flight['error'] = e
+                finally:
+                    with _PORTFOLIO_SNAPSHOTS['lock']:
+                        _PORTFOLIO_SNAPSHOTS['inflight'].pop(key, None)
+                    flight['done'].set()
+
+            threading.Thread(target=run, name='sf-portfolio', daemon=True).start()
+        else:
+            tracing.count('portfolio_snapshot', outcome='wait')
+
+    if not flight['done'].wait(budget):
+        tracing.count('portfolio_snapshot', outcome='deadline')
+        if fallback is not None:
+            return _stale_portfolio(fallback, "Los precios están tardando en calcularse.")
+        return _provisional_portfolio(username, rules, base_currency)
+    if flight['error'] is not None:
+        return _portfolio_after_error(fallback, flight['error'])
+    return flight['result']
+
+@tracing.traced()
+def _load_lots(username):
+    """Lee los lotes de compra del usuario (ticker, acciones, precio y fecha de compra)."""
+    with get_connection() as conn:
+        user_id = get_user_id(username, conn)
+        return pd.read_sql_query(
+            "SELECT ticker, shares, purchase_price, purchase_date FROM portfolio WHERE user_id = ?",
+            conn, params=(user_id,)
+        )
+
+@tracing.traced()
+def _value_history(lots, days, base_currency=FX_PIVOT):
+    """
+    Valor, coste y ganancia diarios de unos lotes en los últimos `days` días (más hoy), en `base_currency`.
+
+    Se construye una matriz de posiciones (fechas x tickers) acumulando las acciones de cada
+    lote desde su fecha de compra y se multiplica elemento a elemento por la matriz de cierres
+    del almacén local; el valor de cada día es la suma de su fila. Hoy se valora con las
+    cotizaciones publicadas (o el último cierre si no hay). Precios y costes se convierten con
+    el tipo de cambio actual, así que la evolución no incluye el efecto de la divisa. Los días en
+    que algún valor en cartera no tiene precio quedan vacíos (NaN) en lugar de valorarlo a 0.
+    """
+    tickers = list(dict.fromkeys(lots['ticker']))
+    currencies = ticker_currencies(tickers, fetch=False)
+    rates = get_fx_rates(currencies.values(), base_currency, fetch=False)
+    factors = np.array([rates[currencies[ticker]] for ticker in tickers], dtype='float64')
+    close = get_price_history(tickers, days, sync=False).reindex(columns=tickers)
+    quotes = read_cached_quotes(tickers)
+    today = pd.Timestamp(date.today())
+    close.loc[today] = [quotes[ticker][0] if ticker in quotes else np.nan for ticker in tickers]
+    # Días sin cotización (festivos de cada mercado) con el último cierre; antes del primero, el primero
+    prices = close.sort_index().ffill().bfill() * factors
+    dates = prices.index
+
+    # Lotes sin fecha (anteriores a la migración 5) o anteriores al periodo cuentan desde el primer día
+    purchase_dates = pd.to_datetime(lots['purchase_date']).fillna(dates[0])
+    rows = np.minimum(dates.searchsorted(purchase_dates), len(dates) - 1)
+    columns = pd.Index(tickers).get_indexer(lots['ticker'])
+    shares = lots['shares'].to_numpy(dtype='float64')
+
+    holdings = np.zeros((len(dates), len(tickers)))
+    np.add.at(holdings, (rows, columns), shares)
+    holdings = holdings.cumsum(axis=0)
+    cost = np.zeros(len(dates))
+    np.add.at(cost, rows, shares * lots['purchase_price'].to_numpy(dtype='float64') * factors[columns])
+    cost = cost.cumsum()
+
+    value = np.einsum('ij,ij->i', holdings, prices.fillna(0.0).to_numpy())
+    value[((holdings > 0) & prices.isna().to_numpy()).any(axis=1)] = np.nan
+    return pd.DataFrame({'Valor': value, 'Coste': cost, 'Ganancia': value - cost}, index=dates.rename('Fecha'))
+
+def load_portfolio_history(username, period='3M', base_currency=FX_PIVOT):
+    """
+    Evolución diaria del portfolio de `username` en `period` (clave de VALUATION_PERIODS), en `base_currency`.
+
+    Devuelve un DataFrame indexado por fecha con 'Valor', 'Coste' y 'Ganancia' (vacío si no hay
+    lotes). Solo lee el almacén local; el periodo más largo se calcula una vez y se reutiliza
+    (y recorta) hasta que cambian los lotes o la moneda, o pasan PORTFOLIO_PRICE_TTL segundos.
+    """
+    if period not in VALUATION_PERIODS:
+        raise ValueError(f"Periodo no válido: {period} (usa {', '.join(VALUATION_PERIODS)}).")
+
+    with _PORTFOLIO_SNAPSHOTS['lock']:
+        cached = _PORTFOLIO_SNAPSHOTS['history'].get(username)
+        version = _PORTFOLIO_SNAPSHOTS['versions'].get(username, 0)
+    if (cached is not None and cached['base'] == base_currency
+            and time.time() - cached['computed_at'] <= PORTFOLIO_PRICE_TTL):
+        history = cached['history']
+    else:
+        lots = _load_lots(username)
+        if lots.empty:
+            history = pd.DataFrame({'Valor': [], 'Coste': [], 'Ganancia': []}, index=pd.DatetimeIndex([], name='Fecha'))
+        else:
+            history = _value_history(lots, max(VALUATION_PERIODS.values()), base_currency)
+        with _PORTFOLIO_SNAPSHOTS['lock']:
+            if _PORTFOLIO_SNAPSHOTS['versions'].get(username, 0) == version:
+                _PORTFOLIO_SNAPSHOTS['history'][username] = {'computed_at': time.time(), 'base': base_currency,
+                                                               'history': history}
+
+    start = pd.Timestamp(date.today()) - pd.Timedelta(days=VALUATION_PERIODS[period])
+    return history[history.index >= start]
+
+def portfolio_day_change(history):
+    """
+    Variación del último día de una evolución de load_portfolio_history: (importe, % sobre el valor anterior).
+
+    Se mide con la ganancia, así que comprar o vender ese día no cuenta como variación.
+    Devuelve (None, None) si hay menos de dos días o a alguno de los dos le faltan precios.
+    """
+    if len(history) < 2 or history['Valor'].iloc[-2:].isna().any():
+        return None, None
+    previous_value = float(history['Valor'].iloc[-2])
+    change = float(history['Ganancia'].iloc[-1] - history['Ganancia'].iloc[-2])
+    return change, (change / previous_value * 100 if previous_value else None)
+
+@tracing.traced()
+def refresh_held_prices(username=None):
+    """
+    Actualiza en bloque cotizaciones, histórico de la ventana más larga, nombres y tipos de cambio de los tickers en cartera.
+
+    Sin `username` se actualizan los de todos los usuarios. Los tipos de cambio de todas las
+    monedas base se piden en la misma descarga (como mucho una vez cada FX_RATE_TTL).
+    """
+    with get_connection() as conn:
+        if username is None:
+            tickers = [row[0] for row in conn.execute("SELECT DISTINCT ticker FROM positions")]
+        else:
+            user_id = get_user_id(username, conn)
+            tickers = [row[0] for row in conn.execute("SELECT ticker FROM positions WHERE user_id = ?", (user_id,))]
+    if tickers:
+        get_price_history(tickers, stats_history_days())
+        get_ticker_metadata(tickers)
+        get_latest_quotes(tickers, max_age=0)
+    get_fx_rates(list(ticker_currencies(tickers, fetch=False).values()) + list(BASE_CURRENCIES), FX_PIVOT)
+    # Los snapshots se recalculan con los precios recién publicados (el último resultado se conserva
+    # como respaldo para load_portfolio)
+    with _PORTFOLIO_SNAPSHOTS['lock']:
+        for snapshot in _PORTFOLIO_SNAPSHOTS['users'].values():
+            snapshot['priced_at'] = None
+        _PORTFOLIO_SNAPSHOTS['history'].clear()
+
+# Estado del actualizador en segundo plano (None hasta que se arranca)
+_PRICE_REFRESHER = None
+_PRICE_REFRESHER_LOCK = threading.Lock()
+
+def start_price_refresher():
+    """
+    Arranca una sola vez por proceso el hilo que actualiza los precios en segundo plano.
+
+    Se ejecuta cada PRICE_REFRESH_INTERVAL segundos o antes si alguien llama a
+    request_price_refresh(). Devuelve su estado compartido.
+    """
+    global _PRICE_REFRESHER
+    with _PRICE_REFRESHER_LOCK:
+        if _PRICE_REFRESHER is not None:
+            return _PRICE_REFRESHER
+        state = _PRICE_REFRESHER = {'wake': threading.Event(), 'last_run': None, 'last_error': None}
+
+    def run():
+        while True:
+            state['wake'].clear()
+            try:
+                refresh_held_prices()
+                state['last_run'] = time.time()
+                state['last_error'] = None
+            except Exception as e:
+                state['last_error'] = str(e)
+            state['wake'].wait(PRICE_REFRESH_INTERVAL)
+
+    threading.Thread(target=run, name='sf-price-refresher', daemon=True).start()
+    return state
+
+def request_price_refresh():
+    """Pide al actualizador en segundo plano una actualización inmediata (sin esperar a que termine)."""
+    start_price_refresher()['wake'].set()
+
+@tracing.traced()
+def add_to_portfolio(username, ticker, shares_str, price_str, purchase_date=None):
+    """Añade una acción al portfolio de `username` (comprada en `purchase_date`, hoy por defecto); el ticker debe existir."""
+    if not username:
+        return False, "❌ Error: Debes iniciar sesión para añadir valores."
+    
+    try:
+        shares = int(shares_str)
+        price = float(price_str)
+        ticker = ticker.upper()
+        if shares <= 0 or price <= 0:
+            raise ValueError("Número de acciones y precio deben ser positivos.")
+        purchase_date = purchase_date or date.today()
+        if isinstance(purchase_date, str):
+            purchase_date = datetime.strptime(purchase_date, '%Y-%m-%d').date()
+        elif isinstance(purchase_date, datetime):
+            purchase_date = purchase_date.date()
+        if purchase_date > date.today():
+            raise ValueError("La fecha de compra no puede ser futura.")
+        # El último paso porque, si el ticker no está en el índice, puede consultar yfinance
+        validate_ticker(ticker)
+    except ValueError as e:
+        return False, f"❌ Error de entrada: {e}"
+
+    try:
+        with get_connection() as conn:
+            user_id = get_user_id(username, conn)
+            if user_id is None:
+                return False, "❌ Error: Usuario no encontrado."
+            
+            # El lote y el resumen de la posición se actualizan en la misma transacción
+            conn.execute(
+                "INSERT INTO portfolio (user_id, ticker, shares, purchase_price, purchase_date) VALUES (?, ?, ?, ?, ?)",
+                (user_id, ticker, shares, price, purchase_date.isoformat())
+            )
+            conn.execute(
+                """
+                INSERT INTO positions (user_id, ticker, total_shares, total_cost) VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id, ticker) DO UPDATE SET
+                    total_shares = total_shares + excluded.total_shares,
+                    total_cost = total_cost + excluded.total_cost
+                """,
+                (user_id, ticker, shares, shares * price)
+            )
+            conn.commit()
+        invalidate_portfolio_snapshot(username)
+        request_price_refresh()
+        
+        # El precio de compra se anota en la moneda de cotización del valor
+        currency = get_ticker_metadata([ticker], fetch=False)[ticker]['currency'] or guess_currency(ticker)
+        return True, f"✅ '{ticker}' ({shares} acc. a {price:,.2f} {currency}) añadido a tu portfolio."
+        
+    except Exception as e:
+        return False, f"❌ Error al añadir valor: {e}"
+
+@tracing.traced()
+def delete_from_portfolio(username, ticker):
+    """Elimina un ticker del portfolio de `username`."""
+    if not username:
+        return False, "❌ Error: Debes iniciar sesión para eliminar valores."
+    
+    try:
+        ticker = ticker.upper()
+        with get_connection() as conn:
+            user_id = get_user_id(username, conn)
+            if user_id is None:
+                return False, "❌ Error: Usuario no encontrado."
+            
+            # Eliminar todas las entradas del ticker para este usuario
+            conn.execute(
+                "DELETE FROM portfolio WHERE user_id = ? AND ticker = ?",
+                (user_id, ticker)
+            )
+            conn.execute(
+                "DELETE FROM positions WHERE user_id = ? AND ticker = ?",
+                (user_id, ticker)
+            )
+            conn.commit()
+        invalidate_portfolio_snapshot(username)
+        
+        return True, f"✅ '{ticker}' ha sido eliminado de tu portfolio."
+        
+    except Exception as e:
+        return False, f"❌ Error al eliminar valor: {e}"
+
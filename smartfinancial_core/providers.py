@@ -0,0 +1,81 @@
+"""
+Proveedores de datos externos (yfinance y páginas web).
+
+Todo acceso a la red del núcleo pasa por el proveedor activo (get_provider), así que basta
+con set_provider() para sustituirlo, p. ej. por el de benchmarks/replay_provider.py.
+Un proveedor implementa:
+
+    history(ticker, start, end)  -> Serie de cierres diarios (vacía si no hay datos)
+    info(ticker)                 -> dict con los campos de .info
+    recent_closes(tickers)       -> DataFrame de cierres de los últimos días (una columna por ticker)
+    fetch_url(url, headers, timeout) -> respuesta HTTP (status_code, headers, content, raise_for_status)
+
+Los errores de red se propagan como excepciones.
+"""
+import threading
+
+import pandas as pd
+import requests
+import yfinance as yf
+from yfinance.exceptions import YFPricesMissingError, YFTzMissingError
+
+class YFinanceProvider:
+    """Proveedor real: Yahoo Finance (yfinance) y peticiones HTTP con requests."""
+
+    def __init__(self):
+        # yf.download guarda su estado en variables globales: una descarga a la vez
+        self._download_lock = threading.Lock()
+
+    def history(self, ticker, start, end):
+        """
+        Cierres diarios de un ticker entre `start` (incluido) y `end` (excluido).
+
+        Se usa Ticker.history en lugar de yf.download porque yf.download guarda su estado en
+        variables globales y no admite varias descargas simultáneas. Un ticker sin datos
+        devuelve una serie vacía; los errores de red se propagan.
+        """
+        try:
+            history = yf.Ticker(ticker).history(start=start, end=end, auto_adjust=False, actions=False, raise_errors=True)
+        except (YFPricesMissingError, YFTzMissingError):
+            return pd.Series(dtype='float64')
+        if history.empty or 'Close' not in history:
+            return pd.Series(dtype='float64')
+        return history['Close']
+
+    def info(self, ticker):
+        """Campos de .info de un ticker."""
+        return yf.Ticker(ticker).info or {}
+
+    def recent_closes(self, tickers):
+        """Cierres de los últimos 5 días (cubre fines de semana y festivos) con una sola descarga en bloque."""
+        with self._download_lock:
+            yf_data = yf.download(tickers, period="5d", progress=False, threads=True, auto_adjust=False)
+        if yf_data is None or yf_data.empty or 'Close' not in yf_data:
+            return pd.DataFrame()
+        close = yf_data['Close']
+        if isinstance(close, pd.Series):
+            close = close.to_frame(tickers[0])
+        return close
+
+    def fetch_url(self, url, headers=None, timeout=10):
+        """Petición GET."""
+        return requests.get(url, headers=headers, timeout=timeout)
+
+_PROVIDER = None
+_PROVIDER_LOCK = threading.Lock()
+
+def get_provider():
+    """Proveedor activo (YFinanceProvider si no se ha configurado otro)."""
+    global _PROVIDER
+    if _PROVIDER is None:
+        with _PROVIDER_LOCK:
+            if _PROVIDER is None:
+                _PROVIDER = YFinanceProvider()
+    return _PROVIDER
+
+def set_provider(provider):
+    """Sustituye el proveedor activo y devuelve el anterior (None para volver al real)."""
+    global _PROVIDER
+    with _PROVIDER_LOCK:
+        previous, _PROVIDER = _PROVIDER, provider
+    return previous
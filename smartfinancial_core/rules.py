@@ -0,0 +1,160 @@
+"""Reglas de recomendación configurables por usuario, evaluadas de forma vectorizada sobre tablas completas."""
+import copy
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from .db import get_connection
+from .stats import STATS_WINDOWS
+from .users import get_user_id
+
+# Referencias de precio de una ventana con las que se compara el precio actual: estadísticas que usa cada una
+RULE_REFERENCES = {
+    'avg': ('avg',),            # promedio de la ventana
+    'mid': ('min', 'max'),      # punto medio entre mínimo y máximo
+    'min': ('min',),
+    'max': ('max',),
+}
+
+# Etiquetas de las reglas con señal de venta
+RECOMMENDATION_LABELS = {'buy': "🟢 COMPRAR", 'sell': "🔴 VENDER", 'hold': "🟡 MANTENER", 'missing': "N/D"}
+
+# Reglas por defecto. Cada regla compara el precio actual con la referencia (`reference`) de
+# cualquiera de sus ventanas (`windows`, claves de STATS_WINDOWS):
+#   buy_below   compra si precio < buy_below * referencia
+#   sell_above  venta si precio > sell_above * referencia; las reglas con venta dan una etiqueta
+#               de RECOMMENDATION_LABELS y las demás un booleano (señal de compra sí/no)
+DEFAULT_RULES = {
+    'recommendation': {'windows': ['3m'], 'reference': 'avg', 'buy_below': 0.75, 'sell_above': 1.25},
+    'cc': {'windows': ['3m', '6m'], 'reference': 'mid', 'buy_below': 1.0},
+    'cl': {'windows': ['1y'], 'reference': 'mid', 'buy_below': 1.0},
+}
+
+def validate_rules(rules, windows=STATS_WINDOWS):
+    """Comprueba un conjunto de reglas y lo devuelve normalizado; lanza ValueError si no es válido."""
+    normalized = {}
+    for name, rule in rules.items():
+        if name not in DEFAULT_RULES:
+            raise ValueError(f"Regla desconocida: {name}.")
+        rule_windows = list(rule.get('windows') or [])
+        if not rule_windows:
+            raise ValueError(f"La regla '{name}' necesita al menos una ventana.")
+        reference = rule.get('reference')
+        if reference not in RULE_REFERENCES:
+            raise ValueError(f"Referencia no válida en '{name}': {reference} (usa {', '.join(RULE_REFERENCES)}).")
+        for window in rule_windows:
+            if window not in windows:
+                raise ValueError(f"Ventana desconocida en '{name}': {window}.")
+            missing = [stat for stat in RULE_REFERENCES[reference] if stat not in windows[window]['stats']]
+            if missing:
+                raise ValueError(f"La ventana {window} no calcula {', '.join(missing)} (regla '{name}').")
+
+        try:
+            buy_below = float(rule['buy_below'])
+            sell_above = float(rule['sell_above']) if 'sell_above' in DEFAULT_RULES[name] else None
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Umbrales no válidos en '{name}'.")
+        if buy_below <= 0 or (sell_above is not None and sell_above <= buy_below):
+            raise ValueError(f"En '{name}' los umbrales deben ser positivos y el de venta mayor que el de compra.")
+
+        normalized[name] = {'windows': rule_windows, 'reference': reference, 'buy_below': buy_below}
+        if sell_above is not None:
+            normalized[name]['sell_above'] = sell_above
+    return normalized
+
+def _reference_values(df, window, reference):
+    """Referencia de una ventana como array (NaN si faltan las estadísticas)."""
+    values = [df[f'price_{window}_{stat}'].to_numpy(dtype='float64') if f'price_{window}_{stat}' in df
+              else np.full(len(df), np.nan) for stat in RULE_REFERENCES[reference]]
+    return values[0] if len(values) == 1 else (values[0] + values[1]) / 2
+
+def evaluate_rules(df, rules=None):
+    """
+    Evalúa las reglas sobre una tabla completa con operaciones NumPy (sin recorrer filas).
+
+    `df` necesita 'current_price' y las columnas price_<ventana>_<estadística> de
+    compute_window_stats. Devuelve un DataFrame con el mismo índice y una columna por regla.
+    Si falta el precio o todas las referencias, las reglas con venta dan 'N/D' y las demás False.
+    """
+    rules = rules or DEFAULT_RULES
+    price = df['current_price'].to_numpy(dtype='float64')[:, None]
+    result = {}
+    with np.errstate(invalid='ignore'):
+        for name, rule in rules.items():
+            references = np.column_stack([_reference_values(df, window, rule['reference']) for window in rule['windows']])
+            buy = (price < rule['buy_below'] * references).any(axis=1)
+            if 'sell_above' not in rule:
+                result[name] = buy
+                continue
+            sell = (price > rule['sell_above'] * references).any(axis=1)
+            missing = np.isnan(price[:, 0]) | np.isnan(references).all(axis=1)
+            result[name] = np.select(
+                [missing, buy, sell],
+                [RECOMMENDATION_LABELS['missing'], RECOMMENDATION_LABELS['buy'], RECOMMENDATION_LABELS['sell']],
+                default=RECOMMENDATION_LABELS['hold'],
+            )
+    return pd.DataFrame(result, index=df.index)
+
+# --- Reglas por usuario ---
+
+def get_user_rules(username):
+    """
+    Reglas de `username`: las guardadas sobre las de DEFAULT_RULES.
+
+    Las reglas nuevas que no tenga guardadas toman el valor por defecto y, si las guardadas
+    ya no son válidas (p. ej. se quitó una ventana de STATS_WINDOWS), se usan las de por defecto.
+    """
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT r.rules FROM user_rules r JOIN users u ON u.id = r.user_id WHERE u.username = ?", (username,)
+        ).fetchone()
+    rules = copy.deepcopy(DEFAULT_RULES)
+    if row is None:
+        return rules
+    try:
+        stored = json.loads(row[0])
+        for name, rule in stored.items():
+            if name in rules:
+                rules[name].update(rule)
+        return validate_rules(rules)
+    except (ValueError, AttributeError):
+        return copy.deepcopy(DEFAULT_RULES)
+
+def save_user_rules(username, rules):
+    """Valida y guarda las reglas de `username` (los campos que falten toman el valor por defecto)."""
+    try:
+        rules = validate_rules({name: {**DEFAULT_RULES.get(name, {}), **rule} for name, rule in rules.items()})
+    except ValueError as e:
+        return False, f"❌ Error en las reglas: {e}"
+
+    try:
+        with get_connection() as conn:
+            user_id = get_user_id(username, conn)
+            if user_id is None:
+                return False, "❌ Error: Usuario no encontrado."
+            conn.execute(
+                """
+                INSERT INTO user_rules (user_id, rules, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET rules = excluded.rules, updated_at = excluded.updated_at
+                """,
+                (user_id, json.dumps(rules), time.time())
+            )
+            conn.commit()
+        return True, "✅ Reglas guardadas."
+    except Exception as e:
+        return False, f"❌ Error al guardar las reglas: {e}"
+
+def reset_user_rules(username):
+    """Vuelve a las reglas por defecto para `username`."""
+    try:
+        with get_connection() as conn:
+            user_id = get_user_id(username, conn)
+            if user_id is None:
+                return False, "❌ Error: Usuario no encontrado."
+            conn.execute("DELETE FROM user_rules WHERE user_id = ?", (user_id,))
+            conn.commit()
+        return True, "✅ Reglas restablecidas a los valores por defecto."
+    except Exception as e:
+        return False, f"❌ Error al restablecer las reglas: {e}"
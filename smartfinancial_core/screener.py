@@ -0,0 +1,126 @@
+"""Screener: todos los mercados en una única tabla columnar con señales de compra vectorizadas."""
+import numpy as np
+import pandas as pd
+
+from . import tracing
+from .markets import MARKETS_DATA, get_market_tickers, iter_ticker_batches, market_load_message, to_market_table
+from .rules import evaluate_rules
+from .stats import STATS_WINDOWS
+
+# Columnas por las que se puede ordenar el screener además de las de estadísticas
+SCREENER_SORT_COLUMNS = ('ticker', 'market', 'name', 'current_price', 'cc', 'cl', 'recommendation')
+
+def universe_tickers(markets=None):
+    """
+    Tickers de los mercados indicados (todos por defecto) sin repetir.
+
+    Devuelve (tickers únicos en orden, pares [(mercado, ticker)]): un ticker que cotiza en
+    varios índices (p. ej. AAPL en S&P 500 y NASDAQ) se descarga una sola vez.
+    """
+    pairs = [(market, ticker) for market in (markets or MARKETS_DATA) for ticker in get_market_tickers(market)]
+    return list(dict.fromkeys(ticker for _, ticker in pairs)), pairs
+
+def iter_universe(markets=None):
+    """
+    Carga todos los mercados con una sola tanda de batches compartida (ver iter_ticker_batches).
+
+    Lanza ValueError si algún mercado no existe o si no hay ninguna acción definida.
+    """
+    unknown = [market for market in (markets or ()) if market not in MARKETS_DATA]
+    if unknown:
+        raise ValueError(f"❌ Mercado no encontrado: {', '.join(unknown)}.")
+    tickers, _ = universe_tickers(markets)
+    if not tickers:
+        raise ValueError("❌ No se encontraron acciones para estos mercados.")
+    yield from iter_ticker_batches(tickers)
+
+def add_buy_signals(df, rules=None, windows=STATS_WINDOWS):
+    """
+    Añade las señales de las reglas y la caída desde máximos a una tabla de acciones, de forma vectorizada.
+
+    cc, cl y recommendation salen de rules.evaluate_rules con las reglas indicadas (las de por
+    defecto si no se dan). drawdown_<ventana> es el % de caída del precio actual respecto al
+    máximo de cada ventana con 'max'. Las estadísticas que faltan (NaN) nunca activan una señal.
+    Las etiquetas se guardan como categóricas y las caídas en float32, como la tabla compacta.
+    """
+    df = df.copy()
+    signals = evaluate_rules(df, rules)
+    for name in signals:
+        df[name] = signals[name].astype('category') if signals[name].dtype == object else signals[name]
+    price = df['current_price'].astype('float64')
+    for key, window in windows.items():
+        if 'max' in window['stats'] and f'price_{key}_max' in df:
+            high = df[f'price_{key}_max'].where(df[f'price_{key}_max'] > 0)
+            df[f'drawdown_{key}'] = ((1 - price / high) * 100).astype('float32')
+    return df
+
+@tracing.traced()
+def build_universe(rows, markets=None, rules=None):
+    """
+    Tabla columnar del universo: una fila por (mercado, ticker) con nombre, estadísticas y señales.
+
+    `rows` son las filas de iter_universe (una por ticker único), con los tipos compactos de
+    to_market_table; el mercado es categórico. Con otras reglas basta volver a pasar la tabla
+    por add_buy_signals.
+    """
+    _, pairs = universe_tickers(markets)
+    stocks = add_buy_signals(to_market_table(rows).reset_index(), rules)
+    membership = pd.DataFrame(pairs, columns=['market', 'ticker']).astype({'ticker': stocks['ticker'].dtype})
+    membership['market'] = pd.Categorical(membership['market'], categories=list(markets or MARKETS_DATA))
+    return membership.merge(stocks, on='ticker', how='inner').reset_index(drop=True)
+
+def load_universe(markets=None, rules=None):
+    """
+    Carga el universo completo de una vez (para la línea de comandos o tareas programadas).
+
+    Devuelve (tabla del universo o None, tickers fallidos como [(ticker, motivo)], mensaje).
+    """
+    try:
+        rows, failed_tickers = [], []
+        for batch in iter_universe(markets):
+            rows.extend(batch['rows'])
+            failed_tickers.extend(batch['failed'])
+    except ValueError as e:
+        return None, [], str(e)
+    except Exception as e:
+        return None, [], f"❌ Error al cargar los mercados: {e}"
+
+    universe = build_universe(rows, markets, rules) if rows else None
+    return universe, failed_tickers, market_load_message(rows, failed_tickers)
+
+@tracing.traced()
+def screen(universe, markets=None, cc=None, cl=None, min_drawdown=None, drawdown_window='1y',
+           sort_by=None, ascending=False, unique=True, limit=None):
+    """
+    Filtra y ordena la tabla del universo con máscaras booleanas (sin recorrer filas).
+
+    markets       solo esos mercados
+    cc, cl        True/False para exigir la señal o su ausencia; None para no filtrar
+    min_drawdown  caída mínima (%) desde el máximo de `drawdown_window`
+    sort_by       columna de orden (por defecto la caída de `drawdown_window`)
+    unique        un ticker que está en varios mercados aparece una sola vez (el primero)
+    """
+    drawdown_column = f'drawdown_{drawdown_window}'
+    if drawdown_column not in universe:
+        raise ValueError(f"❌ Ventana sin caída desde máximos: {drawdown_window}.")
+    sort_by = sort_by or drawdown_column
+    if sort_by not in universe or (sort_by not in SCREENER_SORT_COLUMNS and not sort_by.startswith(('price_', 'drawdown_'))):
+        raise ValueError(f"❌ Columna de orden no válida: {sort_by}.")
+
+    mask = np.ones(len(universe), dtype=bool)
+    if markets:
+        mask &= universe['market'].isin(markets).to_numpy()
+    if cc is not None:
+        mask &= universe['cc'].to_numpy() == cc
+    if cl is not None:
+        mask &= universe['cl'].to_numpy() == cl
+    if min_drawdown is not None:
+        mask &= (universe[drawdown_column] > min_drawdown).to_numpy()
+
+    result = universe[mask]
+    if unique:
+        result = result.drop_duplicates('ticker')
+    result = result.sort_values(sort_by, ascending=ascending, na_position='last', kind='stable')
+    if limit:
+        result = result.head(limit)
+    return result.reset_index(drop=True)
@@ -0,0 +1,61 @@
+"""Estadísticas de ventanas de precios (1A, 6M, 3M...) calculadas de forma vectorizada."""
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from . import tracing
+
+# Ventanas de estadísticas de mercado: días hacia atrás (o 'ytd') y estadísticas a calcular.
+# Añadir una ventana (p. ej. '1m': {'days': 30, ...} o '5y': {'days': 5 * 365, ...}) genera
+# automáticamente las columnas price_<ventana>_<estadística>.
+STATS_WINDOWS = {
+    '1y': {'days': 365, 'stats': ('avg', 'min', 'max')},
+    '6m': {'days': 180, 'stats': ('min', 'max')},
+    '3m': {'days': 90, 'stats': ('avg', 'min', 'max')},
+}
+
+_STAT_FUNCS = {'avg': np.nanmean, 'min': np.nanmin, 'max': np.nanmax}
+
+def _window_start(days, now):
+    """Fecha de inicio de una ventana de STATS_WINDOWS."""
+    if days == 'ytd':
+        return datetime(now.year, 1, 1)
+    return now - timedelta(days=days)
+
+def stats_history_days(windows=STATS_WINDOWS):
+    """Días de histórico necesarios para cubrir la ventana más larga."""
+    now = datetime.now()
+    return max((now - _window_start(window['days'], now)).days + 1 for window in windows.values())
+
+@tracing.traced()
+def compute_window_stats(close, windows=STATS_WINDOWS, now=None):
+    """
+    Calcula todas las estadísticas de ventana para todas las columnas de un DataFrame de cierres.
+
+    Cada ventana se recorta con un único `searchsorted` sobre el índice de fechas y las
+    estadísticas se calculan en una sola pasada NumPy sobre la matriz (fechas x tickers).
+    Devuelve un DataFrame indexado por ticker con columnas price_<ventana>_<estadística>;
+    las ventanas sin datos quedan como NaN. Los tickers sin ningún dato se descartan.
+    """
+    now = now or datetime.now()
+    close = close.loc[:, close.notna().any()].sort_index()
+    columns = [f'price_{key}_{stat}' for key, window in windows.items() for stat in window['stats']]
+    if close.empty:
+        return pd.DataFrame(columns=columns, dtype='float64')
+    values = close.to_numpy(dtype='float64')
+
+    result = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # columnas sin datos en la ventana -> NaN
+        for key, window in windows.items():
+            cut = close.index.searchsorted(pd.Timestamp(_window_start(window['days'], now)))
+            window_values = values[cut:]
+            for stat in window['stats']:
+                if len(window_values):
+                    result[f'price_{key}_{stat}'] = _STAT_FUNCS[stat](window_values, axis=0)
+                else:
+                    result[f'price_{key}_{stat}'] = np.full(values.shape[1], np.nan)
+
+    return pd.DataFrame(result, index=close.columns)
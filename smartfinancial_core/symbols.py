@@ -0,0 +1,153 @@
+"""Índice de símbolos de todos los mercados: búsqueda por prefijo de ticker o nombre y validación de tickers."""
+import bisect
+import json
+import re
+import threading
+import time
+
+from . import tracing
+from .db import get_connection
+from .market_data import get_ticker_metadata
+from .markets import MARKETS_DATA, _yahoo_symbol, get_market_tickers
+
+# Segundos antes de reconstruir el índice (para recoger nombres y componentes guardados desde entonces)
+SYMBOL_INDEX_TTL = 3600
+# Resultados por búsqueda
+SYMBOL_SEARCH_LIMIT = 20
+# Tickers con formato de yfinance: letras, dígitos y . - = ^ (p. ej. BRK-B, SAN.MC, ^IBEX)
+TICKER_PATTERN = re.compile(r'^[A-Z0-9^][A-Z0-9.\-=^]{0,19}$')
+
+# Índice compartido por todas las sesiones del proceso (None hasta la primera búsqueda)
+_SYMBOL_INDEX = {'lock': threading.Lock(), 'index': None, 'built_at': 0.0}
+
+def _universe_markets():
+    """{ticker: [mercados]} de las listas de MARKETS_DATA y de los componentes ya guardados (sin red)."""
+    markets = {}
+    for market in MARKETS_DATA:
+        for ticker in get_market_tickers(market):
+            markets.setdefault(ticker, []).append(market)
+    with get_connection() as conn:
+        stored = conn.execute("SELECT market, tickers FROM market_constituents").fetchall()
+    for market, tickers in stored:
+        if market not in MARKETS_DATA:
+            continue
+        suffix = MARKETS_DATA[market]['suffix']
+        for ticker in json.loads(tickers):
+            ticker_markets = markets.setdefault(f"{_yahoo_symbol(ticker)}{suffix}", [])
+            if market not in ticker_markets:
+                ticker_markets.append(market)
+    return markets
+
+def _name_keys(name):
+    """Claves de búsqueda de un nombre: el nombre desde cada palabra ('banco santander', 'santander')."""
+    words = name.casefold().split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+def _insert_symbol(index, ticker, name, markets=()):
+    """Añade un símbolo a un índice manteniendo ordenadas las claves."""
+    index['symbols'][ticker] = {'ticker': ticker, 'name': name, 'markets': tuple(markets)}
+    bisect.insort(index['ticker_keys'], (ticker.casefold(), ticker))
+    if name and name != ticker:
+        for key in _name_keys(name):
+            bisect.insort(index['name_keys'], (key, ticker))
+
+@tracing.traced()
+def build_symbol_index():
+    """
+    Construye el índice de símbolos de todos los mercados.
+
+    Toma los tickers de MARKETS_DATA y de los componentes guardados, y los nombres (y tickers
+    ya validados) de la caché de metadatos, sin consultar la red. Devuelve un dict con
+    'symbols' ({ticker: {'ticker', 'name', 'markets'}}) y dos listas ordenadas de pares
+    (clave, ticker) para buscar por prefijo con bisect: 'ticker_keys' y 'name_keys'.
+    """
+    markets = _universe_markets()
+    with get_connection() as conn:
+        names = dict(conn.execute(
+            "SELECT ticker, long_name FROM ticker_metadata WHERE long_name IS NOT NULL OR quote_type IS NOT NULL"
+        ))
+
+    symbols, ticker_keys, name_keys = {}, [], []
+    for ticker in dict.fromkeys([*markets, *names]):
+        if ticker.endswith('=X'):
+            continue  # Tipos de cambio (fx), no son valores
+        name = names.get(ticker)
+        symbols[ticker] = {'ticker': ticker, 'name': name, 'markets': tuple(markets.get(ticker, ()))}
+        ticker_keys.append((ticker.casefold(), ticker))
+        if name and name != ticker:
+            name_keys.extend((key, ticker) for key in _name_keys(name))
+    ticker_keys.sort()
+    name_keys.sort()
+    tracing.count('symbol_index', outcome='built')
+    return {'symbols': symbols, 'ticker_keys': ticker_keys, 'name_keys': name_keys}
+
+def get_symbol_index():
+    """Índice de símbolos compartido; se construye una sola vez por proceso y se renueva cada SYMBOL_INDEX_TTL."""
+    with _SYMBOL_INDEX['lock']:
+        if _SYMBOL_INDEX['index'] is None or time.time() - _SYMBOL_INDEX['built_at'] > SYMBOL_INDEX_TTL:
+            _SYMBOL_INDEX['index'] = build_symbol_index()
+            _SYMBOL_INDEX['built_at'] = time.time()
+        return _SYMBOL_INDEX['index']
+
+def invalidate_symbol_index():
+    """Descarta el índice para reconstruirlo en la próxima búsqueda (p. ej. tras actualizar componentes)."""
+    with _SYMBOL_INDEX['lock']:
+        _SYMBOL_INDEX['index'] = None
+
+def _prefix_matches(keys, prefix, seen, limit):
+    """Tickers de las claves que empiezan por `prefix`, en orden, sin repetir los de `seen`."""
+    matches = []
+    for position in range(bisect.bisect_left(keys, (prefix,)), len(keys)):
+        key, ticker = keys[position]
+        if len(matches) >= limit or not key.startswith(prefix):
+            break
+        if ticker not in seen:
+            seen.add(ticker)
+            matches.append(ticker)
+    return matches
+
+def search_symbols(query, limit=SYMBOL_SEARCH_LIMIT):
+    """
+    Autocompletado: símbolos cuyo ticker o nombre (desde cualquier palabra) empieza por `query`.
+
+    Sin distinguir mayúsculas. Primero los tickers (el exacto delante) y después los nombres,
+    como mucho `limit`. Cada búsqueda son dos bisect sobre listas ordenadas.
+    """
+    prefix = ' '.join(query.casefold().split())
+    if not prefix:
+        return []
+    index = get_symbol_index()
+    seen = set()
+    tickers = _prefix_matches(index['ticker_keys'], prefix, seen, limit)
+    tickers += _prefix_matches(index['name_keys'], prefix, seen, limit - len(tickers))
+    return [index['symbols'][ticker] for ticker in tickers]
+
+def lookup_symbol(ticker):
+    """Símbolo de un ticker del índice, o None si no está."""
+    return get_symbol_index()['symbols'].get(ticker)
+
+def validate_ticker(ticker):
+    """
+    Comprueba que `ticker` existe antes de guardarlo; lanza ValueError si no.
+
+    Los del índice se aceptan sin más. Los demás se buscan en la caché de metadatos (con una
+    consulta a yfinance si no están) y, si existen, se añaden al índice. Si yfinance no responde
+    se aceptan los que ya tienen histórico en el almacén local; los demás no se pueden verificar.
+    """
+    if not TICKER_PATTERN.match(ticker):
+        raise ValueError(f"Ticker no válido: {ticker}.")
+    index = get_symbol_index()
+    if ticker in index['symbols']:
+        return
+    metadata = get_ticker_metadata([ticker])[ticker]
+    # Un símbolo inexistente no tiene nombre ni tipo de cotización
+    if metadata['long_name'] is None and metadata['quote_type'] is None:
+        if metadata['no_data']:
+            raise ValueError(f"Ticker desconocido o sin datos en yfinance: {ticker}.")
+        with get_connection() as conn:
+            stored = conn.execute("SELECT 1 FROM price_history WHERE ticker = ? LIMIT 1", (ticker,)).fetchone()
+        if stored is None:
+            raise ValueError(f"No se pudo verificar {ticker}: yfinance no responde. Inténtalo de nuevo en unos minutos.")
+    with _SYMBOL_INDEX['lock']:
+        if _SYMBOL_INDEX['index'] is index and ticker not in index['symbols']:
+            _insert_symbol(index, ticker, metadata['long_name'])
@@ -0,0 +1,242 @@
+"""
+Trazado ligero: spans anidados con tiempos, contadores y latencia por ticker de las llamadas externas.
+
+Desactivado por defecto (o con SMARTFINANCIAL_TRACING=1 para arrancar activado). Mientras
+está desactivado, span() devuelve un contexto vacío compartido y count()/timed_call()
+solo comprueban un flag, así que el coste es prácticamente nulo. Los datos son del proceso
+(todas las sesiones) y se exportan como texto de Prometheus o como líneas JSON.
+
+    with tracing.span('load_portfolio', user=username) as s:
+        ...
+        s.set(rows=len(df))
+    tracing.count('metadata_cache', outcome='hit', n=12)
+    close = tracing.timed_call('history', ticker, provider.history, ticker, start, end)
+"""
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+TRACE_MAX_SPANS = 2000              # spans recientes guardados para el panel y la exportación JSON
+TRACE_MAX_TICKERS = 5000            # pares (tipo de llamada, ticker) con latencia acumulada
+# Límites (segundos) de los buckets del histograma de duración de spans
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ENABLED = os.environ.get('SMARTFINANCIAL_TRACING', '') not in ('', '0', 'false')
+_LOCK = threading.Lock()
+_LOCAL = threading.local()          # pila de spans abiertos de cada hilo
+_IDS = itertools.count(1)
+
+_spans = {}                         # nombre -> [n, total s, máx s, contadores por bucket]
+_counters = {}                      # (nombre, etiquetas) -> valor
+_tickers = OrderedDict()            # (tipo, ticker) -> [n, total s, máx s, errores]
+_recent = deque(maxlen=TRACE_MAX_SPANS)
+
+def is_enabled():
+    """Indica si el trazado está activo."""
+    return _ENABLED
+
+def set_enabled(enabled):
+    """Activa o desactiva el trazado (los datos ya recogidos se conservan)."""
+    global _ENABLED
+    _ENABLED = bool(enabled)
+
+def reset():
+    """Borra todos los datos recogidos."""
+    with _LOCK:
+        _spans.clear()
+        _counters.clear()
+        _tickers.clear()
+        _recent.clear()
+
+# --- Spans ---
+
+class _NoopSpan:
+    """Span vacío que se devuelve con el trazado desactivado."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class _Span:
+    """Span activo: mide su duración y se anida dentro del span abierto del mismo hilo."""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Añade atributos al span (p. ej. número de filas o tickers)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = getattr(_LOCAL, 'stack', None)
+        if stack is None:
+            stack = _LOCAL.stack = []
+        parent = stack[-1] if stack else None
+        self.id = next(_IDS)
+        self.parent_id = parent.id if parent else None
+        self.trace_id = parent.trace_id if parent else self.id
+        self.depth = len(stack)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _LOCAL.stack.pop()
+        record = {
+            'ts': round(self.wall_start, 6),
+            'trace': self.trace_id,
+            'span': self.id,
+            'parent': self.parent_id,
+            'depth': self.depth,
+            'name': self.name,
+            'duration_ms': round(duration * 1000, 3),
+            'thread': threading.current_thread().name,
+            'error': exc_type.__name__ if exc_type else None,
+            **({'attrs': self.attrs} if self.attrs else {}),
+        }
+        with _LOCK:
+            stats = _spans.get(self.name)
+            if stats is None:
+                stats = _spans[self.name] = [0, 0.0, 0.0, [0] * len(SPAN_BUCKETS)]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+            for i, bound in enumerate(SPAN_BUCKETS):
+                if duration <= bound:
+                    stats[3][i] += 1
+                    break
+            _recent.append(record)
+        return False
+
+def span(name, **attrs):
+    """Abre un span con nombre y atributos opcionales (contexto vacío si el trazado está desactivado)."""
+    if not _ENABLED:
+        return _NOOP_SPAN
+    return _Span(name, attrs)
+
+def traced(name=None):
+    """Decorador: ejecuta la función dentro de un span (no usar con generadores)."""
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return fn(*args, **kwargs)
+            with _Span(span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# --- Contadores y latencia por ticker ---
+
+def count(name, n=1, **labels):
+    """Suma `n` al contador `name` con las etiquetas dadas (p. ej. outcome='hit')."""
+    if not _ENABLED or not n:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _LOCK:
+        _counters[key] = _counters.get(key, 0) + n
+
+def timed_call(kind, ticker, fn, *args, **kwargs):
+    """Llama a `fn` registrando su latencia para (kind, ticker) y si ha fallado."""
+    if not _ENABLED:
+        return fn(*args, **kwargs)
+    start = time.perf_counter()
+    failed = True
+    try:
+        result = fn(*args, **kwargs)
+        failed = False
+        return result
+    finally:
+        duration = time.perf_counter() - start
+        key = (kind, ticker)
+        with _LOCK:
+            stats = _tickers.get(key)
+            if stats is None:
+                stats = _tickers[key] = [0, 0.0, 0.0, 0]
+                if len(_tickers) > TRACE_MAX_TICKERS:
+                    _tickers.popitem(last=False)  # Se descarta el par menos reciente
+            else:
+                _tickers.move_to_end(key)
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+            stats[3] += failed
+            call_key = ('upstream_calls', (('kind', kind), ('outcome', 'error' if failed else 'ok')))
+            _counters[call_key] = _counters.get(call_key, 0) + 1
+
+# --- Consulta y exportación ---
+
+def snapshot():
+    """Copia de los datos recogidos: spans agregados, contadores, latencia por ticker y spans recientes."""
+    with _LOCK:
+        spans = [{'name': name, 'count': n, 'total_ms': total * 1000, 'mean_ms': total * 1000 / n, 'max_ms': peak * 1000}
+                 for name, (n, total, peak, _) in _spans.items()]
+        counters = [{'name': name, **dict(labels), 'value': value} for (name, labels), value in _counters.items()]
+        tickers = [{'kind': kind, 'ticker': ticker, 'count': n, 'mean_ms': total * 1000 / n, 'max_ms': peak * 1000,
+                    'errors': errors}
+                   for (kind, ticker), (n, total, peak, errors) in _tickers.items()]
+        recent = list(_recent)
+    return {'enabled': _ENABLED, 'spans': spans, 'counters': counters, 'tickers': tickers, 'recent': recent}
+
+def _labels(**labels):
+    """Etiquetas en formato Prometheus."""
+    escaped = {key: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for key, value in labels.items()}
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped.items()) + '}'
+
+def to_prometheus():
+    """Datos recogidos en el formato de texto de Prometheus."""
+    with _LOCK:
+        spans = {name: (n, total, list(buckets)) for name, (n, total, _, buckets) in _spans.items()}
+        counters = dict(_counters)
+        tickers = {key: list(stats) for key, stats in _tickers.items()}
+
+    lines = ['# HELP smartfinancial_span_seconds Duración de los spans.',
+             '# TYPE smartfinancial_span_seconds histogram']
+    for name, (n, total, buckets) in sorted(spans.items()):
+        cumulative = 0
+        for bound, hits in zip(SPAN_BUCKETS, buckets):
+            cumulative += hits
+            lines.append(f'smartfinancial_span_seconds_bucket{_labels(span=name, le=bound)} {cumulative}')
+        lines.append(f'smartfinancial_span_seconds_bucket{_labels(span=name, le="+Inf")} {n}')
+        lines.append(f'smartfinancial_span_seconds_sum{_labels(span=name)} {total:.6f}')
+        lines.append(f'smartfinancial_span_seconds_count{_labels(span=name)} {n}')
+
+    lines += ['# HELP smartfinancial_events_total Contadores de llamadas externas y aciertos de caché.',
+              '# TYPE smartfinancial_events_total counter']
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f'smartfinancial_events_total{_labels(event=name, **dict(labels))} {value}')
+
+    lines += ['# HELP smartfinancial_upstream_seconds Latencia de las llamadas externas por ticker.',
+              '# TYPE smartfinancial_upstream_seconds summary']
+    for (kind, ticker), (n, total, _, _) in sorted(tickers.items()):
+        lines.append(f'smartfinancial_upstream_seconds_sum{_labels(kind=kind, ticker=ticker)} {total:.6f}')
+        lines.append(f'smartfinancial_upstream_seconds_count{_labels(kind=kind, ticker=ticker)} {n}')
+    lines += ['# HELP smartfinancial_upstream_max_seconds Latencia máxima observada por ticker.',
+              '# TYPE smartfinancial_upstream_max_seconds gauge']
+    for (kind, ticker), (_, _, peak, _) in sorted(tickers.items()):
+        lines.append(f'smartfinancial_upstream_max_seconds{_labels(kind=kind, ticker=ticker)} {peak:.6f}')
+    return '\n'.join(lines) + '\n'
+
+def to_jsonl():
+    """Spans recientes (uno por línea) seguidos de la latencia por ticker, como líneas JSON."""
+    data = snapshot()
+    lines = [json.dumps({'type': 'span', **record}, ensure_ascii=False) for record in data['recent']]
+    lines += [json.dumps({'type': 'ticker', **record}, ensure_ascii=False) for record in data['tickers']]
+    lines += [json.dumps({'type': 'counter', **record}, ensure_ascii=False) for record in data['counters']]
+    return '\n'.join(lines) + ('\n' if lines else '')
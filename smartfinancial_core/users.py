@@ -0,0 +1,51 @@
+"""Usuarios: registro y verificación de credenciales."""
+import sqlite3
+
+import bcrypt
+
+from .db import get_connection
+
+def get_user_id(username, conn=None):
+    """Obtiene el ID del usuario por su nombre de usuario (reutilizando `conn` si se indica)."""
+    if conn is None:
+        with get_connection() as conn:
+            return get_user_id(username, conn)
+    result = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    if result:
+        return result[0]
+    return None
+
+def register_user(username, password):
+    """Registra un nuevo usuario."""
+    if not username or not password:
+        return False, "❌ Usuario o contraseña no pueden estar vacíos."
+
+    try:
+        password_bytes = password.encode('utf-8')
+        password_hash = bcrypt.hashpw(password_bytes, bcrypt.gensalt()).decode('utf-8')
+        with get_connection() as conn:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash))
+            conn.commit()
+        return True, "✅ Registro exitoso. Ahora puedes iniciar sesión."
+
+    except sqlite3.IntegrityError:
+        return False, "❌ Error: El nombre de usuario ya existe."
+    except Exception as e:
+        return False, f"❌ Error de registro: {e}"
+
+def authenticate(username, password):
+    """Verifica el usuario y la contraseña (sin abrir ninguna sesión)."""
+    if not username or not password:
+        return False, "❌ Usuario o contraseña no pueden estar vacíos."
+
+    with get_connection() as conn:
+        result = conn.execute("SELECT id, password_hash FROM users WHERE username = ?", (username,)).fetchone()
+
+    if result:
+        user_id, password_hash = result
+        if bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+            return True, "✅ Inicio de sesión correcto."
+        else:
+            return False, "❌ Contraseña incorrecta."
+    else:
+        return False, "❌ Usuario no encontrado."
@@ -0,0 +1,55 @@
+"""
+Fixtures de los tests: cada test usa una base de datos temporal, un proveedor sin red
+(benchmarks/replay_provider.py) y las cachés del proceso vacías.
+"""
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+sys.path.insert(0, str(REPO / 'benchmarks'))
+
+from replay_provider import ReplayProvider  # noqa: E402
+from smartfinancial_core import markets, portfolio, symbols  # noqa: E402
+from smartfinancial_core.db import configure_db  # noqa: E402
+from smartfinancial_core.providers import set_provider  # noqa: E402
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    """Base de datos temporal con las migraciones aplicadas; devuelve su ruta."""
+    path = tmp_path / 'test.db'
+    configure_db(str(path))
+    with markets._MARKET_CACHE['lock']:
+        markets._MARKET_CACHE['entries'].clear()
+        markets._MARKET_CACHE['inflight'].clear()
+        markets._MARKET_CACHE['bytes'] = 0
+    with portfolio._PORTFOLIO_SNAPSHOTS['lock']:
+        for state in ('users', 'history', 'versions', 'inflight'):
+            portfolio._PORTFOLIO_SNAPSHOTS[state].clear()
+    symbols.invalidate_symbol_index()
+    # Sin actualizador en segundo plano: cada test controla cuándo se actualizan los precios
+    monkeypatch.setattr(portfolio, 'request_price_refresh', lambda: None)
+    return path
+
+class FakeProvider(ReplayProvider):
+    """ReplayProvider sin latencia con una lista fija de tickers sin datos (como los deslistados)."""
+
+    def __init__(self, missing=(), **kwargs):
+        super().__init__(**kwargs)
+        self.missing = set(missing)
+
+    def _synthesize(self, ticker):
+        if ticker in self.missing:
+            return pd.Series(dtype='float64', index=pd.DatetimeIndex([])), {}
+        return super()._synthesize(ticker)
+
+@pytest.fixture(autouse=True)
+def provider():
+    """Proveedor sin red del test; se puede sustituir con set_provider y se restaura al terminar."""
+    fake = FakeProvider()
+    previous = set_provider(fake)
+    yield fake
+    set_provider(previous)
@@ -0,0 +1,81 @@
+"""Componentes de índices: extracción de tickers de las tablas de Wikipedia y revalidación condicional."""
+import pytest
+import requests
+from replay_provider import _Response
+
+from smartfinancial_core import constituents
+from smartfinancial_core.constituents import _parse_constituents, get_ticketnamesmarket
+from smartfinancial_core.db import get_connection
+from smartfinancial_core.markets import get_market_tickers
+
+SP500 = "S&P 500 (USA)"
+CAC = "CAC 40 (París)"
+
+def _wikitable(tickers):
+    rows = ''.join(f"<tr><td>{ticker}</td><td>Empresa</td></tr>" for ticker in tickers)
+    return f"<table class='wikitable sortable'><tr><th>Symbol</th><th>Security</th></tr>{rows}</table>"
+
+def test_share_classes_are_kept():
+    html = _wikitable(['AAPL', 'BRK.B', 'BF.B', 'GOOGL', 'BRK.BB', 'TOOLONG', 'brk.b', 'A.B.C', '[1]'])
+
+    assert _parse_constituents(html, SP500) == ['AAPL', 'BF.B', 'BRK.B', 'GOOGL']
+
+def test_full_universe_uses_yahoo_symbols(monkeypatch):
+    monkeypatch.setattr(constituents, 'get_ticketnamesmarket', lambda market, force_refresh=False: ['AAPL', 'BRK.B'])
+
+    assert get_market_tickers(SP500, full_universe=True) == ['AAPL', 'BRK-B']
+
+class FakeWikipedia:
+    """Página de componentes con ETag/Last-Modified que responde 304 a una petición condicional al día."""
+
+    def __init__(self, tickers):
+        self.tickers, self.etag, self.requests, self.offline = tickers, '"v1"', [], False
+
+    def set_tickers(self, tickers, etag):
+        self.tickers, self.etag = tickers, etag
+
+    def fetch_url(self, url, headers=None, timeout=10):
+        self.requests.append(dict(headers or {}))
+        if self.offline:
+            raise requests.ConnectionError("sin red")
+        if (headers or {}).get('If-None-Match') == self.etag:
+            return _Response(b'', status_code=304)
+        return _Response(_wikitable(self.tickers).encode(), headers={'ETag': self.etag, 'Last-Modified': 'Mon, 05 Oct 2026 10:00:00 GMT'})
+
+@pytest.fixture
+def wikipedia(provider, monkeypatch):
+    page = FakeWikipedia(['AI', 'MC', 'OR'])
+    monkeypatch.setattr(provider, 'fetch_url', page.fetch_url)
+    return page
+
+def _stored(market):
+    with get_connection() as conn:
+        return conn.execute("SELECT fetched_at, checked_at, etag FROM market_constituents WHERE market = ?", (market,)).fetchone()
+
+def test_constituents_are_cached_and_revalidated(wikipedia, monkeypatch):
+    assert get_ticketnamesmarket(CAC) == ['AI', 'MC', 'OR']
+    assert get_ticketnamesmarket(CAC) == ['AI', 'MC', 'OR']
+    assert len(wikipedia.requests) == 1 and 'If-None-Match' not in wikipedia.requests[0]
+    fetched_at, checked_at, etag = _stored(CAC)
+    assert etag == '"v1"'
+
+    # Caducada: petición condicional con las cabeceras guardadas; 304 solo renueva la comprobación
+    monkeypatch.setattr(constituents, 'CONSTITUENTS_TTL', -1)
+    assert get_ticketnamesmarket(CAC) == ['AI', 'MC', 'OR']
+    assert wikipedia.requests[-1]['If-None-Match'] == '"v1"'
+    assert wikipedia.requests[-1]['If-Modified-Since'] == 'Mon, 05 Oct 2026 10:00:00 GMT'
+    assert _stored(CAC)[0] == fetched_at and _stored(CAC)[1] > checked_at
+
+    # La página ha cambiado: se guarda la lista nueva con su ETag
+    wikipedia.set_tickers(['AI', 'MC', 'SAN'], '"v2"')
+    assert get_ticketnamesmarket(CAC) == ['AI', 'MC', 'SAN']
+    assert _stored(CAC)[2] == '"v2"'
+
+def test_unreachable_wikipedia_serves_last_list(wikipedia):
+    wikipedia.offline = True
+    assert get_ticketnamesmarket(CAC) == []
+
+    wikipedia.offline = False
+    get_ticketnamesmarket(CAC)
+    wikipedia.offline = True
+    assert get_ticketnamesmarket(CAC, force_refresh=True) == ['AI', 'MC', 'OR']
@@ -0,0 +1,101 @@
+"""Migraciones del esquema y tabla resumen de posiciones."""
+import sqlite3
+
+import pytest
+
+from smartfinancial_core import db
+from smartfinancial_core.db import SCHEMA_MIGRATIONS, configure_db, get_connection
+from smartfinancial_core.portfolio import add_to_portfolio, delete_from_portfolio
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _baseline_db(path):
+    """Base de datos como la creaba la versión original (solo users y portfolio, user_version 0)."""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS portfolio (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            shares INTEGER NOT NULL,
+            purchase_price REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)",
+                     [(1, 'ana', 'hash-ana'), (2, 'luis', 'hash-luis')])
+    conn.executemany("INSERT INTO portfolio (user_id, ticker, shares, purchase_price) VALUES (?, ?, ?, ?)",
+                     [(1, 'AAPL', 10, 100.0), (1, 'AAPL', 5, 130.0), (1, 'MSFT', 2, 300.0), (2, 'AAPL', 1, 150.0)])
+    conn.commit()
+    conn.close()
+
+def _positions(conn):
+    return conn.execute("SELECT user_id, ticker, total_shares, total_cost FROM positions ORDER BY user_id, ticker").fetchall()
+
+def _positions_from_lots(conn):
+    return conn.execute("""
+        SELECT user_id, ticker, SUM(shares), SUM(shares * purchase_price) FROM portfolio
+        GROUP BY user_id, ticker ORDER BY user_id, ticker
+    """).fetchall()
+
+def _add_user(username):
+    with get_connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, 'hash'))
+        conn.commit()
+
+def test_baseline_database_is_upgraded(tmp_path):
+    path = str(tmp_path / 'baseline.db')
+    _baseline_db(path)
+
+    configure_db(path)
+
+    with get_connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(SCHEMA_MIGRATIONS)
+        assert conn.execute("SELECT id, username, password_hash FROM users ORDER BY id").fetchall() == \
+            [(1, 'ana', 'hash-ana'), (2, 'luis', 'hash-luis')]
+        # Los lotes anteriores se conservan sin fecha de compra
+        assert conn.execute("SELECT COUNT(*), COUNT(purchase_date) FROM portfolio").fetchone() == (4, 0)
+        assert _positions(conn) == [(1, 'AAPL', 15, 1650.0), (1, 'MSFT', 2, 600.0), (2, 'AAPL', 1, 150.0)]
+        assert {'currency', 'info_failed_at', 'quote_failed_at'} <= _columns(conn, 'ticker_metadata')
+        for table in ('price_history', 'price_sync', 'market_constituents', 'user_rules'):
+            assert _columns(conn, table)
+
+def test_migrations_are_applied_once(db):
+    # Volver a abrir una base de datos ya migrada no cambia nada
+    configure_db(str(db))
+    with get_connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(SCHEMA_MIGRATIONS)
+
+def test_failed_migration_is_rolled_back(tmp_path, monkeypatch):
+    path = str(tmp_path / 'broken.db')
+    broken = SCHEMA_MIGRATIONS + [["CREATE TABLE extra (id INTEGER)", "SELECT * FROM no_existe"]]
+    monkeypatch.setattr(db, 'SCHEMA_MIGRATIONS', broken)
+
+    with pytest.raises(sqlite3.OperationalError):
+        configure_db(path)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(SCHEMA_MIGRATIONS)
+    assert 'extra' not in {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    conn.close()
+
+def test_positions_follow_portfolio_lots():
+    _add_user('ana')
+    _add_user('luis')
+
+    assert add_to_portfolio('ana', 'aapl', '10', '100', '2026-01-02')[0]
+    assert add_to_portfolio('ana', 'AAPL', '5', '130.5', '2026-02-02')[0]
+    assert add_to_portfolio('ana', 'MSFT', '2', '300')[0]
+    assert add_to_portfolio('luis', 'AAPL', '1', '150')[0]
+    # Una entrada rechazada no toca ninguna de las dos tablas
+    assert not add_to_portfolio('ana', 'AAPL', '-1', '100')[0]
+    with get_connection() as conn:
+        assert _positions(conn) == _positions_from_lots(conn)
+        assert _positions(conn)[0] == (1, 'AAPL', 15, 1652.5)
+
+    assert delete_from_portfolio('ana', 'aapl')[0]
+    with get_connection() as conn:
+        assert _positions(conn) == _positions_from_lots(conn)
+        assert [row[:2] for row in _positions(conn)] == [(1, 'MSFT'), (2, 'AAPL')]
@@ -0,0 +1,53 @@
+"""Divisas: cruces a través de <MONEDA>USD=X y subunidades (peniques)."""
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from smartfinancial_core.db import get_connection
+from smartfinancial_core.fx import convert, fx_pair, get_fx_rates
+
+# Unidades de USD por unidad de cada moneda
+TO_USD = {'EUR': 1.10, 'GBP': 1.25, 'JPY': 0.0068}
+
+@pytest.fixture(autouse=True)
+def fx_quotes():
+    """Tipos de cambio recientes en la caché de cotizaciones (sin descargas)."""
+    now = time.time()
+    with get_connection() as conn:
+        conn.executemany("INSERT INTO ticker_metadata (ticker, price, price_updated, last_access) VALUES (?, ?, ?, ?)",
+                         [(fx_pair(currency), rate, now, now) for currency, rate in TO_USD.items()])
+        conn.commit()
+
+def test_cross_rates_go_through_the_pivot(provider):
+    rates = get_fx_rates(['EUR', 'USD', 'JPY', 'GBP'], base='GBP')
+
+    assert rates['EUR'] == pytest.approx(1.10 / 1.25)
+    assert rates['USD'] == pytest.approx(1 / 1.25)
+    assert rates['JPY'] == pytest.approx(0.0068 / 1.25)
+    assert rates['GBP'] == pytest.approx(1.0)
+    assert provider.reset_calls() == {}
+
+def test_base_equal_to_pivot():
+    rates = get_fx_rates(['EUR', 'USD'], base='USD', fetch=False)
+
+    assert rates == pytest.approx({'EUR': 1.10, 'USD': 1.0})
+
+def test_pence_are_scaled_to_pounds():
+    rates = get_fx_rates(['GBp', 'GBX', 'GBP'], base='EUR', fetch=False)
+
+    assert rates['GBp'] == pytest.approx(0.01 * 1.25 / 1.10)
+    assert rates['GBX'] == pytest.approx(rates['GBp'])
+    assert rates['GBP'] == pytest.approx(1.25 / 1.10)
+
+    # 1.000 peniques son 10 libras
+    values = convert(pd.Series([1000.0, 10.0]), ['GBp', 'GBP'], get_fx_rates(['GBp', 'GBP'], base='GBP'))
+    np.testing.assert_allclose(values, [10.0, 10.0])
+
+def test_missing_rate_is_nan():
+    rates = get_fx_rates(['CHF', 'EUR'], base='EUR', fetch=False)
+
+    assert np.isnan(rates['CHF'])
+    assert rates['EUR'] == pytest.approx(1.0)
+    assert np.isnan(convert(pd.Series([5.0]), ['CHF'], rates)[0])
@@ -0,0 +1,106 @@
+"""Caché de metadatos y cotizaciones: fallos recordados y lecturas sin escrituras."""
+import time
+
+from conftest import FakeProvider
+from smartfinancial_core import market_data
+from smartfinancial_core.db import get_connection
+from smartfinancial_core.providers import set_provider
+
+def _metadata_row(ticker):
+    with get_connection() as conn:
+        return conn.execute("SELECT long_name, info_failed_at, last_access FROM ticker_metadata WHERE ticker = ?",
+                            (ticker,)).fetchone()
+
+def test_failed_info_is_not_refetched_until_ttl(monkeypatch):
+    provider = FakeProvider(missing={'DEAD'})
+    set_provider(provider)
+
+    metadata = market_data.get_ticker_metadata(['DEAD', 'LIVE'])
+    assert metadata['DEAD']['long_name'] is None
+    assert metadata['LIVE']['long_name']
+    assert provider.reset_calls() == {'info': 2}
+
+    market_data.get_ticker_metadata(['DEAD', 'LIVE'])
+    assert provider.reset_calls() == {}
+
+    # Pasado METADATA_FAILURE_TTL se vuelve a pedir
+    monkeypatch.setattr(market_data, 'METADATA_FAILURE_TTL', -1)
+    market_data.get_ticker_metadata(['DEAD', 'LIVE'])
+    assert provider.reset_calls() == {'info': 1}
+
+def test_network_error_is_not_recorded_as_failure(provider, monkeypatch):
+    def offline(ticker):
+        raise ConnectionError("sin red")
+    monkeypatch.setattr(provider, 'info', offline)
+
+    metadata = market_data.get_ticker_metadata(['AAA'])['AAA']
+    assert metadata['long_name'] is None and not metadata['no_data']
+    assert _metadata_row('AAA') is None
+
+def test_cached_reads_do_not_write(provider, monkeypatch):
+    market_data.get_ticker_metadata(['AAA'])
+    _, _, accessed = _metadata_row('AAA')
+
+    writes = []
+    monkeypatch.setattr(market_data, '_evict_metadata', lambda conn: writes.append('evict'))
+    market_data.get_ticker_metadata(['AAA'])
+    market_data.get_ticker_metadata(['AAA'], fetch=False)
+    assert _metadata_row('AAA')[2] == accessed
+    assert writes == []
+    assert provider.reset_calls() == {'info': 1}
+
+def test_old_last_access_is_renewed(provider):
+    market_data.get_ticker_metadata(['AAA'])
+    old = time.time() - market_data.METADATA_ACCESS_RESOLUTION - 10
+    with get_connection() as conn:
+        conn.execute("UPDATE ticker_metadata SET last_access = ? WHERE ticker = 'AAA'", (old,))
+        conn.commit()
+
+    market_data.get_ticker_metadata(['AAA'], fetch=False)
+    assert _metadata_row('AAA')[2] > old
+
+def test_failed_quotes_are_not_refetched_until_ttl(monkeypatch):
+    provider = FakeProvider(missing={'DEAD'})
+    set_provider(provider)
+
+    assert set(market_data.get_latest_quotes(['DEAD', 'LIVE'])) == {'LIVE'}
+    assert provider.reset_calls() == {'recent_closes': 1}
+
+    # Aunque se pida sin caché (max_age=0), el ticker sin precio no se vuelve a descargar
+    market_data.get_latest_quotes(['DEAD'], max_age=0)
+    assert provider.reset_calls() == {}
+
+    monkeypatch.setattr(market_data, 'METADATA_FAILURE_TTL', -1)
+    market_data.get_latest_quotes(['DEAD'])
+    assert provider.reset_calls() == {'recent_closes': 1}
+
+def test_failed_quote_keeps_last_known_price():
+    provider = FakeProvider()
+    set_provider(provider)
+    price = market_data.get_latest_quotes(['AAA'])['AAA']
+
+    provider.missing.add('AAA')
+    provider._series.clear()
+    assert market_data.get_latest_quotes(['AAA'], max_age=0) == {}
+    assert market_data.read_cached_quotes(['AAA'])['AAA'][0] == price
+
+def test_unknown_symbol_has_no_name(provider, monkeypatch):
+    # Lo que devuelve yfinance para un símbolo que no existe
+    monkeypatch.setattr(provider, 'info', lambda ticker: {'trailingPegRatio': None})
+
+    assert market_data.get_ticker_metadata(['ZZZZ'])['ZZZZ'] == \
+        {'long_name': None, 'price': None, 'currency': None, 'quote_type': None, 'no_data': True}
+    long_name, failed_at, _ = _metadata_row('ZZZZ')
+    assert long_name is None and failed_at is not None
+
+def test_short_name_and_quote_type(provider, monkeypatch):
+    infos = {'SHRT': {'shortName': 'Short Co', 'quoteType': 'EQUITY'}, 'TYPE': {'quoteType': 'ETF'}}
+    monkeypatch.setattr(provider, 'info', infos.get)
+
+    metadata = market_data.get_ticker_metadata(['SHRT', 'TYPE'])
+    assert (metadata['SHRT']['long_name'], metadata['SHRT']['quote_type']) == ('Short Co', 'EQUITY')
+    assert (metadata['TYPE']['long_name'], metadata['TYPE']['quote_type']) == (None, 'ETF')
+
+    # Un ticker sin nombre pero con tipo no se vuelve a consultar en cada lectura
+    market_data.get_ticker_metadata(['SHRT', 'TYPE'])
+    assert _metadata_row('TYPE')[1] is None
@@ -0,0 +1,139 @@
+"""Carga de mercados: fallos por ticker, caché compartida y llamadas al proveedor."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import FakeProvider
+from smartfinancial_core import markets, tracing
+from smartfinancial_core.db import get_connection
+from smartfinancial_core.markets import (
+    MARKET_BATCH_SIZE, get_market_tickers, get_stock_data_for_market, load_market_table,
+)
+from smartfinancial_core.providers import set_provider
+
+MARKET = "CAC 40 (París)"
+SESSIONS = 8
+
+def _count_loads(monkeypatch, load):
+    """Sustituye la carga del mercado por `load` contando cuántas veces empieza."""
+    loads = []
+    def counted(market_name, full_universe=False):
+        loads.append(market_name)
+        return load(market_name, full_universe)
+    monkeypatch.setattr(markets, 'iter_stock_data_for_market', counted)
+    return loads
+
+def _waiting_sessions(monkeypatch, sessions):
+    """Evento que se activa cuando `sessions` sesiones esperan a la carga de otra."""
+    waiting, ready = [], threading.Event()
+    count = tracing.count
+    def counted(name, n=1, **labels):
+        if name == 'market_cache' and labels.get('outcome') == 'wait':
+            waiting.append(threading.get_ident())
+            if len(waiting) >= sessions:
+                ready.set()
+        count(name, n, **labels)
+    monkeypatch.setattr(tracing, 'count', counted)
+    return ready
+
+def _load_concurrently(n):
+    """Llama a load_market_table desde `n` sesiones a la vez."""
+    start = threading.Barrier(n)
+    def session(_):
+        start.wait()
+        return load_market_table(MARKET)
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        return list(executor.map(session, range(n)))
+
+def test_warm_load_makes_no_provider_calls():
+    dead = get_market_tickers(MARKET)[0]
+    provider = FakeProvider(missing={dead})
+    set_provider(provider)
+
+    stock_list, failed, _ = get_stock_data_for_market(MARKET)
+    assert [ticker for ticker, _ in failed] == [dead]
+    assert provider.reset_calls()
+
+    warm_list, warm_failed, _ = get_stock_data_for_market(MARKET)
+    assert provider.reset_calls() == {}
+    assert len(warm_list) == len(stock_list)
+    assert warm_failed == failed
+
+def test_batch_without_data_becomes_per_ticker_failures():
+    tickers = get_market_tickers(MARKET)
+    dead_batch = tickers[:MARKET_BATCH_SIZE]
+    set_provider(FakeProvider(missing=dead_batch))
+
+    stock_list, failed, message = get_stock_data_for_market(MARKET)
+    assert [ticker for ticker, _ in failed] == dead_batch
+    assert {stock['ticker'] for stock in stock_list} == set(tickers[MARKET_BATCH_SIZE:])
+    assert message.startswith("✅")
+
+def test_market_without_data_reports_every_ticker():
+    tickers = get_market_tickers(MARKET)
+    set_provider(FakeProvider(missing=tickers))
+
+    stock_list, failed, message = get_stock_data_for_market(MARKET)
+    assert stock_list is None
+    assert [ticker for ticker, _ in failed] == tickers
+    assert message == "❌ No se pudieron obtener datos para este mercado."
+
+    table, failed, message = load_market_table(MARKET)
+    assert table is None
+    assert len(failed) == len(tickers)
+    assert message == "❌ No se pudieron obtener datos para este mercado."
+
+def test_concurrent_sessions_share_one_load(monkeypatch):
+    set_provider(FakeProvider(latency=0.01))
+    ready = _waiting_sessions(monkeypatch, SESSIONS - 1)
+    original = markets.iter_stock_data_for_market
+    def slow_load(market_name, full_universe):
+        ready.wait(5)  # Quien carga no termina hasta que las demás sesiones esperan
+        yield from original(market_name, full_universe)
+    loads = _count_loads(monkeypatch, slow_load)
+
+    results = _load_concurrently(SESSIONS)
+
+    assert loads == [MARKET]
+    assert ready.is_set()
+    assert len({id(table) for table, _, _ in results}) == 1
+    assert all(message.startswith("✅") for _, _, message in results)
+    # La siguiente llamada sale de la caché
+    assert load_market_table(MARKET)[0] is results[0][0]
+    assert loads == [MARKET]
+
+def test_failed_load_is_not_cached(monkeypatch):
+    ready = _waiting_sessions(monkeypatch, SESSIONS - 1)
+    def failing_load(market_name, full_universe):
+        ready.wait(5)
+        raise ConnectionError("sin red")
+        yield
+    loads = _count_loads(monkeypatch, failing_load)
+
+    results = _load_concurrently(SESSIONS)
+
+    # Las sesiones que esperaban reciben el error de la carga, sin cargar otra vez
+    assert loads == [MARKET]
+    assert results == [(None, [], "❌ Error al cargar datos del mercado: sin red")] * SESSIONS
+    assert not markets._MARKET_CACHE['entries']
+
+    # La siguiente llamada vuelve a cargar
+    retries = _count_loads(monkeypatch, lambda market_name, full_universe: iter([]))
+    table, _, message = load_market_table(MARKET)
+    assert retries == [MARKET]
+    assert table is None and message == "❌ No se pudieron obtener datos para este mercado."
+
+def test_quote_download_error_falls_back_to_last_close(provider, monkeypatch):
+    def offline(tickers):
+        raise ConnectionError("sin red")
+    monkeypatch.setattr(provider, 'recent_closes', offline)
+    tickers = get_market_tickers(MARKET)
+
+    table, failed, message = load_market_table(MARKET)
+
+    # Los precios salen del último cierre del histórico
+    assert message.startswith("✅") and failed == []
+    assert sorted(table.index) == sorted(tickers)
+    assert table['current_price'].notna().all()
+    # Un error de red no marca los tickers como sin precio: se vuelven a pedir en la próxima carga
+    with get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM ticker_metadata WHERE quote_failed_at IS NOT NULL").fetchone()[0] == 0
@@ -0,0 +1,243 @@
+"""Portfolio: presupuesto de tiempo del render y vistas con los últimos precios conocidos."""
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from smartfinancial_core import portfolio
+from smartfinancial_core.db import get_connection
+from smartfinancial_core.market_data import get_latest_quotes, get_price_history, read_cached_quotes
+from smartfinancial_core.portfolio import (
+    add_to_portfolio, delete_from_portfolio, load_portfolio, refresh_held_prices, request_price_refresh,
+)
+
+BUDGET = 0.2
+TICKERS = ['AAA', 'BBB']
+
+@pytest.fixture
+def user():
+    with get_connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('ana', 'hash')")
+        conn.commit()
+    for ticker in TICKERS:
+        assert add_to_portfolio('ana', ticker, '10', '100')[0]
+    # Lo que publica el actualizador en segundo plano: cotizaciones e histórico
+    get_latest_quotes(TICKERS)
+    get_price_history(TICKERS, 120)
+    return 'ana'
+
+def _wait_for_calculations():
+    for _ in range(500):
+        with portfolio._PORTFOLIO_SNAPSHOTS['lock']:
+            if not portfolio._PORTFOLIO_SNAPSHOTS['inflight']:
+                return
+        time.sleep(0.01)
+    raise AssertionError("el cálculo en segundo plano no terminó")
+
+@pytest.fixture
+def slow_pricing(monkeypatch):
+    """Valoración completa bloqueada hasta activar el evento devuelto (la vista rápida no espera)."""
+    release = threading.Event()
+    price_positions = portfolio._price_positions
+    def slow(*args, with_history=True, **kwargs):
+        if with_history:
+            release.wait(5)
+        return price_positions(*args, with_history=with_history, **kwargs)
+    monkeypatch.setattr(portfolio, '_price_positions', slow)
+    yield release
+    # Los cálculos pendientes terminan antes de restaurar el proveedor y el actualizador
+    release.set()
+    _wait_for_calculations()
+
+def _load(username):
+    start = time.perf_counter()
+    result = load_portfolio(username, base_currency='USD', budget=BUDGET)
+    return result, time.perf_counter() - start
+
+def test_first_render_shows_stored_prices_within_budget(user, slow_pricing):
+    (portfolio_df, message), elapsed = _load(user)
+
+    assert elapsed < BUDGET + 0.5
+    assert message.startswith("⏳")
+    assert list(portfolio_df['Ticker']) == TICKERS
+    assert portfolio_df['Precio Actual'].notna().all()
+    assert portfolio_df['Precio Promedio (3M)'].isna().all()
+    assert (portfolio_df['Recomendación'] == "N/D").all()
+
+    # Cuando termina, el siguiente render usa el snapshot completo
+    slow_pricing.set()
+    _wait_for_calculations()
+    (portfolio_df, message), _ = _load(user)
+    assert message.startswith("✅")
+    assert portfolio_df['Precio Promedio (3M)'].notna().all()
+
+def test_slow_refresh_serves_stale_snapshot(user, slow_pricing):
+    slow_pricing.set()
+    (fresh_df, _), _ = _load(user)
+    _wait_for_calculations()
+
+    # Precios caducados y un cálculo que no termina a tiempo
+    slow_pricing.clear()
+    with portfolio._PORTFOLIO_SNAPSHOTS['lock']:
+        portfolio._PORTFOLIO_SNAPSHOTS['users'][user]['priced_at'] = None
+    (portfolio_df, message), elapsed = _load(user)
+
+    assert elapsed < BUDGET + 0.5
+    assert message.startswith("⚠️")
+    assert portfolio_df['Desactualizado'].all()
+    np.testing.assert_allclose(portfolio_df['Precio Actual'], fresh_df['Precio Actual'])
+
+def test_empty_portfolio_within_budget(slow_pricing):
+    with get_connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('luis', 'hash')")
+        conn.commit()
+
+    (portfolio_df, message), _ = _load('luis')
+
+    assert portfolio_df.empty
+    assert message.startswith("ℹ️")
+
+@pytest.fixture
+def pricing_calls(monkeypatch):
+    """Lista con una entrada por cada valoración completa del portfolio."""
+    calls = []
+    price_positions = portfolio._price_positions
+    def counted(positions, *args, **kwargs):
+        calls.append(positions['ticker'].tolist())
+        return price_positions(positions, *args, **kwargs)
+    monkeypatch.setattr(portfolio, '_price_positions', counted)
+    return calls
+
+def test_snapshot_is_reused_until_portfolio_changes(user, pricing_calls):
+    first = load_portfolio(user, budget=None)
+    assert load_portfolio(user, budget=None) is first
+    assert pricing_calls == [TICKERS]
+
+    assert add_to_portfolio(user, 'CCC', '1', '10')[0]
+    portfolio_df, _ = load_portfolio(user, budget=None)
+    assert list(portfolio_df['Ticker']) == [*TICKERS, 'CCC']
+
+    assert delete_from_portfolio(user, 'AAA')[0]
+    portfolio_df, _ = load_portfolio(user, budget=None)
+    assert list(portfolio_df['Ticker']) == ['BBB', 'CCC']
+    assert pricing_calls == [TICKERS, [*TICKERS, 'CCC'], ['BBB', 'CCC']]
+
+def test_writes_only_invalidate_their_user(user, pricing_calls):
+    with get_connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('luis', 'hash')")
+        conn.commit()
+    assert add_to_portfolio('luis', 'AAA', '1', '10')[0]
+    load_portfolio(user, budget=None)
+    load_portfolio('luis', budget=None)
+
+    assert add_to_portfolio('luis', 'BBB', '1', '10')[0]
+    load_portfolio(user, budget=None)
+    load_portfolio('luis', budget=None)
+    assert pricing_calls == [TICKERS, ['AAA'], ['AAA', 'BBB']]
+
+def test_changing_base_currency_recomputes(user, pricing_calls):
+    load_portfolio(user, base_currency='USD', budget=None)
+    load_portfolio(user, base_currency='EUR', budget=None)
+    load_portfolio(user, base_currency='EUR', budget=None)
+    assert len(pricing_calls) == 2
+
+def test_refresh_publishes_held_prices(provider):
+    with get_connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('ana', 'hash')")
+        conn.commit()
+    for ticker in TICKERS:
+        assert add_to_portfolio('ana', ticker, '10', '100')[0]
+    first = load_portfolio('ana', budget=None)
+    assert first[1].startswith("⏳")  # Aún sin precios publicados
+    provider.reset_calls()
+
+    refresh_held_prices()
+
+    # Una descarga en bloque de las cotizaciones y otra de los tipos de cambio; snapshots pendientes de recalcular
+    assert provider.calls['recent_closes'] == 2
+    assert set(read_cached_quotes(TICKERS)) == set(TICKERS)
+    assert portfolio._PORTFOLIO_SNAPSHOTS['users']['ana']['priced_at'] is None
+    portfolio_df, message = load_portfolio('ana', budget=None)
+    assert message.startswith("✅")
+    assert portfolio_df['Precio Actual'].notna().all()
+
+@pytest.fixture
+def refresher(monkeypatch):
+    """Actualizador nuevo para el test, con refresh_held_prices sustituida (devuelve la lista de pasadas)."""
+    runs = []
+    def refresh(username=None):
+        runs.append(username)
+        if len(runs) == 2:
+            raise ConnectionError("sin red")
+    monkeypatch.setattr(portfolio, 'refresh_held_prices', refresh)
+    monkeypatch.setattr(portfolio, '_PRICE_REFRESHER', None)
+    return runs
+
+def _wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("el actualizador no respondió")
+
+def test_refresher_starts_once_and_wakes_on_request(refresher):
+    runs = refresher
+    state = portfolio.start_price_refresher()
+    assert portfolio.start_price_refresher() is state
+    _wait_for(lambda: state['last_run'] is not None)
+    assert runs == [None]
+
+    # Una petición lo despierta sin esperar a PRICE_REFRESH_INTERVAL; un fallo se guarda y no lo detiene
+    request_price_refresh()
+    _wait_for(lambda: state['last_error'] is not None)
+    assert state['last_error'] == "sin red"
+    request_price_refresh()
+    _wait_for(lambda: len(runs) == 3 and state['last_error'] is None)
+
+def _store_prices(closes, quotes):
+    """Cierres {ticker: {fecha: cierre}} y cotizaciones de hoy {ticker: precio} en el almacén local."""
+    now = time.time()
+    with get_connection() as conn:
+        conn.executemany("INSERT INTO price_history (ticker, date, close) VALUES (?, ?, ?)",
+                         [(ticker, day.strftime('%Y-%m-%d'), close)
+                          for ticker, series in closes.items() for day, close in series.items()])
+        conn.executemany("INSERT INTO ticker_metadata (ticker, price, price_updated, last_access) VALUES (?, ?, ?, ?)",
+                         [(ticker, price, now, now) for ticker, price in quotes.items()])
+        conn.commit()
+
+def test_value_history_with_buys_mid_window():
+    today = pd.Timestamp(date.today())
+    d = [today - pd.Timedelta(days=n) for n in (5, 4, 3, 2, 1)]
+    _store_prices({'AAA': {d[0]: 10.0, d[1]: 11.0, d[3]: 13.0, d[4]: 14.0},   # sin cierre el día 3
+                   'BBB': {d[1]: 20.0, d[2]: 21.0, d[3]: 22.0, d[4]: 23.0}},  # sin cotización hoy
+                  {'AAA': 15.0})
+    lots = pd.DataFrame({
+        'ticker': ['AAA', 'BBB', 'AAA'],
+        'shares': [2, 1, 1],
+        'purchase_price': [9.0, 19.0, 13.0],
+        'purchase_date': [None, d[2].strftime('%Y-%m-%d'), d[4].strftime('%Y-%m-%d')],  # sin fecha: desde el principio
+    })
+
+    history = portfolio._value_history(lots, 30)
+
+    assert list(history.index) == [*d, today]
+    np.testing.assert_allclose(history['Valor'], [20, 22, 2 * 11 + 21, 2 * 13 + 22, 3 * 14 + 23, 3 * 15 + 23])
+    np.testing.assert_allclose(history['Coste'], [18, 18, 37, 37, 50, 50])
+    np.testing.assert_allclose(history['Ganancia'], history['Valor'] - history['Coste'])
+
+def test_value_history_without_prices_is_nan():
+    today = pd.Timestamp(date.today())
+    yesterday = today - pd.Timedelta(days=1)
+    _store_prices({'AAA': {yesterday: 10.0}}, {})
+    lots = pd.DataFrame({'ticker': ['AAA', 'ZZZ'], 'shares': [1, 1], 'purchase_price': [10.0, 5.0],
+                         'purchase_date': [None, today.strftime('%Y-%m-%d')]})
+
+    history = portfolio._value_history(lots, 30)
+
+    # ZZZ no tiene ningún precio: el día en que ya está en cartera queda vacío en lugar de valorarse a 0
+    np.testing.assert_allclose(history['Valor'], [10.0, np.nan])
+    np.testing.assert_allclose(history['Coste'], [10.0, 15.0])
+    assert portfolio.portfolio_day_change(history) == (None, None)
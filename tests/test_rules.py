@@ -0,0 +1,73 @@
+"""Motor de reglas: las señales vectorizadas coinciden con las condiciones anteriores fila a fila."""
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from smartfinancial_core.portfolio import calculate_recommendation
+from smartfinancial_core.rules import evaluate_rules
+
+def _loop_signals(stock):
+    """Condiciones anteriores de la tabla de mercado (CC, CL) y del portfolio (recomendación)."""
+    price = stock['current_price']
+    compra_corto = False
+    if price is not None:
+        if ((stock['price_3m_max'] is not None and price < (stock['price_3m_min'] + stock['price_3m_max']) / 2)
+                or (stock['price_6m_max'] is not None and price < (stock['price_6m_min'] + stock['price_6m_max']) / 2)):
+            compra_corto = True
+    compra_largo = (price is not None and stock['price_1y_max'] is not None
+                    and price < (stock['price_1y_min'] + stock['price_1y_max']) / 2)
+    if price is None or stock['price_3m_avg'] is None:
+        recommendation = "N/D"
+    elif price < stock['price_3m_avg'] * 0.75:
+        recommendation = "🟢 COMPRAR"
+    elif price > stock['price_3m_avg'] * 1.25:
+        recommendation = "🔴 VENDER"
+    else:
+        recommendation = "🟡 MANTENER"
+    return {'cc': compra_corto, 'cl': compra_largo, 'recommendation': recommendation}
+
+def _stocks():
+    """Precios justo en los umbrales, a ambos lados y sin datos, contra cada referencia."""
+    windows = [(80.0, 120.0), (100.0, 100.0), None]   # (mín, máx); punto medio 100
+    averages = [100.0, 80.0, None]                     # umbrales de 75 / 125 y de 60 / 100
+    prices = [None, 59.0, 60.0, 61.0, 75.0, 99.0, 100.0, 101.0, 125.0, 126.0]
+    stocks = []
+    for price, w3m, w6m, w1y, avg in itertools.product(prices, windows, windows, windows, averages):
+        stock = {'current_price': price, 'price_3m_avg': avg}
+        for key, window in (('3m', w3m), ('6m', w6m), ('1y', w1y)):
+            stock[f'price_{key}_min'], stock[f'price_{key}_max'] = window or (None, None)
+        stocks.append(stock)
+    return stocks
+
+def test_matches_row_by_row_conditions():
+    stocks = _stocks()
+    df = pd.DataFrame(stocks).astype('float64')
+
+    signals = evaluate_rules(df)
+    expected = pd.DataFrame([_loop_signals(stock) for stock in stocks])
+
+    np.testing.assert_array_equal(signals['cc'].to_numpy(), expected['cc'].to_numpy())
+    np.testing.assert_array_equal(signals['cl'].to_numpy(), expected['cl'].to_numpy())
+    np.testing.assert_array_equal(signals['recommendation'].to_numpy(), expected['recommendation'].to_numpy())
+
+def test_boundaries_do_not_trigger_signals():
+    df = pd.DataFrame({
+        'current_price': [75.0, 125.0, 100.0],
+        'price_3m_avg': [100.0, 100.0, 100.0],
+        'price_3m_min': [80.0] * 3, 'price_3m_max': [120.0] * 3,
+        'price_6m_min': [80.0] * 3, 'price_6m_max': [120.0] * 3,
+        'price_1y_min': [80.0] * 3, 'price_1y_max': [120.0] * 3,
+    })
+
+    signals = evaluate_rules(df)
+
+    # Comparaciones estrictas: en el umbral exacto no hay compra ni venta
+    assert list(signals['recommendation']) == ["🟡 MANTENER"] * 3
+    assert list(signals['cc']) == [True, False, False]
+    assert list(signals['cl']) == [True, False, False]
+
+def test_single_value_helper_agrees():
+    for stock in _stocks():
+        expected = _loop_signals(stock)['recommendation']
+        assert calculate_recommendation(stock['price_3m_avg'], stock['current_price']) == expected
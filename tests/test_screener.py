@@ -0,0 +1,75 @@
+"""Screener: filtros por señales y caída desde máximos, orden y carga de varios mercados a la vez."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from smartfinancial_core.markets import get_market_tickers
+from smartfinancial_core.screener import add_buy_signals, load_universe, screen
+
+def _universe():
+    # (mercado, ticker, precio, mín/máx de 3M, 6M y 1A); punto medio 100 salvo donde se indica
+    rows = [
+        ('X', 'AAA', 70.0, (80, 120), (80, 120), (80, 120)),    # CC y CL
+        ('X', 'BBB', 110.0, (80, 120), (80, 120), (80, 120)),   # sin señales
+        ('Y', 'CCC', 100.0, (80, 120), (80, 120), (80, 120)),   # justo en el punto medio: sin señales
+        ('Y', 'DDD', 90.0, (95, 105), (95, 105), (60, 100)),    # CC (medio 100) pero no CL (medio 80)
+        ('Y', 'EEE', np.nan, (80, 120), (80, 120), (80, 120)),  # sin precio: sin señales ni caída
+        ('Y', 'AAA', 70.0, (80, 120), (80, 120), (80, 120)),    # AAA también cotiza en Y
+    ]
+    df = pd.DataFrame({
+        'market': pd.Categorical([row[0] for row in rows], categories=['X', 'Y']),
+        'ticker': [row[1] for row in rows],
+        'current_price': [row[2] for row in rows],
+    })
+    for position, key in ((3, '3m'), (4, '6m'), (5, '1y')):
+        df[f'price_{key}_min'] = [float(row[position][0]) for row in rows]
+        df[f'price_{key}_max'] = [float(row[position][1]) for row in rows]
+    df['price_3m_avg'] = 100.0
+    df['price_1y_avg'] = 100.0
+    return add_buy_signals(df)
+
+def test_signals_and_drawdown():
+    universe = _universe().set_index(['market', 'ticker'])
+
+    assert universe['cc'].to_dict() == {('X', 'AAA'): True, ('X', 'BBB'): False, ('Y', 'CCC'): False,
+                                        ('Y', 'DDD'): True, ('Y', 'EEE'): False, ('Y', 'AAA'): True}
+    assert list(universe['cl']) == [True, False, False, False, False, True]
+    np.testing.assert_allclose(universe['drawdown_1y'], [41.6667, 8.3333, 16.6667, 10.0, np.nan, 41.6667], rtol=1e-4)
+
+def test_filters_and_default_sort():
+    universe = _universe()
+
+    # Por defecto, ordenado por la caída de 1A (de mayor a menor) y sin tickers repetidos
+    assert list(screen(universe)['ticker']) == ['AAA', 'CCC', 'DDD', 'BBB', 'EEE']
+    assert list(screen(universe, unique=False)['market']) == ['X', 'Y', 'Y', 'Y', 'X', 'Y']
+    assert list(screen(universe, cc=True)['ticker']) == ['AAA', 'DDD']
+    assert list(screen(universe, cc=True, cl=False)['ticker']) == ['DDD']
+    assert list(screen(universe, cl=False, markets=['X'])['ticker']) == ['BBB']
+    # La caída mínima es estricta y una caída desconocida nunca pasa el filtro
+    assert list(screen(universe, min_drawdown=10)['ticker']) == ['AAA', 'CCC']
+    assert list(screen(universe, min_drawdown=10, drawdown_window='6m', unique=False, limit=1)['market']) == ['X']
+
+def test_sort_columns():
+    universe = _universe()
+
+    assert list(screen(universe, sort_by='current_price', ascending=True)['ticker']) == ['AAA', 'DDD', 'CCC', 'BBB', 'EEE']
+    assert list(screen(universe, sort_by='ticker', ascending=True, markets=['Y'])['ticker']) == \
+        ['AAA', 'CCC', 'DDD', 'EEE']
+    with pytest.raises(ValueError, match="orden"):
+        screen(universe, sort_by='market_cap')
+    with pytest.raises(ValueError, match="Ventana"):
+        screen(universe, drawdown_window='5y')
+
+def test_load_universe_downloads_shared_tickers_once(provider):
+    markets = ["S&P 500 (USA)", "NASDAQ (USA Tech)"]
+    shared = set(get_market_tickers(markets[0])) & set(get_market_tickers(markets[1]))
+    assert shared
+
+    universe, failed, message = load_universe(markets)
+
+    assert message.startswith("✅") and failed == []
+    for market in markets:
+        assert set(universe.loc[universe['market'] == market, 'ticker']) == set(get_market_tickers(market))
+    # Una sola descarga de histórico por ticker aunque esté en los dos índices
+    calls = provider.reset_calls()
+    assert calls['history'] == len(set(universe['ticker']))
@@ -0,0 +1,72 @@
+"""Estadísticas de ventana: mismos resultados que el cálculo anterior ticker a ticker."""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from smartfinancial_core.stats import _window_start, compute_window_stats
+
+NOW = datetime(2026, 7, 1)
+WINDOWS = {
+    '1m': {'days': 30, 'stats': ('avg', 'min', 'max')},
+    '3m': {'days': 90, 'stats': ('avg', 'min', 'max')},
+    '6m': {'days': 180, 'stats': ('avg', 'min', 'max')},
+    '1y': {'days': 365, 'stats': ('avg', 'min', 'max')},
+    'ytd': {'days': 'ytd', 'stats': ('avg', 'min', 'max')},
+}
+
+def _loop_stats(close, windows, now):
+    """El cálculo anterior: cada ticker por separado, filtrando sus fechas con una máscara por ventana."""
+    rows = {}
+    for ticker in close.columns:
+        data = close[ticker]
+        if data.isna().all():
+            continue
+        row = {}
+        for key, window in windows.items():
+            window_data = data[data.index >= _window_start(window['days'], now)]
+            for stat in window['stats']:
+                value = getattr(window_data, {'avg': 'mean', 'min': 'min', 'max': 'max'}[stat])()
+                row[f'price_{key}_{stat}'] = np.nan if value is None else value
+        rows[ticker] = row
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+def test_hand_computed_windows():
+    dates = pd.to_datetime(['2025-08-01', '2026-01-15', '2026-03-01', '2026-04-15', '2026-06-15', '2026-06-20'])
+    close = pd.DataFrame({
+        'A': [10.0, 20.0, np.nan, 30.0, 40.0, np.nan],     # hueco al final
+        'B': [np.nan, np.nan, np.nan, np.nan, 5.0, np.nan],  # histórico corto
+        'C': [np.nan, np.nan, 7.0, np.nan, np.nan, np.nan],  # sin datos en 1M ni 3M
+        'D': [np.nan] * 6,                                   # sin datos: se descarta
+    }, index=dates)
+
+    stats = compute_window_stats(close, WINDOWS, now=NOW)
+
+    assert list(stats.index) == ['A', 'B', 'C']
+    expected = {
+        'A': {'1m': (40, 40, 40), '3m': (35, 30, 40), '6m': (30, 20, 40), '1y': (25, 10, 40), 'ytd': (30, 20, 40)},
+        'B': {key: (5, 5, 5) for key in WINDOWS},
+        'C': {'1m': (np.nan,) * 3, '3m': (np.nan,) * 3, '6m': (7, 7, 7), '1y': (7, 7, 7), 'ytd': (7, 7, 7)},
+    }
+    for ticker, windows in expected.items():
+        for key, values in windows.items():
+            actual = [stats.loc[ticker, f'price_{key}_{stat}'] for stat in ('avg', 'min', 'max')]
+            np.testing.assert_allclose(actual, values, err_msg=f"{ticker} {key}")
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_matches_per_ticker_loop(seed):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=NOW, periods=300)
+    close = pd.DataFrame(rng.uniform(5, 500, (len(dates), 6)), index=dates, columns=list('ABCDEF'))
+    close.loc[close.index < dates[-15], 'B'] = np.nan            # solo las últimas semanas
+    close.loc[rng.random(len(dates)) < 0.3, 'C'] = np.nan        # huecos repartidos
+    close.loc[close.index > dates[-80], 'D'] = np.nan            # sin datos recientes
+    close['E'] = np.nan                                          # sin datos
+    close = close.astype('float32') if seed == 2 else close      # cargas de mercados en float32
+
+    expected = _loop_stats(close, WINDOWS, NOW)
+    stats = compute_window_stats(close, WINDOWS, now=NOW)
+
+    pd.testing.assert_index_equal(stats.index, expected.index)
+    pd.testing.assert_frame_equal(stats[expected.columns], expected, check_dtype=False, rtol=1e-6)
@@ -0,0 +1,44 @@
+"""Validación de tickers fuera del índice de símbolos."""
+import pytest
+
+from smartfinancial_core.db import get_connection
+from smartfinancial_core.market_data import get_price_history
+from smartfinancial_core.portfolio import add_to_portfolio
+from smartfinancial_core.symbols import lookup_symbol, validate_ticker
+
+@pytest.fixture
+def user():
+    with get_connection() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('ana', 'hash')")
+        conn.commit()
+    return 'ana'
+
+def test_unknown_symbol_is_rejected(provider, monkeypatch, user):
+    monkeypatch.setattr(provider, 'info', lambda ticker: {'trailingPegRatio': None})
+
+    with pytest.raises(ValueError, match="desconocido"):
+        validate_ticker('ZZZZ')
+    success, message = add_to_portfolio(user, 'zzzz', '1', '10')
+    assert not success and "desconocido" in message
+    assert lookup_symbol('ZZZZ') is None
+    with get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM portfolio").fetchone()[0] == 0
+
+def test_symbol_with_quote_type_is_accepted(provider, monkeypatch):
+    monkeypatch.setattr(provider, 'info', lambda ticker: {'quoteType': 'ETF'})
+
+    validate_ticker('ZZZZ')
+    assert lookup_symbol('ZZZZ') == {'ticker': 'ZZZZ', 'name': None, 'markets': ()}
+
+def test_unreachable_yfinance_is_not_an_unknown_symbol(provider, monkeypatch, user):
+    def offline(ticker):
+        raise ConnectionError("sin red")
+    monkeypatch.setattr(provider, 'info', offline)
+
+    success, message = add_to_portfolio(user, 'ZZZZ', '1', '10')
+    assert not success and "No se pudo verificar" in message
+
+    # Con histórico en el almacén local se acepta igualmente
+    get_price_history(['ZZZZ'], 30)
+    validate_ticker('ZZZZ')
+    assert add_to_portfolio(user, 'ZZZZ', '1', '10')[0]